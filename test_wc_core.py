@@ -0,0 +1,524 @@
+"""wc_core 的单元测试，运行: python -m pytest -q"""
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from collections import Counter
+
+import wc_cli
+from wc_core import (CharIndex, CharStats, CodepointSet, DEFAULT_FALLBACK_ENCODINGS, FILE_SUMMARY_FIELDS,
+                     FONTTOOLS_AVAILABLE, NUMPY_AVAILABLE, RunMetrics, ScanRules, SubsetCache, SubsetService,
+                     WatchSession, analyze_path, collect_stats, count_chars, detect_encoding, fetch_subset,
+                     get_index_path, iter_file_blocks, iter_file_chunks, load_binary_report, make_extractor,
+                     make_subset_server, read_and_count_file, read_font_cmaps, subset_font, subset_font_data,
+                     subset_fonts, write_binary_report, write_csv_report, write_json_report, write_text_report)
+
+if FONTTOOLS_AVAILABLE:
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    from fontTools.ttLib import TTFont
+    from fontTools.ttLib.tables._c_m_a_p import CmapSubtable
+
+
+# 随机文本使用的码位：ASCII、控制字符、代理区两侧、CJK、私用区和辅助平面
+RANDOM_CODEPOINTS = (
+    list(range(0x00, 0x80)) +
+    list(range(0x80, 0xA0)) +
+    [0x2028, 0x2029, 0xFEFF, 0xFFFD, 0xFFFE, 0xFFFF] +
+    list(range(0xD7F0, 0xD800)) + list(range(0xE000, 0xE010)) +
+    [0xD800, 0xDBFF, 0xDC00, 0xDFFF] +
+    list(range(0x4E00, 0x4E40)) +
+    [0x10000, 0x1F600, 0x1F64F, 0x20000, 0x2A6DF, 0xE0001, 0xF0000, 0x10FFFD, 0x10FFFF]
+)
+
+
+def random_text(rng, length):
+    return ''.join(chr(rng.choice(RANDOM_CODEPOINTS)) for _ in range(length))
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "需要 NumPy")
+class CountCharsTest(unittest.TestCase):
+    def assert_same_counts(self, text):
+        numpy_result = count_chars(text, use_numpy=True)
+        python_result = count_chars(text, use_numpy=False)
+        self.assertEqual(Counter(dict(numpy_result)), Counter(dict(python_result)))
+        # 两种方式都按首次出现的顺序返回
+        self.assertEqual(numpy_result, python_result)
+
+    def test_random_unicode(self):
+        rng = random.Random(20240601)
+        for length in (0, 1, 2, 17, 1000, 20000):
+            for _ in range(5):
+                self.assert_same_counts(random_text(rng, length))
+
+    def test_edge_codepoints(self):
+        self.assert_same_counts('\x00\x00\U0010ffff𐏿퟿\n\r\t' * 3)
+        self.assert_same_counts('\U0010ffff')
+        self.assert_same_counts('')
+
+
+class CodepointSetTest(unittest.TestCase):
+    def test_operations_match_set(self):
+        rng = random.Random(16)
+        for _ in range(200):
+            left = {rng.randrange(0, 300) for _ in range(rng.randrange(0, 60))}
+            right = {rng.randrange(0, 300) for _ in range(rng.randrange(0, 60))}
+            a, b = CodepointSet(left), CodepointSet(right)
+            self.assertEqual(list((a | b).codes), sorted(left | right))
+            self.assertEqual(list((a - b).codes), sorted(left - right))
+            self.assertEqual(list((a & b).codes), sorted(left & right))
+
+    def test_ranges_round_trip(self):
+        codes = CodepointSet.from_ranges([(0x4E10, 0x4E20), (0x41, 0x43), (0x4E00, 0x4E15), (0x42, 0x42)])
+        self.assertEqual(list(codes.codes), [0x41, 0x42, 0x43] + list(range(0x4E00, 0x4E21)))
+        self.assertEqual(codes.to_ranges(), [(0x41, 0x43), (0x4E00, 0x4E20)])
+        self.assertEqual(CodepointSet.from_ranges(codes.to_ranges()), codes)
+
+
+class ScanRulesTest(unittest.TestCase):
+    def test_include_suffixes(self):
+        rules = ScanRules(include=['*.en.txt', '*.tar.gz', '*.rpy'])
+        self.assertTrue(rules.match_file('a.en.txt', 'a.en.txt'))
+        self.assertTrue(rules.match_file('B.TAR.GZ', 'sub/B.TAR.GZ'))
+        self.assertTrue(rules.match_file('script.rpy', 'game/script.rpy'))
+        self.assertIsNone(rules.match_file('a.ja.txt', 'a.ja.txt'))
+        self.assertIsNone(rules.match_file('a.gz', 'a.gz'))
+
+
+def write_files(root, files):
+    """在 root 中创建 {相对路径: 内容} 中的文本文件。"""
+    for rel_path, content in files.items():
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(content)
+
+
+class ReportTest(unittest.TestCase):
+    FILES = {
+        'a.txt': "你好，世界！Hello world.\n",
+        'sub/b.rpy': 'e "再见，世界。" \U0001F600\n',
+        'c.txt': "世界 world 123\r\n",
+    }
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        write_files(os.path.join(self.root, 'src'), self.FILES)
+        self.stats = collect_stats(os.path.join(self.root, 'src'), lambda message: None)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, writer, name):
+        path = os.path.join(self.root, name)
+        writer(self.stats, path)
+        return path
+
+    def test_binary_round_trip(self):
+        loaded = load_binary_report(self.write(write_binary_report, 'report.wcft'))
+        self.assertEqual(loaded.char_counts, self.stats.char_counts)
+        self.assertEqual(loaded.summary(), self.stats.summary())
+        self.assertEqual(loaded.file_summaries, self.stats.file_summaries)
+
+    def test_json_and_csv_match_text_report(self):
+        with open(self.write(write_text_report, 'report.txt'), encoding='utf-8') as file:
+            text = file.read()
+        totals = dict(zip(FILE_SUMMARY_FIELDS, self.stats.summary()))
+        for label, field in (("总中文字数", 'chinese'), ("总英文字母数", 'english'), ("总空格数", 'space'),
+                             ("总标点符号数", 'punctuation')):
+            self.assertIn(f"{label}: {totals[field]}\n", text)
+        unique_chars = self.stats.codepoints().chars()
+        section = text.split("1. 所有出现过的唯一字符\n" + "=" * 50 + "\n", 1)[1]
+        self.assertTrue(section.startswith(unique_chars + "\n\n"))
+
+        with open(self.write(write_json_report, 'report.json'), encoding='utf-8') as file:
+            data = json.load(file)
+        self.assertEqual(data['totals'], totals)
+        self.assertEqual({row['char']: row['count'] for row in data['chars']}, dict(self.stats.char_counts))
+        self.assertEqual(''.join(row['char'] for row in data['chars']), unique_chars)
+        self.assertEqual({row.pop('path'): [row[field] for field in FILE_SUMMARY_FIELDS] for row in data['files']},
+                         {path: list(summary) for path, summary in self.stats.file_summaries.items()})
+
+        csv_path = self.write(write_csv_report, 'report.csv')
+        with open(csv_path, encoding='utf-8-sig', newline='') as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual({row['char']: int(row['count']) for row in rows}, dict(self.stats.char_counts))
+        self.assertEqual(rows[0]['codepoint'], f"U+{self.stats.codepoints().codes[0]:04X}")
+        with open(os.path.splitext(csv_path)[0] + '.files.csv', encoding='utf-8-sig', newline='') as file:
+            file_rows = list(csv.DictReader(file))
+        self.assertEqual(len(file_rows), len(self.FILES))
+        self.assertEqual(sum(int(row['chinese']) for row in file_rows), totals['chinese'])
+
+
+class CharIndexTest(unittest.TestCase):
+    def test_save_load_round_trip(self):
+        index = CharIndex()
+        index.add_file('/游戏/a.txt', "你好\U0001F600a")
+        index.add_file('b.rpy', "好b")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'index.wcix')
+            index.save(path)
+            loaded = CharIndex.load(path)
+        self.assertEqual(loaded.paths, index.paths)
+        self.assertEqual({code: list(ids) for code, ids in loaded.postings.items()},
+                         {code: list(ids) for code, ids in index.postings.items()})
+        self.assertEqual(loaded.files("好"), ['/游戏/a.txt', 'b.rpy'])
+        self.assertEqual(loaded.files("\U0001F600"), ['/游戏/a.txt'])
+        self.assertEqual(loaded.files("缺"), [])
+
+    def test_report_index_and_query(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source_dir = os.path.join(temp_dir, 'src')
+            write_files(source_dir, {'a.txt': "第一行\n含有龘字的行\n", 'b.txt': "普通的一行\n"})
+            report_path = os.path.join(temp_dir, 'report.txt')
+            analyze_path(source_dir, report_path, lambda message: None,
+                         index_path=get_index_path(report_path))
+            index = CharIndex.load(get_index_path(report_path))
+            self.assertEqual([os.path.basename(path) for path in index.files("龘")], ['a.txt'])
+            self.assertEqual(len(index.files("行")), 2)
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                exit_code = wc_cli.main(['query', report_path, "龘", '-n'])
+            self.assertEqual(exit_code, 0)
+            self.assertIn("2: 含有龘字的行", output.getvalue())
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                wc_cli.main(['query', report_path, '--rare', '1'])
+            self.assertIn("龘 (U+9F98)", output.getvalue())
+            self.assertNotIn("行 (U+884C)", output.getvalue())
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertNotEqual(wc_cli.main(['query', report_path, "缺"]), 0)
+
+
+class ChunkedReadTest(unittest.TestCase):
+    TEXT = "中文ABC\r\n日本語の\U0001F600テキスト\r\r\n，。end\n" * 7
+
+    def check_chunked_counts(self, data, encoding):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'text.txt')
+            with open(path, 'wb') as file:
+                file.write(data)
+            expected = CharStats()
+            with open(path, 'r', encoding=encoding, errors='replace') as file:
+                expected.update(file.read())
+            # 很小的块大小使多字节字符和 CRLF 落在块边界上
+            for chunk_size in (1, 2, 3, 5, 7, 64):
+                stats = CharStats()
+                read_and_count_file(path, stats, encoding=encoding, blocks=iter_file_blocks(path, chunk_size))
+                self.assertEqual(stats.char_counts, expected.char_counts, chunk_size)
+                self.assertEqual(stats.summary(), expected.summary(), chunk_size)
+
+    def test_utf8_split_across_blocks(self):
+        self.check_chunked_counts(self.TEXT.encode('utf-8') + b'\xe4\xb8', 'utf-8')
+
+    def test_gbk_split_across_blocks(self):
+        self.check_chunked_counts(self.TEXT.replace("\U0001F600", "").encode('gbk'), 'gbk')
+
+
+class WatchSessionTest(unittest.TestCase):
+    def assert_matches_full_scan(self, session, source_dir):
+        expected = collect_stats(source_dir, lambda message: None)
+        self.assertEqual(+session.stats.char_counts, +expected.char_counts)
+        self.assertEqual(session.stats.summary(), expected.summary())
+        self.assertEqual(session.stats.file_summaries, expected.file_summaries)
+
+    def test_modify_and_delete(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_files(temp_dir, {'a.txt': "你好，世界！\n", 'sub/b.txt': "再见世界 bye\n"})
+            session = WatchSession(temp_dir)
+            self.assertEqual(session.update(session.snapshot(), lambda message: None), (2, 0))
+            self.assert_matches_full_scan(session, temp_dir)
+
+            # 修改后的内容更短，不再包含“你”“好”，并新增其他字符
+            a_path = os.path.join(temp_dir, 'a.txt')
+            write_files(temp_dir, {'a.txt': "世界和平\n"})
+            st = os.stat(a_path)
+            os.utime(a_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            snapshot = session.snapshot()
+            self.assertTrue(session.has_changes(snapshot))
+            self.assertEqual(session.update(snapshot, lambda message: None), (1, 0))
+            self.assertNotIn("你", +session.stats.char_counts)
+            self.assert_matches_full_scan(session, temp_dir)
+
+            os.remove(os.path.join(temp_dir, 'sub', 'b.txt'))
+            self.assertEqual(session.update(session.snapshot(), lambda message: None), (0, 1))
+            self.assertNotIn("再", +session.stats.char_counts)
+            self.assertEqual(session.stats.char_counts["世"], 1)
+            self.assert_matches_full_scan(session, temp_dir)
+
+
+class DetectEncodingTest(unittest.TestCase):
+    SAMPLES = {
+        'shift_jis': "日本語のテキストです。「こんにちは」と彼は言った。",
+        'gb18030': "这是一个简体中文的测试文本。“你好”，他说。",
+        'big5': "這是一個繁體中文的測試文本。「你好」，他說。",
+    }
+
+    def test_legacy_encodings(self):
+        for encoding, text in self.SAMPLES.items():
+            with self.subTest(encoding=encoding):
+                self.assertEqual(detect_encoding(text.encode(encoding)), encoding)
+
+    def test_utf8_and_bom(self):
+        self.assertEqual(detect_encoding("中文".encode('utf-8')), 'utf-8')
+        self.assertEqual(detect_encoding("中文".encode('utf-16')), 'utf-16')
+
+    def test_auto_scan_of_shift_jis_file(self):
+        text = self.SAMPLES['shift_jis'] * 100
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'script.txt')
+            with open(path, 'wb') as file:
+                file.write(text.encode('shift_jis'))
+            chunks = iter_file_chunks(path, encoding='auto', fallback_encodings=DEFAULT_FALLBACK_ENCODINGS)
+            self.assertEqual(''.join(chunks), text)
+
+
+def extract(kind, text, chunk_size=None):
+    extractor = make_extractor(kind)
+    if chunk_size is None:
+        return extractor.feed(text, final=True)
+    pieces = [extractor.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    pieces.append(extractor.feed('', final=True))
+    return ''.join(pieces)
+
+
+class ExtractorTest(unittest.TestCase):
+    JAVASCRIPT = (
+        'var a = s.replace(/["\']/g, "");\n'
+        'if (x.match(/\'/)) { alert("你好"); }\n'
+        'var r = a / b / c; var t = `欢迎 ${user.name} 来到${ {a: 1}.a }游戏 \\${x}`;\n'
+        'return   /[/"]+/.test(s) ? \'对\' : "错"; // 注释\'\n'
+        'var d = (1) / 2; s = \'结束\';\n'
+    )
+    PYTHON = 'x = f"你好 {name!r:>{width}} {{字}}" + rf\'原\\n{a}\' + "普通\\t"\n'
+
+    def test_javascript_regex_and_template(self):
+        self.assertEqual(extract('javascript', self.JAVASCRIPT), "你好欢迎  来到游戏 ${x}对错结束")
+
+    def test_python_fstring(self):
+        self.assertEqual(extract('python', self.PYTHON), "你好  {字}原\\n普通\t")
+
+    def test_renpy_string_speaker(self):
+        script = (
+            'label start:\n'
+            '    "Eileen" "你好，{b}世界{/b}"\n'
+            "    'Lucy' happy '再见'\n"
+            '    e "对白"\n'
+            '    show eileen "不是对白"\n'
+            '    "旁白"\n'
+        )
+        self.assertEqual(extract('renpy', script), "Eileen你好，世界Lucy再见对白旁白")
+
+    def test_chunked_input(self):
+        for kind, text in (('javascript', self.JAVASCRIPT * 3), ('python', self.PYTHON * 3),
+                           ('javascript', 'x =' + ' ' * 30 + "/'/g; y = '好';")):
+            whole = extract(kind, text)
+            for chunk_size in (1, 2, 3, 5, 7, 13, 31):
+                self.assertEqual(extract(kind, text, chunk_size), whole, (kind, chunk_size))
+
+
+def make_test_font(path, text="ABC中文字"):
+    """生成一个包含 text 中每个字符 (每个字形都是一个方块) 的 TrueType 字体。"""
+    glyph_names = ['.notdef'] + [f"uni{ord(char):04X}" for char in text]
+    pen = TTGlyphPen(None)
+    pen.moveTo((100, 0))
+    pen.lineTo((100, 700))
+    pen.lineTo((500, 700))
+    pen.lineTo((500, 0))
+    pen.closePath()
+    glyph = pen.glyph()
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyph_names)
+    builder.setupCharacterMap({ord(char): f"uni{ord(char):04X}" for char in text})
+    builder.setupGlyf({name: glyph for name in glyph_names})
+    builder.setupHorizontalMetrics({name: (600, 100) for name in glyph_names})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({'familyName': "Test", 'styleName': "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(path)
+
+
+@unittest.skipUnless(FONTTOOLS_AVAILABLE, "需要 fontTools")
+class SubsetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.font_path = os.path.join(self.root, 'bench.ttf')
+        make_test_font(self.font_path)
+        self.cache = SubsetCache(os.path.join(self.root, 'cache'))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_subset(self, name, characters="AB中"):
+        output_dir = os.path.join(self.root, name)
+        os.makedirs(output_dir, exist_ok=True)
+        metrics = RunMetrics()
+        results = subset_fonts([self.font_path], characters, output_dir, lambda message: None,
+                               cache=self.cache, metrics=metrics, skip_unchanged=True)
+        self.assertTrue(results[0][0], results[0][1])
+        return results[0][2], metrics
+
+    def test_shared_cache_keeps_outputs_unchanged(self):
+        # 依次瘦身到 A、B、A：B 命中缓存时更新条目的使用时间，不应使 A 的输出被视为已修改
+        first_output, _ = self.run_subset('a')
+        self.run_subset('b')
+        output, metrics = self.run_subset('a')
+        self.assertEqual(output, first_output)
+        self.assertEqual(metrics.counters['unchanged_fonts'], 1)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'a'))),
+                         ['bench_subset.ttf', 'wc_subset_manifest.json'])
+
+    def test_edited_output_does_not_change_cache(self):
+        output, _ = self.run_subset('a')
+        with open(output, 'rb') as file:
+            original = file.read()
+        # 模拟其他工具原地修改输出文件
+        with open(output, 'r+b') as file:
+            file.write(b'\0' * 16)
+        second_output, metrics = self.run_subset('b')
+        self.assertEqual(metrics.counters['subset_cache_hits'], 1)
+        with open(second_output, 'rb') as file:
+            self.assertEqual(file.read(), original)
+
+    def test_cache_hits_counted_in_both_modes(self):
+        self.run_subset('a')
+        for workers in (1, 2):
+            output_dir = os.path.join(self.root, f'workers{workers}')
+            os.makedirs(output_dir)
+            metrics = RunMetrics()
+            subset_fonts([self.font_path], "AB中", output_dir, lambda message: None, workers, self.cache, metrics)
+            self.assertEqual(metrics.counters['subset_cache_hits'], 1)
+
+
+@unittest.skipUnless(FONTTOOLS_AVAILABLE, "需要 fontTools")
+class SubsetFlavorTest(unittest.TestCase):
+    def test_keep_profile_preserves_woff(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            font_path = os.path.join(temp_dir, 't.ttf')
+            make_test_font(font_path)
+            woff_path = os.path.join(temp_dir, 't.woff')
+            font = TTFont(font_path)
+            font.flavor = 'woff'
+            font.save(woff_path)
+            output_path = os.path.join(temp_dir, 't_subset.woff')
+            success, error_msg = subset_font(woff_path, "AB", temp_dir, lambda message: None, output_path)
+            self.assertTrue(success, error_msg)
+            with open(output_path, 'rb') as file:
+                self.assertEqual(file.read(4), b'wOFF')
+            with open(woff_path, 'rb') as file:
+                self.assertEqual(subset_font_data(file.read(), [ord("A")])[:4], b'wOFF')
+
+
+@unittest.skipUnless(FONTTOOLS_AVAILABLE, "需要 fontTools")
+class CmapParserTest(unittest.TestCase):
+    def check_cmap(self, fmt, encoding, codes):
+        """用只包含一个 fmt 格式子表的字体比较 read_font_cmaps 与 fontTools 的结果。"""
+        rng = random.Random(fmt)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'cmap.ttf')
+            make_test_font(path, "ABCDEFGHIJKLMNOP")
+            font = TTFont(path)
+            glyph_names = font.getGlyphOrder()[1:]
+            subtable = CmapSubtable.newSubtable(fmt)
+            subtable.platformID, subtable.platEncID = encoding
+            subtable.language = 0
+            # 随机分配字形，使格式 4 需要用到 idRangeOffset
+            subtable.cmap = {code: rng.choice(glyph_names) for code in codes}
+            font['cmap'].tables = [subtable]
+            font.save(path)
+            expected = {code for code, name in TTFont(path).getBestCmap().items() if name != '.notdef'}
+            self.assertTrue(expected)
+            self.assertEqual(list(read_font_cmaps(path)[0].codes), sorted(expected))
+
+    def test_format_4(self):
+        rng = random.Random(4)
+        codes = set(range(0x20, 0x7F)) | set(range(0x4E00, 0x4E80)) | {0xFFFD}
+        codes |= {rng.randrange(0x100, 0xD800) for _ in range(300)}
+        self.check_cmap(4, (3, 1), codes)
+
+    def test_format_12(self):
+        rng = random.Random(12)
+        codes = set(range(0x41, 0x5B)) | set(range(0x20000, 0x20100)) | {0x1F600, 0x10FFFD}
+        codes |= {rng.randrange(0x10000, 0x30000) for _ in range(300)}
+        self.check_cmap(12, (3, 10), codes)
+
+    def test_formats_0_and_6(self):
+        self.check_cmap(0, (0, 3), set(range(0x20, 0x7F)) | {0xE9})
+        self.check_cmap(6, (0, 3), set(range(0x3000, 0x3040)))
+
+
+@unittest.skipUnless(FONTTOOLS_AVAILABLE, "需要 fontTools")
+class SubsetServerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        font_path = os.path.join(self.temp_dir.name, 'bench.ttf')
+        make_test_font(font_path)
+        self.server = make_subset_server(SubsetService([font_path]), port=0)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.temp_dir.cleanup()
+
+    def post(self, body):
+        """发送原始请求内容，返回 (状态码, 解析后的 JSON 错误信息)。"""
+        request = urllib.request.Request(self.url + '/subset', data=body,
+                                         headers={'Content-Type': 'application/json'})
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        try:
+            with opener.open(request, timeout=30) as response:
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read().decode('utf-8'))
+
+    def test_cache_miss_then_hit(self):
+        data, hit = fetch_subset(self.url, 'bench.ttf', "AB中")
+        self.assertFalse(hit)
+        self.assertEqual(data[:4], b'\0\1\0\0')
+        cached, hit = fetch_subset(self.url, 'bench.ttf', "中BA")
+        self.assertTrue(hit)
+        self.assertEqual(cached, data)
+
+    def test_unknown_font(self):
+        status, error = self.post(json.dumps({'font': 'missing.ttf', 'chars': "A"}).encode('utf-8'))
+        self.assertEqual(status, 404)
+        self.assertIn('missing.ttf', error['error'])
+
+    def test_bad_requests(self):
+        bad_requests = [
+            {'font': 'bench.ttf', 'chars': "A", 'layout_features': 5},
+            {'font': 'bench.ttf', 'chars': "A", 'layout_features': 'kern'},
+            {'font': 'bench.ttf', 'chars': "A", 'layout_features': ['kern', 1]},
+            {'font': 'bench.ttf', 'chars': ["A"]},
+            {'font': 5, 'chars': "A"},
+            {'font': 'bench.ttf', 'chars': "A", 'profile': ['web']},
+            {'font': 'bench.ttf', 'chars': "A", 'profile': 'tiny'},
+            ['bench.ttf'],
+        ]
+        for request in bad_requests:
+            with self.subTest(request=request):
+                status, error = self.post(json.dumps(request).encode('utf-8'))
+                self.assertEqual(status, 400)
+                self.assertTrue(error['error'])
+        self.assertEqual(self.post(b'{not json')[0], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
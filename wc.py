@@ -1,261 +1,28 @@
 import os
-import sys
+import queue
 import threading
 import webbrowser
-from collections import Counter
+import multiprocessing
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext, simpledialog
+from tkinter import filedialog, messagebox, scrolledtext, simpledialog, ttk
 
-# 字体处理库 fontTools 的可选导入
-try:
-    from fontTools.subset import Subsetter, Options
-    from fontTools.ttLib import TTFont, TTCollection
-    FONTTOOLS_AVAILABLE = True
-except ImportError:
-    FONTTOOLS_AVAILABLE = False
-
-# ==============================================================================
-# 核心分析逻辑 (这部分没有变化)
-# ==============================================================================
-
-def process_file_content(content, stats):
-    """处理文件内容，并更新统计数据字典。"""
-    for char in content:
-        if char == '\0' or char == '\ufffd' or (ord(char) < 32 and char not in '\t\n\r'):
-            continue
-        
-        stats['all_chars'].append(char)
-        
-        if '\u4e00' <= char <= '\u9fff':
-            stats['chinese_chars'].append(char)
-        elif 'a' <= char.lower() <= 'z':
-            stats['english_chars'].append(char)
-        elif char == ' ':
-            stats['space_chars'].append(char)
-        elif not char.isspace():
-            stats['punctuation_chars'].append(char)
-
-def generate_report(stats, output_file_path, log_func):
-    """根据收集到的统计数据生成报告文件。"""
-    log_func(f"\n正在生成报告文件: {output_file_path}")
-    try:
-        # 在写入前确保目录存在
-        output_dir = os.path.dirname(output_file_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        with open(output_file_path, 'w', encoding='utf-8') as output_file:
-            unique_chars = sorted(list(set(stats['all_chars'])))
-            output_file.write("==================================================\n")
-            output_file.write("1. 所有出现过的唯一字符\n")
-            output_file.write("==================================================\n")
-            output_file.write("".join(unique_chars))
-            output_file.write("\n\n")
-
-            top_50_chinese = Counter(stats['chinese_chars']).most_common(50)
-            output_file.write("==================================================\n")
-            output_file.write("2. 出现频率最高的50个中文字\n")
-            output_file.write("==================================================\n")
-            if top_50_chinese:
-                for i, (char, count) in enumerate(top_50_chinese, 1):
-                    output_file.write(f"第 {i:02d} 名: '{char}' - 出现 {count} 次\n")
-            else:
-                output_file.write("在扫描的文件中未找到任何中文字符。\n")
-            output_file.write("\n")
-
-            output_file.write("==================================================\n")
-            output_file.write("3. 总体统计\n")
-            output_file.write("==================================================\n")
-            output_file.write(f"总中文字数: {len(stats['chinese_chars'])}\n")
-            output_file.write(f"总英文字母数: {len(stats['english_chars'])}\n")
-            output_file.write(f"总空格数: {len(stats['space_chars'])}\n")
-            output_file.write(f"总标点符号数: {len(stats['punctuation_chars'])}\n")
-            
-        log_func(f"\n分析完成！统计信息已成功保存到文件：\n{output_file_path}")
-        messagebox.showinfo("成功", f"分析完成！\n报告已保存到:\n{output_file_path}")
-
-    except Exception as e:
-        log_func(f"写入统计文件时发生严重错误: {e}")
-        messagebox.showerror("错误", f"写入报告文件时发生错误:\n{e}")
-
-def analyze_path(target_path, output_file_path, log_func):
-    """分析主函数，log_func用于将信息输出到GUI界面。"""
-    target_extensions = ('.css', '.py', '.rpy', '.txt', '.rpym', '.sh', '.js')
-    # 这是排除列表，也就是黑名单。
-    excluded_files = ['emoji_trie.py']
-    
-    stats = {
-        'all_chars': [], 'chinese_chars': [], 'english_chars': [],
-        'space_chars': [], 'punctuation_chars': []
-    }
-    
-    log_func(f"开始分析: {target_path}")
-    log_func(f"将查找以下类型的文件: {', '.join(target_extensions)}")
-    log_func(f"将排除以下文件: {', '.join(excluded_files)}\n")
-
-    if os.path.isfile(target_path):
-        filename = os.path.basename(target_path)
-        if filename.lower() in excluded_files:
-            log_func(f"  -> 已跳过 (按规则排除): {target_path}")
-        elif filename.lower().endswith(target_extensions):
-            log_func(f"  正在处理文件: {target_path}")
-            try:
-                with open(target_path, 'r', encoding='utf-8', errors='replace') as file:
-                    content = file.read()
-                    process_file_content(content, stats)
-            except Exception as e:
-                log_func(f"    -> 警告: 读取文件 '{target_path}' 时发生错误: {e}，已跳过。")
-        else:
-            log_func(f"  -> 已跳过 (文件类型不匹配): {target_path}")
-
-    elif os.path.isdir(target_path):
-        log_func(f"开始递归扫描目录: {target_path}")
-        for root, dirs, files in os.walk(target_path):
-            for filename in files:
-                file_path = os.path.join(root, filename)
-                if filename.lower() in excluded_files:
-                    log_func(f"  -> 已跳过 (按规则排除): {file_path}")
-                    continue
-
-                if filename.lower().endswith(target_extensions):
-                    log_func(f"  正在处理: {file_path}")
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-                            content = file.read()
-                            process_file_content(content, stats)
-                    except Exception as e:
-                        log_func(f"    -> 警告: 读取文件 '{file_path}' 时发生未知错误: {e}，已跳过。")
-    
-    if not stats['all_chars']:
-        log_func("\n分析完成，但未找到任何可供分析的内容。")
-        messagebox.showwarning("提醒", "分析完成，但未找到任何可供分析的内容。")
-        return
-
-    generate_report(stats, output_file_path, log_func)
-    # 返回统计到的唯一字符集
-    return set(stats['all_chars'])
-
-# ==============================================================================
-# 新增的字体瘦身核心逻辑
-# ==============================================================================
-
-def subset_font(font_path, characters, output_dir, log_func):
-    """
-    使用 fontTools 对字体文件或字体集合进行子集化。
-    """
-    if not FONTTOOLS_AVAILABLE:
-        log_func("错误: 未找到 fontTools 库，无法执行字体瘦身。")
-        log_func("请通过 'pip install fonttools' 命令安装。")
-        return False, "fontTools 库未安装"
-
-    try:
-        font_name = os.path.basename(font_path)
-        name, ext = os.path.splitext(font_name)
-        output_filename = f"{name}_subset{ext}"
-        output_path = os.path.join(output_dir, output_filename)
-
-        # 确保输出文件名唯一
-        counter = 1
-        while os.path.exists(output_path):
-            output_filename = f"{name}_subset_{counter}{ext}"
-            output_path = os.path.join(output_dir, output_filename)
-            counter += 1
-
-        log_func(f"\n正在处理字体文件: {font_name}")
-        log_func(f"  -> 输出至: {output_path}")
-
-        # 定义通用的子集化选项
-        def get_options():
-            options = Options()
-            # 不设置flavor，保持原格式
-            options.layout_features = ['*']
-            options.glyph_names = True
-            options.symbol_cmap = True
-            options.legacy_cmap = True
-            options.notdef_outline = True
-            options.recommended_glyphs = True
-            options.name_legacy = True
-            options.drop_tables = []
-            options.recalc_bounds = True
-            options.recalc_timestamp = True
-            options.canonical_order = True
-            return options
-
-        # 先尝试作为单个字体文件打开（最常见的情况）
-        try:
-            font = TTFont(font_path)
-            # 检查是否实际上是字体集合文件
-            if hasattr(font.reader, 'numFonts') and font.reader.numFonts > 1:
-                # 是字体集合，需要重新用 TTCollection 处理
-                font.close()
-                ttc = TTCollection(font_path)
-                log_func(f"  -> 检测到字体集合，包含 {len(ttc.fonts)} 个字重。将对所有字重进行瘦身。")
-                
-                for i, font in enumerate(ttc.fonts):
-                    log_func(f"    -> 正在处理第 {i+1}/{len(ttc.fonts)} 个字重...")
-                    subsetter = Subsetter(options=get_options())
-                    subsetter.populate(text="".join(characters))
-                    subsetter.subset(font)
-                
-                ttc.save(output_path)
-            else:
-                # 是单个字体文件
-                log_func(f"  -> 作为单个字体文件处理。")
-                subsetter = Subsetter(options=get_options())
-                subsetter.populate(text="".join(characters))
-                subsetter.subset(font)
-                font.save(output_path)
-                
-        except Exception as e:
-            # 如果上述方法都失败，尝试直接用 TTCollection
-            try:
-                log_func(f"  -> 尝试作为字体集合处理...")
-                ttc = TTCollection(font_path)
-                log_func(f"  -> 检测到字体集合，包含 {len(ttc.fonts)} 个字重。")
-                
-                for i, font in enumerate(ttc.fonts):
-                    log_func(f"    -> 正在处理第 {i+1}/{len(ttc.fonts)} 个字重...")
-                    subsetter = Subsetter(options=get_options())
-                    subsetter.populate(text="".join(characters))
-                    subsetter.subset(font)
-                
-                ttc.save(output_path)
-            except Exception as e2:
-                # 两种方法都失败，抛出原始错误
-                raise e
-
-        original_size = os.path.getsize(font_path) / 1024
-        new_size = os.path.getsize(output_path) / 1024
-        log_func(f"  -> 瘦身完成: {original_size:.2f} KB -> {new_size:.2f} KB (节省 {(1 - new_size/original_size) * 100:.2f}%)")
-        
-        return True, None
-    except Exception as e:
-        log_func(f"  -> 错误: 处理字体 '{font_path}' 时发生错误: {e}")
-        return False, str(e)
-
-
-# ==============================================================================
-# 新增的辅助函数
-# ==============================================================================
-def get_default_output_path():
-    """
-    智能获取默认输出路径。
-    优先使用H盘根目录，如果H盘不存在，则使用程序所在目录。
-    """
-    primary_drive = "H:\\"
-    if os.path.exists(primary_drive):
-        return os.path.join(primary_drive, "统计信息.txt")
-    else:
-        # sys.argv[0] 是启动程序的路径 (无论是 .py 还是 .exe)
-        # os.path.abspath 确保我们得到一个绝对路径
-        # os.path.dirname 获取该路径所在的目录
-        exe_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
-        return os.path.join(exe_dir, "统计信息.txt")
+from wc_core import (FONTTOOLS_AVAILABLE, PIPELINE_DEPTH, CodepointSet, RunMetrics, ScanRules, SubsetCache,
+                     FontCoverageIndex, analyze_path_stats, subset_fonts, split_subset_fonts, watch_path,
+                     check_font_coverage, find_rules_file, format_duration, get_charset_path,
+                     get_default_output_path, get_index_path, get_subset_options)
 
 # ==============================================================================
 # GUI 界面部分
 # ==============================================================================
 
+# 日志队列的刷新间隔 (毫秒) 和每次刷新最多处理的消息数
+LOG_POLL_INTERVAL = 100
+LOG_BATCH_SIZE = 2000
+# 日志窗口最多保留的行数，超出后删除最早的行
+LOG_MAX_LINES = 5000
+# 逐文件输出的日志行，折叠时只更新进度摘要
+PER_FILE_LOG_PREFIXES = ("  正在处理", "  -> 已跳过")
+
 class Application(tk.Frame):
     def __init__(self, master=None):
         super().__init__(master)
@@ -268,11 +35,22 @@ class Application(tk.Frame):
         
         # 初始化数据存储变量
         self.font_files = []
-        self.unique_chars = set()
-        self.extra_chars = set()
+        self.unique_chars = CodepointSet()
+        self.extra_chars = CodepointSet()
+        # 分析得到的字符出现次数，用于按频率分片瘦身
+        self.char_counts = {}
+        # 字体覆盖范围索引，同一个字体只解析一次字符映射表
+        self.coverage_index = FontCoverageIndex()
+        # 监视模式运行时用于通知监视线程停止
+        self.watch_stop_event = None
+
+        # 工作线程只向队列中放入日志或界面操作，由主线程定时批量处理
+        self.log_queue = queue.Queue()
+        self.collapsed_log_count = 0
 
         self.create_widgets()
         self.update_button_states()
+        self.after(LOG_POLL_INTERVAL, self.process_log_queue)
 
         if not FONTTOOLS_AVAILABLE:
             self.log("注意: 未找到 'fonttools' 库。字体瘦身功能将被禁用。")
@@ -312,6 +90,30 @@ class Application(tk.Frame):
                                               bg="#607D8B", fg="white", relief=tk.FLAT, cursor="hand2")
         self.browse_target_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.workers_label = tk.Label(path_frame, text="并行进程数:", bg='#f0f0f0')
+        self.workers_label.pack(side=tk.LEFT, padx=(10, 0), pady=5)
+        self.workers_var = tk.IntVar(value=1)
+        self.workers_spinbox = tk.Spinbox(path_frame, from_=1, to=os.cpu_count() or 1,
+                                          textvariable=self.workers_var, width=4, font=('Consolas', 9))
+        self.workers_spinbox.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.use_cache_var = tk.BooleanVar(value=False)
+        self.use_cache_check = tk.Checkbutton(path_frame, text="增量缓存", variable=self.use_cache_var,
+                                              bg='#f0f0f0', activebackground='#f0f0f0')
+        self.use_cache_check.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # 单进程扫描时提前读取后面的文件，适合网络共享盘等读取延迟高的位置
+        self.use_pipeline_var = tk.BooleanVar(value=False)
+        self.use_pipeline_check = tk.Checkbutton(path_frame, text="预读文件", variable=self.use_pipeline_var,
+                                                 bg='#f0f0f0', activebackground='#f0f0f0')
+        self.use_pipeline_check.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # 游戏脚本、网页等源代码只统计字符串和对白，不统计关键字、变量名和注释
+        self.extract_var = tk.BooleanVar(value=False)
+        self.extract_check = tk.Checkbutton(path_frame, text="只统计文本", variable=self.extract_var,
+                                            bg='#f0f0f0', activebackground='#f0f0f0')
+        self.extract_check.pack(side=tk.LEFT, padx=5, pady=5)
+
         # --- 字体文件选择 ---
         font_frame = tk.LabelFrame(self, text="· 字体文件选择 (可选)",
                                    font=('Microsoft YaHei UI', 10, 'bold'),
@@ -332,6 +134,33 @@ class Application(tk.Frame):
                                            command=self.remove_fonts,
                                            bg="#f44336", fg="white", relief=tk.FLAT, cursor="hand2")
         self.remove_font_button.pack(fill=tk.X, pady=2)
+        # 根据字体的字符映射表检查缺少的字符，不需要先瘦身
+        self.coverage_button = tk.Button(font_button_frame, text="🔍 检查覆盖",
+                                         command=self.start_coverage_check,
+                                         bg="#607D8B", fg="white", relief=tk.FLAT, cursor="hand2")
+        self.coverage_button.pack(fill=tk.X, pady=2)
+        self.use_subset_cache_var = tk.BooleanVar(value=False)
+        self.use_subset_cache_check = tk.Checkbutton(font_button_frame, text="瘦身缓存",
+                                                     variable=self.use_subset_cache_var,
+                                                     bg='#f0f0f0', activebackground='#f0f0f0')
+        self.use_subset_cache_check.pack(fill=tk.X, pady=2)
+        self.skip_unchanged_var = tk.BooleanVar(value=False)
+        self.skip_unchanged_check = tk.Checkbutton(font_button_frame, text="跳过未变化",
+                                                   variable=self.skip_unchanged_var,
+                                                   bg='#f0f0f0', activebackground='#f0f0f0')
+        self.skip_unchanged_check.pack(fill=tk.X, pady=2)
+        # 网页字体：输出 WOFF2 (未安装 brotli 时为 WOFF)，并去掉网页用不到的信息
+        self.web_profile_var = tk.BooleanVar(value=False)
+        self.web_profile_check = tk.Checkbutton(font_button_frame, text="网页字体",
+                                                variable=self.web_profile_var,
+                                                bg='#f0f0f0', activebackground='#f0f0f0')
+        self.web_profile_check.pack(fill=tk.X, pady=2)
+        # 按字符出现频率分片，并生成带 unicode-range 的样式表
+        self.split_var = tk.BooleanVar(value=False)
+        self.split_check = tk.Checkbutton(font_button_frame, text="按频率分片",
+                                          variable=self.split_var,
+                                          bg='#f0f0f0', activebackground='#f0f0f0')
+        self.split_check.pack(fill=tk.X, pady=2)
 
         # --- 输出设置 ---
         output_frame = tk.LabelFrame(self, text="· 输出设置",
@@ -353,6 +182,25 @@ class Application(tk.Frame):
                                               bg="#607D8B", fg="white", relief=tk.FLAT, cursor="hand2")
         self.browse_output_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        # 在报告旁保存字符集，并与上次分析的结果比较
+        self.track_charset_var = tk.BooleanVar(value=False)
+        self.track_charset_check = tk.Checkbutton(report_output_frame, text="对比字符集",
+                                                  variable=self.track_charset_var,
+                                                  bg='#f0f0f0', activebackground='#f0f0f0')
+        self.track_charset_check.pack(side=tk.LEFT, padx=5, pady=5)
+        # 字符集只增不减，已经发布的瘦身字体仍然可用
+        self.append_only_var = tk.BooleanVar(value=False)
+        self.append_only_check = tk.Checkbutton(report_output_frame, text="只增不减",
+                                                variable=self.append_only_var,
+                                                bg='#f0f0f0', activebackground='#f0f0f0')
+        self.append_only_check.pack(side=tk.LEFT, padx=5, pady=5)
+        # 在报告旁保存字符来源索引，可以用 wc_cli.py query 查找字符出现在哪些文件中
+        self.build_index_var = tk.BooleanVar(value=False)
+        self.build_index_check = tk.Checkbutton(report_output_frame, text="来源索引",
+                                                variable=self.build_index_var,
+                                                bg='#f0f0f0', activebackground='#f0f0f0')
+        self.build_index_check.pack(side=tk.LEFT, padx=5, pady=5)
+
         # 字体输出
         font_output_frame = tk.Frame(output_frame, bg='#f0f0f0')
         font_output_frame.pack(fill=tk.X, expand=True, pady=2)
@@ -377,6 +225,14 @@ class Application(tk.Frame):
                                       font=('Microsoft YaHei UI', 11, 'bold'),
                                       relief=tk.FLAT, cursor="hand2", height=2)
         self.start_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=3)
+
+        # 监视目标目录，文件变化时自动更新报告，字符集变化时自动瘦身已添加的字体
+        self.watch_button = tk.Button(control_frame, text="👁 监视",
+                                      command=self.toggle_watch,
+                                      bg="#009688", fg="white",
+                                      font=('Microsoft YaHei UI', 10),
+                                      relief=tk.FLAT, cursor="hand2", height=2)
+        self.watch_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=3)
         
         self.extra_chars_button = tk.Button(control_frame, text="✏ 额外字符",
                                             command=self.add_extra_chars,
@@ -385,6 +241,20 @@ class Application(tk.Frame):
                                             relief=tk.FLAT, cursor="hand2", height=2)
         self.extra_chars_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=3)
 
+        self.save_chars_button = tk.Button(control_frame, text="💾 保存字符集",
+                                           command=self.save_charset,
+                                           bg="#607D8B", fg="white",
+                                           font=('Microsoft YaHei UI', 10),
+                                           relief=tk.FLAT, cursor="hand2", height=2)
+        self.save_chars_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=3)
+
+        self.load_chars_button = tk.Button(control_frame, text="📂 载入字符集",
+                                           command=self.load_charset,
+                                           bg="#607D8B", fg="white",
+                                           font=('Microsoft YaHei UI', 10),
+                                           relief=tk.FLAT, cursor="hand2", height=2)
+        self.load_chars_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=3)
+
         self.subset_button = tk.Button(control_frame, text="✂ 字体瘦身",
                                        command=self.start_subsetting,
                                        bg="#2196F3", fg="white",
@@ -407,6 +277,25 @@ class Application(tk.Frame):
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, state='disabled',
                                                   font=('Consolas', 9), bg='#ffffff')
         self.log_text.pack(fill=tk.BOTH, expand=True)
+
+        log_status_frame = tk.Frame(log_frame, bg='#f0f0f0')
+        log_status_frame.pack(fill=tk.X, pady=(3, 0))
+        self.collapse_log_var = tk.BooleanVar(value=True)
+        self.collapse_log_check = tk.Checkbutton(log_status_frame, text="折叠逐文件日志",
+                                                 variable=self.collapse_log_var,
+                                                 bg='#f0f0f0', activebackground='#f0f0f0')
+        self.collapse_log_check.pack(side=tk.LEFT)
+        self.progress_var = tk.StringVar()
+        self.progress_label = tk.Label(log_status_frame, textvariable=self.progress_var, anchor='w',
+                                       font=('Consolas', 9), bg='#f0f0f0', fg='#666')
+        self.progress_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.progress_bar = ttk.Progressbar(log_status_frame, orient=tk.HORIZONTAL, length=160,
+                                            mode='determinate', maximum=100)
+        self.progress_bar.pack(side=tk.RIGHT, padx=(5, 0))
+        self.eta_var = tk.StringVar()
+        self.eta_label = tk.Label(log_status_frame, textvariable=self.eta_var, anchor='e',
+                                  font=('Consolas', 9), bg='#f0f0f0', fg='#666')
+        self.eta_label.pack(side=tk.RIGHT)
         
         # 底部版权信息
         footer_frame = tk.Frame(self, bg='#f0f0f0')
@@ -431,7 +320,9 @@ class Application(tk.Frame):
     def browse_output(self):
         path = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+            # 报告格式根据扩展名判断 (见 wc_core.REPORT_WRITERS)
+            filetypes=[("Text files", "*.txt"), ("JSON files", "*.json"), ("CSV files", "*.csv"),
+                       ("Binary frequency table", "*.wcft"), ("All files", "*.*")],
             initialfile="统计信息.txt",
             title="选择报告保存位置"
         )
@@ -439,25 +330,87 @@ class Application(tk.Frame):
             self.output_path_var.set(path)
 
     def log(self, message):
+        """输出一行日志。可以在任意线程中调用，不会阻塞。"""
+        self.log_queue.put(message)
+
+    def run_in_main(self, func, *args):
+        """让主线程在处理完之前的日志后执行 func(*args)，用于在工作线程中操作界面。"""
+        self.log_queue.put((func, args))
+
+    def process_log_queue(self):
+        """由主线程定时调用，批量写入日志并执行排队的界面操作。"""
+        lines = []
+        latest_file_log = None
+        try:
+            for _ in range(LOG_BATCH_SIZE):
+                item = self.log_queue.get_nowait()
+                if isinstance(item, tuple):
+                    # 界面操作需要在它之前的日志写入之后执行
+                    self.append_log_lines(lines)
+                    lines = []
+                    func, args = item
+                    func(*args)
+                elif self.collapse_log_var.get() and item.startswith(PER_FILE_LOG_PREFIXES):
+                    self.collapsed_log_count += 1
+                    latest_file_log = item.strip()
+                else:
+                    lines.append(item)
+        except queue.Empty:
+            pass
+        finally:
+            self.append_log_lines(lines)
+            if latest_file_log:
+                self.progress_var.set(f"已折叠 {self.collapsed_log_count} 条逐文件日志 | {latest_file_log}")
+            self.after(LOG_POLL_INTERVAL, self.process_log_queue)
+
+    def append_log_lines(self, lines):
+        if not lines:
+            return
         self.log_text.config(state='normal')
-        self.log_text.insert(tk.END, message + '\n')
+        self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+        # 只保留最后 LOG_MAX_LINES 行
+        line_count = int(self.log_text.index('end-1c').split('.')[0])
+        if line_count > LOG_MAX_LINES:
+            self.log_text.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
         self.log_text.see(tk.END)
         self.log_text.config(state='disabled')
-        self.master.update_idletasks()
+
+    def notify(self, level, title, message):
+        """供核心逻辑调用的弹窗提示，level 为 'info'、'warning' 或 'error'。可以在工作线程中调用。"""
+        show = {'info': messagebox.showinfo, 'warning': messagebox.showwarning,
+                'error': messagebox.showerror}[level]
+        self.run_in_main(show, title, message)
+
+    def make_progress_func(self):
+        """返回供 RunMetrics 在工作线程中调用的进度回调。"""
+        return lambda fraction, eta: self.run_in_main(self.update_progress, fraction, eta)
+
+    def update_progress(self, fraction, eta):
+        """更新进度条和预计剩余时间。"""
+        self.progress_bar['value'] = fraction * 100
+        eta_text = f" | 剩余约 {format_duration(eta)}" if eta is not None and fraction < 1 else ""
+        self.eta_var.set(f"{fraction * 100:.0f}%{eta_text}")
 
     def clear_log(self):
         self.log_text.config(state='normal')
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state='disabled')
+        self.collapsed_log_count = 0
+        self.progress_var.set("")
 
     def update_button_states(self):
         """根据当前状态更新按钮的可用性"""
         analysis_done = bool(self.unique_chars)
         fonts_selected = bool(self.font_files)
         
-        # 额外字符按钮：分析完成后可用
+        # 额外字符和保存字符集按钮：分析完成 (或载入字符集) 后可用
         self.extra_chars_button.config(state=tk.NORMAL if analysis_done else tk.DISABLED)
+        self.save_chars_button.config(state=tk.NORMAL if analysis_done else tk.DISABLED)
         
+        # 检查覆盖按钮：有字符集和字体文件后可用，只读取字符映射表，不需要fontTools库
+        has_chars = analysis_done or bool(self.extra_chars)
+        self.coverage_button.config(state=tk.NORMAL if has_chars and fonts_selected else tk.DISABLED)
+
         # 字体瘦身按钮：分析完成、有字体文件、安装了fontTools库后可用
         can_subset = analysis_done and fonts_selected and FONTTOOLS_AVAILABLE
         self.subset_button.config(state=tk.NORMAL if can_subset else tk.DISABLED)
@@ -480,6 +433,8 @@ class Application(tk.Frame):
                     self.font_listbox.insert(tk.END, os.path.basename(file))
             self.log(f"添加了 {len(files)} 个字体文件。")
             self.update_button_states()
+            if self.unique_chars or self.extra_chars:
+                self.start_coverage_check()
 
     def remove_fonts(self):
         """移除选中的字体文件"""
@@ -495,6 +450,28 @@ class Application(tk.Frame):
             self.log(f"移除了字体文件: {os.path.basename(removed_file)}")
         self.update_button_states()
 
+    def start_coverage_check(self):
+        """检查已添加的字体缺少哪些字符 (包括额外字符)，并推荐备用字体。"""
+        combined_chars = self.unique_chars | self.extra_chars
+        if not combined_chars or not self.font_files:
+            return
+        self.coverage_button.config(state='disabled')
+        coverage_thread = threading.Thread(target=self.run_coverage_thread,
+                                           args=(self.font_files[:], combined_chars), daemon=True)
+        coverage_thread.start()
+
+    def run_coverage_thread(self, font_paths, characters):
+        try:
+            self.log(f"\n--- 检查 {len(characters)} 个字符的覆盖情况 ---")
+            entries, fallbacks, missing = check_font_coverage(font_paths, characters, self.log,
+                                                              self.coverage_index)
+            if not missing:
+                self.log("所有字符都可以显示。")
+        except Exception as e:
+            self.log(f"检查覆盖情况时发生错误: {e}")
+        finally:
+            self.run_in_main(self.coverage_button.config, {'state': 'normal'})
+
     def browse_font_output(self):
         """选择字体瘦身后的保存目录"""
         path = filedialog.askdirectory(title="选择瘦身字体的保存目录")
@@ -515,13 +492,13 @@ class Application(tk.Frame):
         text_area.focus_set()
 
         def on_ok():
-            new_chars = set(text_area.get(1.0, tk.END).strip())
+            new_chars = CodepointSet.from_chars(text_area.get(1.0, tk.END).strip())
             if new_chars:
                 original_count = len(self.extra_chars)
-                self.extra_chars.update(new_chars)
+                self.extra_chars = self.extra_chars | new_chars
                 new_added_count = len(self.extra_chars) - original_count
                 self.log(f"添加了 {new_added_count} 个新的唯一额外字符。")
-                total_chars = len(self.unique_chars) + len(self.extra_chars)
+                total_chars = len(self.unique_chars | self.extra_chars)
                 self.log(f"当前总字符集大小: {total_chars}")
             dialog.destroy()
 
@@ -535,6 +512,41 @@ class Application(tk.Frame):
         dialog.grab_set()
         self.master.wait_window(dialog)
 
+    def save_charset(self):
+        """将当前字符集 (分析结果和额外字符) 保存到文件，供以后载入。"""
+        path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+            initialfile="字符集.txt",
+            title="选择字符集保存位置"
+        )
+        if not path:
+            return
+        combined_chars = self.unique_chars | self.extra_chars
+        try:
+            combined_chars.save(path)
+        except OSError as e:
+            messagebox.showerror("错误", f"保存字符集时发生错误:\n{e}")
+            return
+        self.log(f"已保存 {len(combined_chars)} 个字符到: {path}")
+
+    def load_charset(self):
+        """载入之前保存的字符集 (或任意文本文件中出现的字符)，代替分析结果用于字体瘦身。"""
+        path = filedialog.askopenfilename(
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+            title="选择字符集文件"
+        )
+        if not path:
+            return
+        try:
+            self.unique_chars = CodepointSet.load(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"载入字符集时发生错误:\n{e}")
+            return
+        self.char_counts = {}
+        self.log(f"已从 {path} 载入 {len(self.unique_chars)} 个字符。")
+        self.update_button_states()
+
     def start_analysis(self):
         target_path = self.target_path_var.get()
         output_path = self.output_path_var.get()
@@ -543,16 +555,34 @@ class Application(tk.Frame):
             messagebox.showerror("错误", "必须同时指定目标路径和报告保存位置！")
             return
 
+        workers = self.get_workers()
+        if workers is None:
+            return
+
+        self.update_progress(0, None)
         self.start_button.config(state='disabled', text="正在分析...")
+        self.watch_button.config(state='disabled')
+        self.load_chars_button.config(state='disabled')
         self.browse_target_button.config(state='disabled')
         self.browse_output_button.config(state='disabled')
         
         analysis_thread = threading.Thread(
             target=self.run_analysis_thread,
-            args=(target_path, output_path)
+            args=(target_path, output_path, workers, self.use_cache_var.get(),
+                  PIPELINE_DEPTH if self.use_pipeline_var.get() else 0,
+                  self.track_charset_var.get() or self.append_only_var.get(), self.append_only_var.get(),
+                  self.extract_var.get(), self.build_index_var.get())
         )
         analysis_thread.start()
 
+    def get_workers(self):
+        """读取并行进程数，输入无效时提示错误并返回 None。"""
+        try:
+            return max(1, self.workers_var.get())
+        except tk.TclError:
+            messagebox.showerror("错误", "并行进程数必须是正整数！")
+            return None
+
     def start_subsetting(self):
         """开始执行字体瘦身"""
         font_output_dir = self.font_output_path_var.get()
@@ -564,76 +594,215 @@ class Application(tk.Frame):
             messagebox.showerror("错误", "选择的字体保存目录无效或不存在！")
             return
 
-        combined_chars = self.unique_chars.union(self.extra_chars)
+        combined_chars = self.unique_chars | self.extra_chars
         if not combined_chars:
             messagebox.showwarning("提示", "字符集为空，无法进行字体瘦身。")
             return
 
+        workers = self.get_workers()
+        if workers is None:
+            return
+
         self.log(f"\n--- 开始字体瘦身 ---")
         self.log(f"总计 {len(combined_chars)} 个唯一字符将被保留。")
         self.log(f"字体将保存到: {font_output_dir}")
 
         # 禁用按钮
+        self.update_progress(0, None)
         self.start_button.config(state='disabled')
+        self.load_chars_button.config(state='disabled')
         self.subset_button.config(state='disabled', text="正在瘦身...")
         
         subsetting_thread = threading.Thread(
             target=self.run_subsetting_thread,
-            args=(self.font_files[:], combined_chars, font_output_dir) # 传入副本
+            args=(self.font_files[:], combined_chars, font_output_dir, workers,
+                  self.use_subset_cache_var.get(), self.skip_unchanged_var.get(),
+                  'web' if self.web_profile_var.get() else 'keep',
+                  dict(self.char_counts) if self.split_var.get() else None) # 传入副本
         )
         subsetting_thread.start()
 
-    def run_subsetting_thread(self, font_paths, characters, output_dir):
+    def run_subsetting_thread(self, font_paths, characters, output_dir, workers=1, use_cache=False,
+                              skip_unchanged=False, profile='keep', char_counts=None):
         """在单独的线程中执行字体瘦身"""
         try:
-            success_count = 0
-            fail_count = 0
-            for font_path in font_paths:
-                success, error_msg = subset_font(font_path, characters, output_dir, self.log)
-                if success:
-                    success_count += 1
-                else:
-                    fail_count += 1
+            cache = SubsetCache() if use_cache else None
+            if cache:
+                self.log(f"使用瘦身缓存: {cache.cache_dir}")
+            options = get_subset_options(profile) if FONTTOOLS_AVAILABLE else None
+            if options and options.flavor:
+                self.log(f"使用网页字体配置，输出格式: {options.flavor.upper()}")
+            metrics = RunMetrics(self.make_progress_func())
+            if char_counts is not None:
+                # 没有分析结果时 (如载入的字符集) 按码位顺序分片
+                results = split_subset_fonts(font_paths, characters, char_counts, output_dir, self.log,
+                                             workers=workers, cache=cache, metrics=metrics,
+                                             skip_unchanged=skip_unchanged, options=options)
+            else:
+                results = subset_fonts(font_paths, characters, output_dir, self.log, workers, cache, metrics,
+                                       skip_unchanged, options)
+            metrics.log_summary(self.log)
+            success_count = sum(1 for success, error_msg, output_path in results if success)
+            fail_count = len(results) - success_count
             
             self.log(f"\n--- 字体瘦身完成 ---")
             self.log(f"成功: {success_count} 个, 失败: {fail_count} 个。")
-            messagebox.showinfo("完成", f"字体瘦身处理完成！\n成功: {success_count}, 失败: {fail_count}")
+            self.notify('info', "完成", f"字体瘦身处理完成！\n成功: {success_count}, 失败: {fail_count}")
 
         except Exception as e:
             self.log(f"字体瘦身过程中发生严重错误: {e}")
-            messagebox.showerror("严重错误", f"字体瘦身过程中断:\n{e}")
+            self.notify('error', "严重错误", f"字体瘦身过程中断:\n{e}")
         finally:
             # 恢复按钮状态
-            self.start_button.config(state='normal')
-            self.subset_button.config(state='normal', text="字体瘦身")
-            self.update_button_states()
+            self.run_in_main(self.finish_subsetting)
 
-    def run_analysis_thread(self, target_path, output_path):
+    def finish_subsetting(self):
+        self.start_button.config(state='normal')
+        self.load_chars_button.config(state='normal')
+        self.subset_button.config(state='normal', text="字体瘦身")
+        self.update_button_states()
+
+    def run_analysis_thread(self, target_path, output_path, workers=1, use_cache=False, pipeline_depth=0,
+                            track_charset=False, append_only=False, extract=False, build_index=False):
         try:
-            # 清空上一次的分析结果
-            self.unique_chars.clear()
+            # 清空上一次的分析结果 (界面状态只在主线程中修改)
+            self.run_in_main(self.set_analysis_result, CodepointSet(), {})
             self.log("清空旧的字符集统计。")
 
-            # analyze_path 现在会返回字符集
-            result_chars = analyze_path(target_path, output_path, self.log)
+            # analyze_path_stats 会返回字符集和统计数据
+            # 扫描目录或程序目录中有规则文件时使用其中的规则
+            rules = None
+            rules_path = find_rules_file(target_path)
+            if rules_path:
+                self.log(f"使用规则文件: {rules_path}")
+                rules = ScanRules.load(rules_path)
+            if extract:
+                rules = ScanRules.from_dict({**(rules or ScanRules()).to_dict(), 'extract': True})
+
+            metrics = RunMetrics(self.make_progress_func())
+            result_chars, stats = analyze_path_stats(
+                target_path, output_path, self.log, workers, use_cache, notify_func=self.notify, metrics=metrics,
+                rules=rules, pipeline_depth=pipeline_depth,
+                charset_path=get_charset_path(output_path) if track_charset else None, append_only=append_only,
+                index_path=get_index_path(output_path) if build_index else None)
+            metrics.log_summary(self.log)
             if result_chars:
-                self.unique_chars = result_chars
-                self.log(f"\n分析完成，共找到 {len(self.unique_chars)} 个唯一字符。")
+                self.run_in_main(self.set_analysis_result, result_chars, stats.char_counts)
+                self.log(f"\n分析完成，共找到 {len(result_chars)} 个唯一字符。")
                 # 自动设置字体输出目录为报告所在目录
                 report_dir = os.path.dirname(output_path)
-                self.font_output_path_var.set(report_dir)
+                self.run_in_main(self.font_output_path_var.set, report_dir)
                 self.log(f"默认字体输出目录已设置为: {report_dir}")
 
         except Exception as e:
             self.log(f"发生了一个未预料的严重错误: {e}")
-            messagebox.showerror("严重错误", f"分析过程中断:\n{e}")
+            self.notify('error', "严重错误", f"分析过程中断:\n{e}")
         finally:
-            self.start_button.config(state='normal', text="开始分析")
-            self.browse_target_button.config(state='normal')
-            self.browse_output_button.config(state='normal')
-            self.update_button_states()
+            self.run_in_main(self.finish_analysis)
+
+    def toggle_watch(self):
+        """开始或停止监视模式。"""
+        if self.watch_stop_event:
+            self.watch_stop_event.set()
+            self.watch_button.config(state='disabled', text="正在停止...")
+            return
+
+        target_path = self.target_path_var.get()
+        output_path = self.output_path_var.get()
+        if not target_path or not output_path:
+            messagebox.showerror("错误", "必须同时指定目标路径和报告保存位置！")
+            return
+        workers = self.get_workers()
+        if workers is None:
+            return
+        # 字体保存目录有效时，字符集变化后自动瘦身
+        font_output_dir = self.font_output_path_var.get()
+        font_paths = []
+        if self.font_files and FONTTOOLS_AVAILABLE:
+            if os.path.isdir(font_output_dir):
+                font_paths = self.font_files[:]
+            else:
+                self.log("注意: 字体保存目录无效或不存在，监视时不会自动瘦身字体。")
+
+        self.watch_stop_event = threading.Event()
+        self.watch_button.config(text="■ 停止监视")
+        for button in (self.start_button, self.load_chars_button, self.subset_button,
+                       self.browse_target_button, self.browse_output_button):
+            button.config(state='disabled')
+
+        watch_thread = threading.Thread(
+            target=self.run_watch_thread,
+            args=(target_path, output_path, self.watch_stop_event, workers, font_paths, font_output_dir,
+                  'web' if self.web_profile_var.get() else 'keep', self.use_subset_cache_var.get(),
+                  self.track_charset_var.get() or self.append_only_var.get(), self.append_only_var.get(),
+                  self.extract_var.get(), self.extra_chars),
+            daemon=True
+        )
+        watch_thread.start()
+
+    def run_watch_thread(self, target_path, output_path, stop_event, workers=1, font_paths=(), font_output_dir=None,
+                         profile='keep', use_cache=False, track_charset=False, append_only=False, extract=False,
+                         extra_chars=CodepointSet()):
+        """
+        在单独的线程中运行监视模式，直到 stop_event 被设置。
+        界面中的选项和额外字符 extra_chars 在开始监视时读取，监视期间的修改在下次开始监视时生效。
+        """
+        try:
+            rules = None
+            rules_path = find_rules_file(target_path)
+            if rules_path:
+                self.log(f"使用规则文件: {rules_path}")
+                rules = ScanRules.load(rules_path)
+            if extract:
+                rules = ScanRules.from_dict({**(rules or ScanRules()).to_dict(), 'extract': True})
+            cache = SubsetCache() if font_paths and use_cache else None
+            options = get_subset_options(profile) if font_paths else None
+
+            def on_change(characters, stats):
+                self.run_in_main(self.set_analysis_result, characters, dict(stats.char_counts))
+                if not font_paths:
+                    return
+                combined_chars = characters | extra_chars
+                self.log(f"\n--- 字符集已变化，重新瘦身字体 ({len(combined_chars)} 个字符) ---")
+                results = subset_fonts(font_paths, combined_chars, font_output_dir, self.log, workers, cache,
+                                       RunMetrics(), True, options)
+                success_count = sum(1 for success, error_msg, font_output_path in results if success)
+                self.log(f"成功: {success_count} 个, 失败: {len(results) - success_count} 个。")
+
+            watch_path(target_path, output_path, self.log, rules, workers, on_change, stop_event,
+                       charset_path=get_charset_path(output_path) if track_charset else None,
+                       append_only=append_only)
+        except Exception as e:
+            self.log(f"监视过程中发生严重错误: {e}")
+            self.notify('error', "严重错误", f"监视过程中断:\n{e}")
+        finally:
+            self.run_in_main(self.finish_watch)
+
+    def set_analysis_result(self, characters, char_counts):
+        """在主线程中更新分析或监视得到的字符集，并刷新按钮状态。"""
+        self.unique_chars = characters
+        self.char_counts = char_counts
+        self.update_button_states()
+        if self.watch_stop_event:
+            # 监视期间字体由监视线程自动瘦身
+            self.subset_button.config(state='disabled')
+
+    def finish_watch(self):
+        self.watch_stop_event = None
+        self.watch_button.config(state='normal', text="👁 监视")
+        self.finish_analysis()
+
+    def finish_analysis(self):
+        self.start_button.config(state='normal', text="开始分析")
+        self.watch_button.config(state='normal')
+        self.load_chars_button.config(state='normal')
+        self.browse_target_button.config(state='normal')
+        self.browse_output_button.config(state='normal')
+        self.update_button_states()
 
 if __name__ == "__main__":
+    # 打包为 exe 后，多进程扫描需要此调用才能正常启动子进程
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = Application(master=root)
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,323 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import wc_core
+from wc_core import FONTTOOLS_AVAILABLE, NUMPY_AVAILABLE, CharStats, collect_stats, subset_font
+
+# 峰值内存统计只在类 Unix 系统上可用
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ==============================================================================
+# 性能基准测试 (分析与字体瘦身的热点路径)
+# 语料和测试字体全部在本地生成，不需要联网。
+# ==============================================================================
+
+# 语料配置: 名称 -> (文件数, 占总大小的比例, 中文比例)
+CORPUS_PROFILES = {
+    'cjk': (20, 1.0, 0.9),
+    'latin': (20, 1.0, 0.02),
+    'mixed': (20, 1.0, 0.5),
+    'many_small': (2000, 0.25, 0.5),
+    'few_huge': (2, 1.0, 0.5),
+}
+
+# 生成字体时包含的中文字数
+FONT_CJK_GLYPHS = 8000
+
+LATIN_WORDS = ("the", "of", "and", "to", "in", "is", "you", "that", "it", "he", "was", "for",
+               "on", "are", "as", "with", "his", "they", "at", "be", "this", "have", "from")
+CJK_PUNCTUATION = "，。、！？：；“”"
+
+def generate_text(rng, size, cjk_ratio):
+    """生成大约 size 个字符的文本，常用字按近似 Zipf 分布出现。"""
+    cjk_pool = [chr(0x4e00 + i) for i in range(6000)]
+    cjk_weights = [1.0 / (i + 1) for i in range(len(cjk_pool))]
+    parts = []
+    length = 0
+    while length < size:
+        if rng.random() < cjk_ratio:
+            sentence = "".join(rng.choices(cjk_pool, cjk_weights, k=rng.randint(5, 30)))
+            sentence += rng.choice(CJK_PUNCTUATION)
+        else:
+            sentence = " ".join(rng.choices(LATIN_WORDS, k=rng.randint(3, 15))).capitalize() + ". "
+        if rng.random() < 0.1:
+            sentence += "\n"
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)
+
+def generate_corpus(root, name, total_size, seed):
+    """在 root/name 下生成语料目录，返回 (目录, 文件数, 字节数)。"""
+    file_count, size_ratio, cjk_ratio = CORPUS_PROFILES[name]
+    rng = random.Random(f"{seed}-{name}")
+    corpus_dir = os.path.join(root, name)
+    os.makedirs(corpus_dir, exist_ok=True)
+    per_file = max(1, int(total_size * size_ratio / file_count))
+    extensions = ('.rpy', '.py', '.js', '.txt')
+    # 同一批文件内容重复使用，避免生成大量文件时耗时过长
+    samples = [generate_text(rng, per_file, cjk_ratio) for _ in range(min(file_count, 8))]
+    total_bytes = 0
+    for i in range(file_count):
+        sub_dir = os.path.join(corpus_dir, f"part{i % 10}")
+        os.makedirs(sub_dir, exist_ok=True)
+        path = os.path.join(sub_dir, f"file{i}{extensions[i % len(extensions)]}")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(samples[i % len(samples)])
+        total_bytes += os.path.getsize(path)
+    return corpus_dir, file_count, total_bytes
+
+def generate_font(path, codepoints, family):
+    """用 fontTools 生成一个每个字符对应一个简单轮廓的 TrueType 字体。"""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    glyph_names = ['.notdef'] + [f"uni{code:04X}" for code in codepoints]
+    glyphs = {}
+    for i, glyph_name in enumerate(glyph_names):
+        pen = TTGlyphPen(None)
+        # 让每个字形的轮廓略有不同，避免字形数据完全相同
+        offset = i % 97
+        pen.moveTo((50, 0))
+        pen.lineTo((50 + offset, 700))
+        pen.lineTo((900, 700 - offset))
+        pen.lineTo((900, 0))
+        pen.closePath()
+        glyphs[glyph_name] = pen.glyph()
+
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyph_names)
+    builder.setupCharacterMap({code: f"uni{code:04X}" for code in codepoints})
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics({glyph_name: (1000, 50) for glyph_name in glyph_names})
+    builder.setupHorizontalHeader(ascent=880, descent=-120)
+    builder.setupNameTable({'familyName': family, 'styleName': 'Regular'})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(path)
+
+def generate_fonts(root):
+    """生成测试字体：一个单独的 TTF 和一个包含 4 个字重的 TTC。"""
+    from fontTools.ttLib import TTFont, TTCollection
+
+    font_dir = os.path.join(root, 'fonts')
+    os.makedirs(font_dir, exist_ok=True)
+    codepoints = list(range(0x20, 0x7f)) + list(range(0x4e00, 0x4e00 + FONT_CJK_GLYPHS))
+    single_path = os.path.join(font_dir, 'bench.ttf')
+    generate_font(single_path, codepoints, 'Bench')
+
+    face_paths = []
+    for i in range(4):
+        face_path = os.path.join(font_dir, f'face{i}.ttf')
+        generate_font(face_path, codepoints[:len(codepoints) - i * 500], f'BenchFace{i}')
+        face_paths.append(face_path)
+    collection = TTCollection()
+    collection.fonts = [TTFont(face_path) for face_path in face_paths]
+    collection_path = os.path.join(font_dir, 'bench.ttc')
+    collection.save(collection_path)
+    return [single_path, collection_path]
+
+def get_peak_rss_kb():
+    """返回当前进程 (含子进程) 的峰值内存 (KB)，不支持时返回 None。"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS 的单位是字节，Linux 是 KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def make_delayed_reader(delay):
+    """
+    返回每次读取前都等待 delay 秒的 iter_file_blocks，用于在本地模拟网络共享盘等高延迟的文件系统。
+    打开文件和读取每一块都会等待一次。
+    """
+    read_blocks = wc_core.iter_file_blocks
+
+    def iter_delayed_blocks(file_path, chunk_size=wc_core.READ_CHUNK_SIZE):
+        time.sleep(delay)
+        for block in read_blocks(file_path, chunk_size):
+            time.sleep(delay)
+            yield block
+    return iter_delayed_blocks
+
+def run_analysis_case(corpus_dir, workers, use_numpy, pipeline_depth=0, read_delay=0):
+    """在独立进程中运行一次分析，返回耗时、峰值内存和唯一字符数。"""
+    if not use_numpy:
+        wc_core.NUMPY_AVAILABLE = False
+    if read_delay:
+        wc_core.iter_file_blocks = make_delayed_reader(read_delay)
+    start = time.perf_counter()
+    stats = collect_stats(corpus_dir, lambda message: None, workers, pipeline_depth=pipeline_depth)
+    elapsed = time.perf_counter() - start
+    return elapsed, get_peak_rss_kb(), len(stats.char_counts)
+
+def run_subset_case(font_path, characters, output_dir):
+    """在独立进程中瘦身一个字体，返回耗时、峰值内存和输出大小。"""
+    output_path = os.path.join(output_dir, os.path.basename(font_path))
+    start = time.perf_counter()
+    success, error_msg = subset_font(font_path, characters, output_dir, lambda message: None, output_path)
+    elapsed = time.perf_counter() - start
+    if not success:
+        raise RuntimeError(error_msg)
+    size = os.path.getsize(output_path)
+    os.remove(output_path)
+    return elapsed, get_peak_rss_kb(), size
+
+def run_isolated(func, *args):
+    """每个用例都在新进程中运行，这样峰值内存互不影响。"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(func, *args).result()
+
+def best_of(repeat, func, *args):
+    """重复运行并取耗时最短的一次。"""
+    results = [run_isolated(func, *args) for _ in range(repeat)]
+    return min(results, key=lambda result: result[0])
+
+def run_benchmarks(args, log_func):
+    """生成语料和字体并运行所有用例，返回结果列表。"""
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='wc_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        total_size = int(args.size_mb * 1024 * 1024)
+        worker_counts = sorted({1, args.workers})
+        numpy_modes = [True, False] if NUMPY_AVAILABLE else [False]
+        cjk_chars = set()
+
+        # (进程数, 预读文件数)，预读只在单进程时生效
+        scan_modes = [(workers, 0) for workers in worker_counts]
+        if args.pipeline_depth:
+            scan_modes.insert(1, (1, args.pipeline_depth))
+        read_delay = args.read_delay / 1000
+
+        for name in args.corpora:
+            log_func(f"生成语料: {name}")
+            corpus_dir, file_count, total_bytes = generate_corpus(work_dir, name, total_size, args.seed)
+            for workers, pipeline_depth in scan_modes:
+                for use_numpy in numpy_modes:
+                    case_name = f"analysis/{name}/w{workers}/{'numpy' if use_numpy else 'python'}"
+                    if pipeline_depth:
+                        case_name += f"/pipeline{pipeline_depth}"
+                    if read_delay:
+                        case_name += f"/delay{args.read_delay:g}ms"
+                    elapsed, peak_rss, unique_count = best_of(args.repeat, run_analysis_case, corpus_dir,
+                                                              workers, use_numpy, pipeline_depth, read_delay)
+                    result = {
+                        'name': case_name, 'kind': 'analysis', 'corpus': name, 'workers': workers,
+                        'pipeline_depth': pipeline_depth, 'read_delay_ms': args.read_delay,
+                        'numpy': use_numpy, 'files': file_count, 'bytes': total_bytes,
+                        'seconds': round(elapsed, 4),
+                        'mb_per_s': round(total_bytes / 1024 / 1024 / elapsed, 2),
+                        'files_per_s': round(file_count / elapsed, 1),
+                        'peak_rss_kb': peak_rss, 'unique_chars': unique_count,
+                    }
+                    results.append(result)
+                    log_func(f"  {case_name}: {result['mb_per_s']} MB/s, {result['files_per_s']} 文件/s, "
+                             f"峰值内存 {peak_rss} KB")
+            if name == 'cjk' or not cjk_chars:
+                stats = CharStats()
+                for root, dirs, files in os.walk(corpus_dir):
+                    for filename in files:
+                        wc_core.read_and_count_file(os.path.join(root, filename), stats)
+                cjk_chars = stats.unique_chars()
+
+        if not FONTTOOLS_AVAILABLE:
+            log_func("未找到 fontTools 库，跳过字体瘦身基准测试。")
+        elif args.skip_fonts:
+            log_func("已跳过字体瘦身基准测试。")
+        else:
+            log_func("生成测试字体")
+            output_dir = os.path.join(work_dir, 'subset_output')
+            os.makedirs(output_dir, exist_ok=True)
+            for font_path in generate_fonts(work_dir):
+                case_name = f"subset/{os.path.basename(font_path)}"
+                elapsed, peak_rss, output_size = best_of(args.repeat, run_subset_case,
+                                                         font_path, cjk_chars, output_dir)
+                result = {
+                    'name': case_name, 'kind': 'subset', 'font': os.path.basename(font_path),
+                    'faces': max(1, wc_core.get_collection_size(font_path)),
+                    'characters': len(cjk_chars), 'font_bytes': os.path.getsize(font_path),
+                    'output_bytes': output_size, 'seconds': round(elapsed, 4), 'peak_rss_kb': peak_rss,
+                }
+                results.append(result)
+                log_func(f"  {case_name}: {elapsed:.3f} 秒, 峰值内存 {peak_rss} KB")
+    finally:
+        if not args.work_dir and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def get_environment():
+    """记录运行环境，便于比较不同机器上的结果。"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': NUMPY_AVAILABLE,
+        'fonttools': wc_core.FONTTOOLS_VERSION if FONTTOOLS_AVAILABLE else None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def compare_results(baseline_path, results, threshold):
+    """与基准结果比较耗时，返回变慢超过 threshold 的用例数。"""
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = {result['name']: result for result in json.load(file)['results']}
+    regressions = 0
+    print(f"\n与 {baseline_path} 比较 (耗时比值 = 本次 / 基准):")
+    for result in results:
+        old = baseline.get(result['name'])
+        if not old:
+            print(f"  {result['name']}: 基准中没有该用例")
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  <-- 变慢"
+            regressions += 1
+        print(f"  {result['name']}: {old['seconds']:.4f} -> {result['seconds']:.4f} 秒 ({ratio:.2f}x){mark}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="wc_bench.py", description="字符统计与字体瘦身的性能基准测试")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="结果保存位置 (JSON)")
+    parser.add_argument('--size-mb', type=float, default=20, help="每个语料的大致大小 (MB)")
+    parser.add_argument('--corpora', nargs='+', choices=sorted(CORPUS_PROFILES), default=list(CORPUS_PROFILES),
+                        help="要测试的语料类型")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="并行扫描用例的进程数 (另外总会测试单进程)")
+    parser.add_argument('--pipeline-depth', type=int, default=wc_core.PIPELINE_DEPTH,
+                        help="额外测试单进程流水线读取时的预读文件数，0 表示不测试")
+    parser.add_argument('--read-delay', type=float, default=0, metavar='MS',
+                        help="每次打开文件和读取每一块前等待的毫秒数，用于模拟高延迟的文件系统")
+    parser.add_argument('--repeat', type=int, default=3, help="每个用例重复次数，取最快的一次")
+    parser.add_argument('--seed', type=int, default=0, help="生成语料的随机种子")
+    parser.add_argument('--skip-fonts', action='store_true', help="跳过字体瘦身基准测试")
+    parser.add_argument('--work-dir', help="生成语料和字体的目录 (默认使用临时目录并在结束后删除)")
+    parser.add_argument('--keep', action='store_true', help="保留临时目录")
+    parser.add_argument('--compare', help="与之前保存的结果文件比较")
+    parser.add_argument('--threshold', type=float, default=0.1, help="判定为变慢的耗时增加比例 (默认 0.1)")
+    args = parser.parse_args(argv)
+
+    log_func = lambda message: print(message, file=sys.stderr, flush=True)
+    results = run_benchmarks(args, log_func)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({'environment': get_environment(), 'results': results}, file, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {args.output}")
+
+    if args.compare:
+        return 1 if compare_results(args.compare, results, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
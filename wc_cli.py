@@ -0,0 +1,602 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+from wc_core import (FONTTOOLS_AVAILABLE, DEFAULT_EXCLUDED_DIRS, DEFAULT_SUBSET_CACHE_SIZE, PIPELINE_DEPTH,
+                     SUBSET_PROFILES, WEB_FLAVORS, DEFAULT_SPLIT_TIERS, DEFAULT_TOP_N, REPORT_WRITERS,
+                     SOURCE_EXTRACTORS, DEFAULT_WATCH_INTERVAL, DEFAULT_WATCH_DEBOUNCE, CodepointSet, RunMetrics,
+                     ScanRules, SubsetCache, FontCoverageIndex, collect_stats, analyze_path, subset_fonts, watch_path,
+                     check_font_coverage, get_default_coverage_cache_dir, CharIndex, find_char_lines, get_index_path,
+                     DEFAULT_SERVER_PORT, DEFAULT_SERVER_MEMORY, SubsetService, make_subset_server, fetch_subset,
+                     track_charset, find_rules_file, format_duration, get_charset_path, get_default_output_path,
+                     get_default_subset_cache_dir, get_subset_options, get_subset_output_path,
+                     split_subset_fonts)
+
+# ==============================================================================
+# 命令行入口 (不依赖 tkinter，适合在无图形界面的服务器或 CI 中运行)
+# ==============================================================================
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+def make_log_func(quiet):
+    """日志输出到 stderr，stdout 只保留命令的结果。"""
+    if quiet:
+        return lambda message: None
+    return lambda message: print(message, file=sys.stderr, flush=True)
+
+def make_progress_func(enabled):
+    """返回在 stderr 的同一行刷新进度和剩余时间的回调，未启用时返回 None。"""
+    if not enabled:
+        return None
+
+    def show_progress(fraction, eta):
+        eta_text = f"，预计剩余 {format_duration(eta)}" if eta is not None else ""
+        end = "\n" if fraction >= 1 else ""
+        print(f"\r进度: {fraction * 100:5.1f}%{eta_text}    ", end=end, file=sys.stderr, flush=True)
+    return show_progress
+
+def write_metrics(path, command, **sections):
+    """把各阶段的运行指标 (RunMetrics) 保存为 JSON 文件。"""
+    data = {'command': command}
+    for name, metrics in sections.items():
+        data[name] = metrics.to_dict()
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+
+def get_scan_rules(args, log_func):
+    """
+    读取扫描规则：--rules 指定的文件，或在扫描目录和程序目录中找到的规则文件，
+    再应用 --exclude-dir、--no-default-excludes 和 --extract。规则文件无效时输出错误并返回 None。
+    """
+    rules_path = args.rules or find_rules_file(args.target)
+    try:
+        rules = ScanRules.load(rules_path) if rules_path else ScanRules()
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取规则文件 '{rules_path}': {e}", file=sys.stderr)
+        return None
+    if rules_path:
+        log_func(f"使用规则文件: {rules_path}")
+    if args.exclude_dir or args.no_default_excludes or args.extract:
+        data = rules.to_dict()
+        if args.no_default_excludes:
+            data['exclude_dirs'] = [p for p in data['exclude_dirs'] if p not in DEFAULT_EXCLUDED_DIRS]
+        data['exclude_dirs'].extend(args.exclude_dir or [])
+        data['extract'] = data['extract'] or args.extract
+        rules = ScanRules.from_dict(data)
+    return rules
+
+def read_chars_file(path):
+    """读取字符集文件 (普通文本或 CodepointSet.save 保存的码位范围)，返回 CodepointSet。"""
+    return CodepointSet.load(path)
+
+def write_chars_file(path, characters):
+    """将字符集按码位顺序写入文件，可供 subset --chars 使用。"""
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write(CodepointSet.from_chars(characters).chars())
+
+def print_charset_delta(metrics):
+    """输出与上次保存的字符集相比新增和移除的字符数。"""
+    print(f"新增字符数: {metrics.counters['chars_added']}")
+    print(f"移除字符数: {metrics.counters['chars_removed']}")
+
+def parse_tiers(text):
+    """解析 --split 的分片大小列表，如 "500,2000"。"""
+    try:
+        tiers = tuple(int(item) for item in text.split(',') if item.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的分片大小: {text}")
+    if not tiers or any(size <= 0 for size in tiers):
+        raise argparse.ArgumentTypeError(f"分片大小必须是正整数: {text}")
+    return tiers
+
+def cmd_scan(args, log_func):
+    """扫描并输出汇总信息，不生成报告文件。"""
+    rules = get_scan_rules(args, log_func)
+    if rules is None:
+        return EXIT_USAGE
+    metrics = RunMetrics(make_progress_func(args.progress))
+    start = time.perf_counter()
+    stats = collect_stats(args.target, log_func, args.workers, args.cache, metrics, rules, args.pipeline)
+    elapsed = time.perf_counter() - start
+    metrics.log_summary(log_func)
+    if args.metrics:
+        write_metrics(args.metrics, 'scan', scan=metrics)
+    if not stats:
+        log_func("分析完成，但未找到任何可供分析的内容。")
+        return EXIT_FAILURE
+
+    print(f"唯一字符数: {len(stats.char_counts)}")
+    print(f"总中文字数: {stats.chinese_count}")
+    print(f"总英文字母数: {stats.english_count}")
+    print(f"总空格数: {stats.space_count}")
+    print(f"总标点符号数: {stats.punctuation_count}")
+    print(f"耗时: {elapsed:.3f} 秒")
+    if args.chars_out:
+        write_chars_file(args.chars_out, stats.codepoints())
+        print(f"字符集已保存到: {args.chars_out}")
+    return EXIT_OK
+
+def cmd_report(args, log_func):
+    """扫描并生成报告文件，与图形界面的"开始分析"相同。"""
+    output_path = args.output
+    if not output_path:
+        output_path = get_default_output_path()
+        if args.format:
+            output_path = os.path.splitext(output_path)[0] + REPORT_WRITERS[args.format][1]
+    rules = get_scan_rules(args, log_func)
+    if rules is None:
+        return EXIT_USAGE
+    charset_path = None
+    if args.track_charset is not None or args.append_only:
+        charset_path = args.track_charset or get_charset_path(output_path)
+    index_path = get_index_path(output_path) if args.index else None
+    metrics = RunMetrics(make_progress_func(args.progress))
+    start = time.perf_counter()
+    characters = analyze_path(args.target, output_path, log_func, args.workers, args.cache, metrics=metrics,
+                              rules=rules, pipeline_depth=args.pipeline, charset_path=charset_path,
+                              append_only=args.append_only, report_format=args.format, top_n=args.top,
+                              index_path=index_path)
+    elapsed = time.perf_counter() - start
+    metrics.log_summary(log_func)
+    if args.metrics:
+        write_metrics(args.metrics, 'report', scan=metrics)
+    if not characters or not os.path.exists(output_path):
+        return EXIT_FAILURE
+
+    print(f"报告已保存到: {output_path}")
+    print(f"唯一字符数: {len(characters)}")
+    if charset_path:
+        print_charset_delta(metrics)
+    if index_path and os.path.exists(index_path):
+        print(f"字符来源索引已保存到: {index_path}")
+    print(f"耗时: {elapsed:.3f} 秒")
+    if args.chars_out:
+        write_chars_file(args.chars_out, characters)
+        print(f"字符集已保存到: {args.chars_out}")
+    return EXIT_OK
+
+def collect_characters(args, log_func, sections):
+    """
+    汇总 -t 扫描到的字符、-c 字符集文件和 -e 额外字符，返回 (字符集, 字符出现次数)；
+    扫描规则无效时返回 None。扫描的运行指标保存在 sections['scan'] 中。
+    """
+    characters = CodepointSet()
+    char_counts = {}
+    if args.target:
+        rules = get_scan_rules(args, log_func)
+        if rules is None:
+            return None
+        scan_metrics = sections['scan'] = RunMetrics(make_progress_func(args.progress))
+        stats = collect_stats(args.target, log_func, args.workers, args.cache, scan_metrics, rules,
+                              args.pipeline)
+        characters |= stats.codepoints()
+        char_counts = stats.char_counts
+        scan_metrics.log_summary(log_func)
+    for chars_path in args.chars or []:
+        characters |= read_chars_file(chars_path)
+    if args.extra:
+        characters |= args.extra
+    return characters, char_counts
+
+def subset_remote(args, characters, layout_features, log_func):
+    """通过常驻瘦身服务 (--server) 瘦身字体，fonts 为服务端的字体文件名 (也可以是本地路径，只使用文件名)。"""
+    fail_count = 0
+    reserved_paths = set()
+    start = time.perf_counter()
+    for font_path in args.fonts:
+        font_name = os.path.basename(font_path)
+        log_func(f"\n正在请求瘦身服务: {font_name}")
+        try:
+            data, hit = fetch_subset(args.server, font_name, characters, args.profile, args.flavor, layout_features)
+        except RuntimeError as e:
+            print(f"失败: {font_name}: {e}", file=sys.stderr)
+            fail_count += 1
+            continue
+        output_path = get_subset_output_path(font_name, args.output_dir, reserved_paths,
+                                             args.flavor or ('woff2' if data[:4] == b'wOF2' else
+                                                             'woff' if data[:4] == b'wOFF' else None))
+        reserved_paths.add(output_path)
+        with open(output_path, 'wb') as file:
+            file.write(data)
+        log_func(f"  -> {'命中服务端缓存，' if hit else ''}已保存到: {output_path} ({len(data) / 1024:.1f} KB)")
+    print(f"成功: {len(args.fonts) - fail_count} 个, 失败: {fail_count} 个。")
+    print(f"耗时: {time.perf_counter() - start:.3f} 秒")
+    return EXIT_OK if fail_count == 0 else EXIT_FAILURE
+
+def cmd_subset(args, log_func):
+    """根据扫描结果或字符集文件对字体进行瘦身。"""
+    if not FONTTOOLS_AVAILABLE and not args.server:
+        print("错误: 未找到 fontTools 库，无法执行字体瘦身。请通过 'pip install fonttools' 命令安装。",
+              file=sys.stderr)
+        return EXIT_FAILURE
+    if not os.path.isdir(args.output_dir):
+        print(f"错误: 字体保存目录无效或不存在: {args.output_dir}", file=sys.stderr)
+        return EXIT_USAGE
+    layout_features = None
+    if args.layout_features is not None:
+        layout_features = [name.strip() for name in args.layout_features.split(',') if name.strip()]
+    options = None
+    if not args.server:
+        try:
+            options = get_subset_options(args.profile, args.flavor, layout_features)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    sections = {}
+    collected = collect_characters(args, log_func, sections)
+    if collected is None:
+        return EXIT_USAGE
+    characters, char_counts = collected
+    if not characters:
+        print("错误: 字符集为空，无法进行字体瘦身。", file=sys.stderr)
+        return EXIT_FAILURE
+    if args.track_charset:
+        charset_metrics = sections['charset'] = RunMetrics()
+        characters = track_charset(args.track_charset, characters, log_func, charset_metrics, args.append_only)
+        print_charset_delta(charset_metrics)
+
+    log_func(f"总计 {len(characters)} 个唯一字符将被保留。")
+    if args.server:
+        return subset_remote(args, characters, layout_features, log_func)
+    cache = None
+    if args.subset_cache:
+        cache = SubsetCache(args.subset_cache, args.subset_cache_size * 1024 * 1024)
+        log_func(f"使用瘦身缓存: {cache.cache_dir}")
+    success_count = 0
+    fail_count = 0
+    subset_metrics = sections['subset'] = RunMetrics(make_progress_func(args.progress))
+    start = time.perf_counter()
+    if args.split:
+        if not char_counts:
+            log_func("警告: 没有扫描目录 (-t)，无法得到字符出现频率，将按码位顺序分片。")
+        results = split_subset_fonts(args.fonts, characters, char_counts, args.output_dir, log_func, args.split,
+                                     args.css, args.workers, cache, subset_metrics, args.skip_unchanged, options)
+    else:
+        results = subset_fonts(args.fonts, characters, args.output_dir, log_func, args.workers, cache,
+                               subset_metrics, args.skip_unchanged, options)
+    for font_path, (success, error_msg, output_path) in zip(args.fonts, results):
+        if success:
+            success_count += 1
+        else:
+            fail_count += 1
+            print(f"失败: {font_path}: {error_msg}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    subset_metrics.log_summary(log_func)
+    if args.metrics:
+        write_metrics(args.metrics, 'subset', **sections)
+
+    if args.skip_unchanged:
+        print(f"未变化而跳过: {subset_metrics.counters['unchanged_fonts']} 个")
+    print(f"成功: {success_count} 个, 失败: {fail_count} 个。")
+    print(f"耗时: {elapsed:.3f} 秒")
+    return EXIT_OK if fail_count == 0 else EXIT_FAILURE
+
+def format_char(char):
+    """返回便于阅读的字符和码位，如 "字 (U+5B57)"；空白和控制字符只显示码位。"""
+    code = f"U+{ord(char):04X}"
+    return f"{char} ({code})" if char.isprintable() and not char.isspace() else code
+
+def cmd_serve(args, log_func):
+    """启动常驻瘦身服务，预先载入字体并在内存中缓存瘦身结果，按 Ctrl+C 停止。"""
+    if not FONTTOOLS_AVAILABLE:
+        print("错误: 未找到 fontTools 库，无法执行字体瘦身。请通过 'pip install fonttools' 命令安装。",
+              file=sys.stderr)
+        return EXIT_FAILURE
+    try:
+        service = SubsetService(args.fonts, args.memory * 1024 * 1024)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    log_func(f"正在载入 {len(service.fonts)} 个字体...")
+    service.preload(log_func)
+    try:
+        server = make_subset_server(service, args.host, args.port, log_func)
+    except OSError as e:
+        print(f"错误: 无法监听 {args.host}:{args.port}: {e}", file=sys.stderr)
+        return EXIT_FAILURE
+    host, port = server.server_address[:2]
+    print(f"瘦身服务已启动: http://{host}:{port}/ (按 Ctrl+C 停止)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("已停止瘦身服务。")
+    finally:
+        server.server_close()
+    return EXIT_OK
+
+def cmd_query(args, log_func):
+    """在字符来源索引中查找字符出现在哪些文件 (和行) 中，或列出只出现在少数文件中的字符。"""
+    index_path = args.index
+    if os.path.splitext(index_path)[1].lower() != '.wcix':
+        index_path = get_index_path(index_path)
+    try:
+        index = CharIndex.load(index_path)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取字符来源索引 '{index_path}': {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    not_found = 0
+    for char in dict.fromkeys(args.chars or ''):
+        paths = index.files(char)
+        if not paths:
+            print(f"{format_char(char)}: 未出现")
+            not_found += 1
+            continue
+        print(f"{format_char(char)}: {len(paths)} 个文件")
+        for file_path in paths:
+            print(f"  {file_path}")
+            if not args.lines:
+                continue
+            try:
+                lines = find_char_lines(file_path, char)
+            except OSError as e:
+                print(f"    (无法读取: {e})")
+                continue
+            for line_no, line in lines:
+                print(f"    {line_no}: {line.strip()[:200]}")
+
+    if args.rare is not None:
+        rare = index.rare_chars(args.rare)
+        print(f"最多出现在 {args.rare} 个文件中的字符: {len(rare)} 个")
+        for char, paths in rare:
+            print(f"{format_char(char)}: {', '.join(paths)}")
+    return EXIT_OK if not not_found else EXIT_FAILURE
+
+def cmd_coverage(args, log_func):
+    """检查字体能否显示字符集中的所有字符，并推荐备用字体；有字符所有字体都无法显示时返回失败。"""
+    sections = {}
+    collected = collect_characters(args, log_func, sections)
+    if collected is None:
+        return EXIT_USAGE
+    characters = collected[0]
+    if not characters:
+        print("错误: 字符集为空，无法检查覆盖率。", file=sys.stderr)
+        return EXIT_FAILURE
+
+    log_func(f"\n检查 {len(characters)} 个字符的覆盖情况:")
+    index = FontCoverageIndex(args.index_cache)
+    entries, fallbacks, missing = check_font_coverage(args.fonts, characters, log_func, index)
+    if args.metrics:
+        write_metrics(args.metrics, 'coverage', **sections)
+    for label, font_path, face_index, coverage, face_missing in entries:
+        print(f"{label}: 覆盖率 {coverage:.1f}%，缺少 {len(face_missing)} 个字符")
+    for label, covered in fallbacks:
+        print(f"备用字体: {label} (补充 {len(covered)} 个字符)")
+    print(f"所有字体都缺少的字符数: {len(missing)}")
+    if args.missing_out:
+        write_chars_file(args.missing_out, missing)
+        print(f"缺少的字符已保存到: {args.missing_out}")
+    if len(entries) < len(args.fonts):
+        return EXIT_FAILURE
+    return EXIT_OK if not missing else EXIT_FAILURE
+
+def cmd_watch(args, log_func):
+    """监视目录，文件变化时更新报告；指定了字体时，字符集变化后重新瘦身。按 Ctrl+C 停止。"""
+    output_path = args.output or get_default_output_path()
+    rules = get_scan_rules(args, log_func)
+    if rules is None:
+        return EXIT_USAGE
+    on_change = None
+    if args.fonts:
+        if not FONTTOOLS_AVAILABLE:
+            print("错误: 未找到 fontTools 库，无法执行字体瘦身。请通过 'pip install fonttools' 命令安装。",
+                  file=sys.stderr)
+            return EXIT_FAILURE
+        if not os.path.isdir(args.output_dir):
+            print(f"错误: 字体保存目录无效或不存在: {args.output_dir}", file=sys.stderr)
+            return EXIT_USAGE
+        try:
+            options = get_subset_options(args.profile, args.flavor)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        cache = None
+        if args.subset_cache:
+            cache = SubsetCache(args.subset_cache)
+            log_func(f"使用瘦身缓存: {cache.cache_dir}")
+
+        def on_change(characters, stats):
+            # 依据瘦身清单跳过没有变化的字体，并覆盖上次的输出文件
+            log_func(f"\n--- 重新瘦身字体 ({len(characters)} 个字符) ---")
+            results = subset_fonts(args.fonts, characters, args.output_dir, log_func, args.workers, cache,
+                                   RunMetrics(), True, options)
+            for font_path, (success, error_msg, font_output_path) in zip(args.fonts, results):
+                if not success:
+                    print(f"失败: {font_path}: {error_msg}", file=sys.stderr)
+
+    charset_path = None
+    if args.track_charset is not None or args.append_only:
+        charset_path = args.track_charset or get_charset_path(output_path)
+    try:
+        watch_path(args.target, output_path, log_func, rules, args.workers, on_change, interval=args.interval,
+                   debounce=args.debounce, charset_path=charset_path, append_only=args.append_only,
+                   report_format=args.format, top_n=args.top)
+    except KeyboardInterrupt:
+        print("已停止监视。")
+    return EXIT_OK
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="wc_cli.py", description="字符统计与字体瘦身工具 (命令行版)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="不输出处理日志")
+    parser.add_argument('--progress', action='store_true', help="在 stderr 显示进度百分比和预计剩余时间")
+    parser.add_argument('--metrics', metavar='FILE', help="将各阶段耗时和处理量保存为 JSON 文件")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_scan_options(sub):
+        sub.add_argument('--pipeline', type=int, nargs='?', const=PIPELINE_DEPTH, default=0, metavar='DEPTH',
+                         help=f"单进程扫描时由读取线程预读后面的文件，DEPTH 为最多预读的文件数 (默认 {PIPELINE_DEPTH})")
+        sub.add_argument('-r', '--rules', metavar='FILE',
+                         help="扫描规则文件 (JSON 或 TOML)，默认在扫描目录和程序目录中查找 wc_rules.toml / wc_rules.json")
+        sub.add_argument('-x', '--exclude-dir', action='append', metavar='GLOB',
+                         help="跳过与该规则匹配的目录 (目录名或相对路径)，可重复指定")
+        sub.add_argument('--no-default-excludes', action='store_true',
+                         help=f"不跳过默认排除的目录 ({', '.join(DEFAULT_EXCLUDED_DIRS)})")
+        sub.add_argument('--extract', action='store_true',
+                         help=f"源代码文件只统计字符串、对白等用户可见的文本 ({', '.join(SOURCE_EXTRACTORS)})")
+
+    def add_scan_arguments(sub):
+        sub.add_argument('target', help="要扫描的文件或目录")
+        sub.add_argument('-w', '--workers', type=int, default=1, help="并行扫描的进程数 (默认 1)")
+        add_scan_options(sub)
+        sub.add_argument('--chars-out', help="将唯一字符集保存到该文件")
+
+    scan_parser = subparsers.add_parser('scan', help="扫描并输出统计汇总，不生成报告")
+    add_scan_arguments(scan_parser)
+    scan_parser.add_argument('--cache', help="增量分析缓存文件路径")
+    scan_parser.set_defaults(func=cmd_scan)
+
+    report_parser = subparsers.add_parser('report', help="扫描并生成报告文件")
+    add_scan_arguments(report_parser)
+    report_parser.add_argument('-o', '--output', help="报告保存位置 (默认与图形界面相同)")
+    report_parser.add_argument('-f', '--format', choices=list(REPORT_WRITERS),
+                               help="报告格式 (默认根据 -o 的扩展名判断，其他情况为 text)；"
+                                    "json/csv/bin 包含每个字符的出现次数和逐文件统计")
+    report_parser.add_argument('--top', type=int, default=DEFAULT_TOP_N, metavar='N',
+                               help=f"报告中列出的高频中文字数 (默认 {DEFAULT_TOP_N})")
+    report_parser.add_argument('--cache', action='store_true', help="在报告旁维护增量分析缓存")
+    report_parser.add_argument('--track-charset', nargs='?', const='', metavar='FILE',
+                               help="保存本次的字符集并与上次比较，默认保存在报告旁 (*.charset.txt)")
+    report_parser.add_argument('--append-only', action='store_true',
+                               help="字符集只增不减：上次的字符即使本次没有出现也继续保留 (隐含 --track-charset)")
+    report_parser.add_argument('--index', action='store_true',
+                               help="同时建立字符来源索引 (每个字符出现在哪些文件中)，保存在报告旁 (*.index.wcix)")
+    report_parser.set_defaults(func=cmd_report)
+
+    subset_parser = subparsers.add_parser('subset', help="对字体进行瘦身")
+    subset_parser.add_argument('fonts', nargs='+', help="字体文件 (TTF/OTF/TTC/OTC)")
+    subset_parser.add_argument('-d', '--output-dir', required=True, help="瘦身字体的保存目录")
+    subset_parser.add_argument('-t', '--target', help="先扫描该文件或目录，保留其中出现的字符")
+    subset_parser.add_argument('-c', '--chars', action='append', help="字符集文件，可重复指定")
+    subset_parser.add_argument('-e', '--extra', help="额外需要保留的字符")
+    subset_parser.add_argument('-w', '--workers', type=int, default=1, help="并行扫描和瘦身的进程数 (默认 1)")
+    subset_parser.add_argument('--cache', help="扫描时使用的增量分析缓存文件路径")
+    add_scan_options(subset_parser)
+    subset_parser.add_argument('--subset-cache', nargs='?', const=get_default_subset_cache_dir(),
+                               metavar='DIR', help="启用瘦身结果缓存，可指定缓存目录")
+    subset_parser.add_argument('--profile', choices=SUBSET_PROFILES, default='keep',
+                               help="瘦身配置: keep 保持原格式和全部信息 (默认)；web 输出 WOFF2/WOFF，"
+                                    "去掉 hinting、字形名称和网页用不到的表")
+    subset_parser.add_argument('--flavor', choices=WEB_FLAVORS,
+                               help="web 配置的输出格式 (默认安装了 brotli 时为 woff2，否则为 woff)")
+    subset_parser.add_argument('--layout-features', metavar='LIST',
+                               help="保留的 OpenType 特性，用逗号分隔，如 kern,liga,vert；'*' 表示全部")
+    subset_parser.add_argument('--split', type=parse_tiers, nargs='?', metavar='SIZES',
+                               const=DEFAULT_SPLIT_TIERS,
+                               help="按字符出现频率分片瘦身，并生成带 unicode-range 的样式表；SIZES 为前几片的字符数 "
+                                    f"(默认 {','.join(map(str, DEFAULT_SPLIT_TIERS))})，其余字符为最后一片")
+    subset_parser.add_argument('--css', metavar='FILE', help="分片瘦身时样式表的保存位置 (默认为字体保存目录中的 fonts.css)")
+    subset_parser.add_argument('--track-charset', metavar='FILE',
+                               help="与该文件中上次保存的字符集比较，并保存本次要保留的字符集")
+    subset_parser.add_argument('--append-only', action='store_true',
+                               help="字符集只增不减，需要与 --track-charset 一起使用")
+    subset_parser.add_argument('--skip-unchanged', action='store_true',
+                               help="跳过字体、字符集和选项都没有变化的字体 (依据输出目录中的瘦身清单)，"
+                                    "有变化时覆盖上次的输出文件")
+    subset_parser.add_argument('--subset-cache-size', type=int, default=DEFAULT_SUBSET_CACHE_SIZE // (1024 * 1024),
+                               metavar='MB', help="瘦身缓存目录的大小上限 (MB)")
+    subset_parser.add_argument('--server', metavar='URL',
+                               help="通过 serve 启动的常驻瘦身服务瘦身 (如 http://127.0.0.1:8765)，"
+                                    "fonts 为服务端的字体文件名")
+    subset_parser.set_defaults(func=cmd_subset)
+
+    serve_parser = subparsers.add_parser('serve', help="启动常驻瘦身服务，字体只载入一次，重复瘦身时直接使用内存中的数据")
+    serve_parser.add_argument('fonts', nargs='+', help="服务提供的字体文件 (TTF/OTF/TTC/OTC)，请求时使用文件名")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="监听的地址 (默认只允许本机访问)")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_SERVER_PORT,
+                              help=f"监听的端口 (默认 {DEFAULT_SERVER_PORT}，0 表示自动选择)")
+    serve_parser.add_argument('--memory', type=int, default=DEFAULT_SERVER_MEMORY // (1024 * 1024), metavar='MB',
+                              help="字体数据和瘦身结果共用的内存上限 (MB)")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    query_parser = subparsers.add_parser('query', help="查找字符出现在哪些文件中 (需要先用 report --index 建立索引)")
+    query_parser.add_argument('index', help="字符来源索引文件 (*.index.wcix)，也可以是对应的报告文件")
+    query_parser.add_argument('chars', nargs='?', help="要查找的字符")
+    query_parser.add_argument('-n', '--lines', action='store_true', help="同时列出包含该字符的行 (重新读取对应的文件)")
+    query_parser.add_argument('--rare', type=int, metavar='N', help="列出最多出现在 N 个文件中的字符")
+    query_parser.set_defaults(func=cmd_query)
+
+    coverage_parser = subparsers.add_parser('coverage', help="检查字体缺少哪些字符，并推荐备用字体")
+    coverage_parser.add_argument('fonts', nargs='+', help="字体文件 (TTF/OTF/TTC/OTC)，第一个为主字体")
+    coverage_parser.add_argument('-t', '--target', help="先扫描该文件或目录，检查其中出现的字符")
+    coverage_parser.add_argument('-c', '--chars', action='append', help="字符集文件，可重复指定")
+    coverage_parser.add_argument('-e', '--extra', help="额外需要检查的字符")
+    coverage_parser.add_argument('-w', '--workers', type=int, default=1, help="并行扫描的进程数 (默认 1)")
+    coverage_parser.add_argument('--cache', help="扫描时使用的增量分析缓存文件路径")
+    add_scan_options(coverage_parser)
+    coverage_parser.add_argument('--index-cache', metavar='DIR',
+                                 help=f"字体覆盖范围索引的保存目录 (默认 {get_default_coverage_cache_dir()})")
+    coverage_parser.add_argument('--missing-out', metavar='FILE', help="将所有字体都缺少的字符保存到该文件")
+    coverage_parser.set_defaults(func=cmd_coverage)
+
+    watch_parser = subparsers.add_parser('watch', help="监视目录，文件变化时更新报告并重新瘦身字体")
+    watch_parser.add_argument('target', help="要监视的文件或目录")
+    watch_parser.add_argument('-o', '--output', help="报告保存位置 (默认与图形界面相同)")
+    watch_parser.add_argument('-w', '--workers', type=int, default=1, help="初次扫描和瘦身的进程数 (默认 1)")
+    add_scan_options(watch_parser)
+    watch_parser.add_argument('-f', '--format', choices=list(REPORT_WRITERS), help="报告格式，参见 report")
+    watch_parser.add_argument('--top', type=int, default=DEFAULT_TOP_N, metavar='N',
+                              help=f"报告中列出的高频中文字数 (默认 {DEFAULT_TOP_N})")
+    watch_parser.add_argument('--track-charset', nargs='?', const='', metavar='FILE',
+                              help="保存字符集并与上次比较，默认保存在报告旁 (*.charset.txt)")
+    watch_parser.add_argument('--append-only', action='store_true',
+                              help="字符集只增不减 (隐含 --track-charset)")
+    watch_parser.add_argument('--font', dest='fonts', action='append', metavar='FILE',
+                              help="字符集变化时重新瘦身该字体，可重复指定；需要与 -d 一起使用")
+    watch_parser.add_argument('-d', '--output-dir', help="瘦身字体的保存目录")
+    watch_parser.add_argument('--profile', choices=SUBSET_PROFILES, default='keep', help="瘦身配置，参见 subset")
+    watch_parser.add_argument('--flavor', choices=WEB_FLAVORS, help="web 配置的输出格式，参见 subset")
+    watch_parser.add_argument('--subset-cache', nargs='?', const=get_default_subset_cache_dir(),
+                              metavar='DIR', help="启用瘦身结果缓存，可指定缓存目录")
+    watch_parser.add_argument('--interval', type=float, default=DEFAULT_WATCH_INTERVAL, metavar='SECONDS',
+                              help=f"检查文件变化的间隔 (默认 {DEFAULT_WATCH_INTERVAL:g} 秒，"
+                                   "安装了 watchdog 时由文件系统通知触发)")
+    watch_parser.add_argument('--debounce', type=float, default=DEFAULT_WATCH_DEBOUNCE, metavar='SECONDS',
+                              help=f"最后一次修改后等待的时间，连续修改时只更新一次 (默认 {DEFAULT_WATCH_DEBOUNCE:g} 秒)")
+    watch_parser.set_defaults(func=cmd_watch)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'workers', 1) < 1:
+        parser.error("并行进程数必须是正整数")
+    if getattr(args, 'top', 0) < 0:
+        parser.error("高频字数不能为负数")
+    if args.command == 'query' and not args.chars and args.rare is None:
+        parser.error("需要指定要查找的字符或 --rare")
+    if args.command == 'query' and args.rare is not None and args.rare < 1:
+        parser.error("--rare 必须是正整数")
+    if getattr(args, 'pipeline', 0) < 0:
+        parser.error("预读文件数不能为负数")
+    if args.command == 'subset' and args.server and (args.split or args.skip_unchanged or args.subset_cache):
+        parser.error("--server 不能与 --split、--skip-unchanged 或 --subset-cache 一起使用")
+    if args.command == 'serve' and args.memory < 1:
+        parser.error("内存上限必须是正整数")
+    if args.command == 'subset' and args.append_only and not args.track_charset:
+        parser.error("--append-only 需要与 --track-charset 一起使用")
+    if args.command in ('subset', 'watch') and args.flavor and args.profile != 'web':
+        parser.error("--flavor 只能与 --profile web 一起使用")
+    if args.command == 'watch':
+        if args.fonts and not args.output_dir:
+            parser.error("--font 需要与 -d 一起使用")
+        if args.interval <= 0 or args.debounce < 0:
+            parser.error("检查间隔必须大于 0，等待时间不能为负数")
+    try:
+        return args.func(args, make_log_func(args.quiet))
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        print(f"发生了一个未预料的严重错误: {e}", file=sys.stderr)
+        return EXIT_FAILURE
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
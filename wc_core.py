@@ -0,0 +1,3262 @@
+# 字符统计与字体瘦身的核心逻辑。
+# 本模块不依赖 tkinter，可以在没有图形界面的环境中单独使用 (见 wc_cli.py)。
+
+import os
+import io
+import re
+import sys
+import codecs
+import json
+import zlib
+import csv
+import struct
+import gzip
+import sqlite3
+import shutil
+import hashlib
+import heapq
+import fnmatch
+import functools
+import unicodedata
+import time
+import threading
+import urllib.error
+import urllib.request
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# 字体处理库 fontTools 的可选导入
+try:
+    from fontTools.subset import Subsetter, Options
+    from fontTools.ttLib import TTFont, TTCollection
+    from fontTools import version as FONTTOOLS_VERSION
+    FONTTOOLS_AVAILABLE = True
+except ImportError:
+    FONTTOOLS_AVAILABLE = False
+
+# 数值计算库 NumPy 的可选导入，用于批量统计字符
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 标准库 tomllib (Python 3.11 及以上版本) 的可选导入，用于读取 TOML 格式的规则文件
+try:
+    import tomllib
+    TOMLLIB_AVAILABLE = True
+except ImportError:
+    TOMLLIB_AVAILABLE = False
+
+# 压缩库 brotli 的可选导入，fontTools 保存 WOFF2 字体时需要
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# 文件监视库 watchdog 的可选导入，监视模式下用文件系统通知代替定时检查
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+# ==============================================================================
+# 核心分析逻辑
+# ==============================================================================
+
+# 字符类别编号
+CATEGORY_SKIP = 0          # 忽略的字符 (\0、替换字符、控制字符)，不计入统计
+CATEGORY_CHINESE = 1
+CATEGORY_ENGLISH = 2
+CATEGORY_SPACE = 3
+CATEGORY_PUNCTUATION = 4
+CATEGORY_OTHER = 5         # 其他空白字符 (换行、制表符等)，只计入唯一字符
+
+# 文本长度达到该值时才使用 NumPy 统计，短文本直接用 Counter 更快
+NUMPY_MIN_LENGTH = 4096
+
+# 字符 -> 类别编号 的查找表，每个不同的字符只分类一次
+_category_cache = {}
+
+def classify_char(char):
+    """按统计规则返回单个字符的类别编号。"""
+    if char == '\0' or char == '\ufffd' or (ord(char) < 32 and char not in '\t\n\r'):
+        return CATEGORY_SKIP
+    if '\u4e00' <= char <= '\u9fff':
+        return CATEGORY_CHINESE
+    elif 'a' <= char.lower() <= 'z':
+        return CATEGORY_ENGLISH
+    elif char == ' ':
+        return CATEGORY_SPACE
+    elif not char.isspace():
+        return CATEGORY_PUNCTUATION
+    return CATEGORY_OTHER
+
+def get_char_category(char):
+    """带查找表缓存的 classify_char。"""
+    category = _category_cache.get(char)
+    if category is None:
+        category = _category_cache[char] = classify_char(char)
+    return category
+
+# 逐文件汇总中各项计数的名称
+FILE_SUMMARY_FIELDS = ('chars', 'unique', 'chinese', 'english', 'space', 'punctuation')
+
+class CharStats:
+    """
+    字符统计数据。
+    只保存每个字符(码位)的出现次数和各类别的计数，内存占用只与不同字符的数量有关，
+    与扫描的文本总量无关。
+    """
+
+    def __init__(self):
+        # 每个字符出现的次数，按首次出现的顺序插入
+        self.char_counts = Counter()
+        self.chinese_count = 0
+        self.english_count = 0
+        self.space_count = 0
+        self.punctuation_count = 0
+        # 扫描结果中每个文件的汇总 (文件路径 -> FILE_SUMMARY_FIELDS 对应的计数)，用于报告中的逐文件统计
+        self.file_summaries = {}
+
+    def update(self, content):
+        """统计一段文本，并累加到当前数据中。"""
+        process_file_content(content, self)
+
+    def merge(self, other):
+        """将另一份统计数据合并到当前数据中。"""
+        self.char_counts.update(other.char_counts)
+        self.chinese_count += other.chinese_count
+        self.english_count += other.english_count
+        self.space_count += other.space_count
+        self.punctuation_count += other.punctuation_count
+
+    def subtract(self, other):
+        """从当前数据中减去另一份统计数据 (如文件修改前的内容)，次数减到 0 的字符会被移除。"""
+        for char, count in other.char_counts.items():
+            remaining = self.char_counts[char] - count
+            if remaining > 0:
+                self.char_counts[char] = remaining
+            else:
+                self.char_counts.pop(char, None)
+        self.chinese_count -= other.chinese_count
+        self.english_count -= other.english_count
+        self.space_count -= other.space_count
+        self.punctuation_count -= other.punctuation_count
+
+    def add_file(self, file_path, other):
+        """合并单个文件的统计数据，并记录该文件的汇总。"""
+        self.merge(other)
+        self.file_summaries[file_path] = other.summary()
+
+    def remove_file(self, file_path, other):
+        """减去单个文件的统计数据 (other 为 add_file 时传入的数据)，并删除该文件的汇总。"""
+        self.subtract(other)
+        self.file_summaries.pop(file_path, None)
+
+    def summary(self):
+        """返回 FILE_SUMMARY_FIELDS 对应的计数列表。"""
+        return [sum(self.char_counts.values()), len(self.char_counts), self.chinese_count,
+                self.english_count, self.space_count, self.punctuation_count]
+
+    def to_bytes(self):
+        """序列化为压缩后的字节串，用于写入缓存。"""
+        data = [self.chinese_count, self.english_count, self.space_count, self.punctuation_count,
+                [[ord(char), count] for char, count in self.char_counts.items()]]
+        return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """从 to_bytes 生成的字节串恢复统计数据。"""
+        stats = cls()
+        (stats.chinese_count, stats.english_count, stats.space_count, stats.punctuation_count,
+         char_counts) = json.loads(zlib.decompress(data).decode('utf-8'))
+        stats.char_counts = Counter({chr(code): count for code, count in char_counts})
+        return stats
+
+    def unique_chars(self):
+        """返回所有出现过的唯一字符集合。"""
+        return set(self.char_counts)
+
+    def codepoints(self):
+        """返回所有出现过的唯一字符组成的 CodepointSet。"""
+        return CodepointSet(map(ord, self.char_counts))
+
+    def most_common_chinese(self, n):
+        """返回出现频率最高的 n 个中文字及其次数。"""
+        chinese_counts = Counter({char: count for char, count in self.char_counts.items()
+                                  if get_char_category(char) == CATEGORY_CHINESE})
+        return chinese_counts.most_common(n)
+
+    def __bool__(self):
+        return bool(self.char_counts)
+
+
+def count_chars(content, use_numpy=None):
+    """
+    批量统计一段文本中每个字符的出现次数。
+    返回按首次出现顺序排列的 (字符, 次数) 列表。
+    use_numpy 为 None 时根据 NumPy 是否可用和文本长度自动选择。
+    """
+    if use_numpy is None:
+        use_numpy = NUMPY_AVAILABLE and len(content) >= NUMPY_MIN_LENGTH
+    if not use_numpy:
+        return list(Counter(content).items())
+
+    # 转换为 UTF-32 码位数组，按码位一次性计数
+    codes = np.frombuffer(content.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    counts = np.bincount(codes)
+    unique_codes = np.flatnonzero(counts)
+    # 记录每个码位首次出现的位置，按该位置排序以保证与 Counter 的顺序一致
+    first_index = np.full(counts.size, codes.size, dtype=np.intp)
+    np.minimum.at(first_index, codes, np.arange(codes.size, dtype=np.intp))
+    unique_codes = unique_codes[np.argsort(first_index[unique_codes], kind='stable')]
+    return list(zip(map(chr, unique_codes.tolist()), counts[unique_codes].tolist()))
+
+def process_file_content(content, stats, use_numpy=None):
+    """处理文件内容，并更新统计数据 (CharStats)。"""
+    char_counts = stats.char_counts
+    for char, count in count_chars(content, use_numpy):
+        category = get_char_category(char)
+        if category == CATEGORY_SKIP:
+            continue
+        
+        char_counts[char] += count
+        
+        if category == CATEGORY_CHINESE:
+            stats.chinese_count += count
+        elif category == CATEGORY_ENGLISH:
+            stats.english_count += count
+        elif category == CATEGORY_SPACE:
+            stats.space_count += count
+        elif category == CATEGORY_PUNCTUATION:
+            stats.punctuation_count += count
+
+# ==============================================================================
+# 报告格式
+# ==============================================================================
+
+# 报告中默认列出的高频中文字数
+DEFAULT_TOP_N = 50
+# 流式写入字符列表时每次写入的字符数
+REPORT_WRITE_CHUNK = 4096
+# 各类别在 JSON/CSV 报告中的名称
+CATEGORY_NAMES = {
+    CATEGORY_CHINESE: 'chinese',
+    CATEGORY_ENGLISH: 'english',
+    CATEGORY_SPACE: 'space',
+    CATEGORY_PUNCTUATION: 'punctuation',
+    CATEGORY_OTHER: 'other',
+}
+# 二进制频率表的文件头和版本
+BINARY_REPORT_MAGIC = b'WCFT'
+BINARY_REPORT_VERSION = 1
+
+def write_text_report(stats, output_file_path, top_n=DEFAULT_TOP_N):
+    """默认的文本报告：唯一字符、高频中文字和总体统计。"""
+    with open(output_file_path, 'w', encoding='utf-8') as output_file:
+        output_file.write("==================================================\n")
+        output_file.write("1. 所有出现过的唯一字符\n")
+        output_file.write("==================================================\n")
+        # 按码位顺序分块写入，不需要先拼接出包含所有字符的字符串
+        codes = stats.codepoints().codes
+        for start in range(0, len(codes), REPORT_WRITE_CHUNK):
+            output_file.write("".join(map(chr, codes[start:start + REPORT_WRITE_CHUNK])))
+        output_file.write("\n\n")
+
+        top_chinese = stats.most_common_chinese(top_n)
+        output_file.write("==================================================\n")
+        output_file.write(f"2. 出现频率最高的{top_n}个中文字\n")
+        output_file.write("==================================================\n")
+        if top_chinese:
+            for i, (char, count) in enumerate(top_chinese, 1):
+                output_file.write(f"第 {i:02d} 名: '{char}' - 出现 {count} 次\n")
+        else:
+            output_file.write("在扫描的文件中未找到任何中文字符。\n")
+        output_file.write("\n")
+
+        output_file.write("==================================================\n")
+        output_file.write("3. 总体统计\n")
+        output_file.write("==================================================\n")
+        output_file.write(f"总中文字数: {stats.chinese_count}\n")
+        output_file.write(f"总英文字母数: {stats.english_count}\n")
+        output_file.write(f"总空格数: {stats.space_count}\n")
+        output_file.write(f"总标点符号数: {stats.punctuation_count}\n")
+
+def iter_char_rows(stats):
+    """按码位顺序逐个返回 (码位, 字符, 出现次数, 类别名)。"""
+    for code in stats.codepoints().codes:
+        char = chr(code)
+        yield code, char, stats.char_counts[char], CATEGORY_NAMES.get(get_char_category(char), 'other')
+
+def write_json_report(stats, output_file_path, top_n=DEFAULT_TOP_N):
+    """
+    JSON 报告，包含总体统计、高频中文字、每个字符的出现次数和逐文件统计。
+    逐项写入，每个字符和文件各占一行，不会先在内存中构造整个文档。
+    """
+    dumps = functools.partial(json.dumps, ensure_ascii=False)
+    with open(output_file_path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write('{\n')
+        file.write('"version": 1,\n')
+        file.write(f'"totals": {dumps(dict(zip(FILE_SUMMARY_FIELDS, stats.summary())))},\n')
+        top_chinese = [{'char': char, 'codepoint': ord(char), 'count': count}
+                       for char, count in stats.most_common_chinese(top_n)]
+        file.write(f'"top_chinese": {dumps(top_chinese)},\n')
+        file.write('"chars": [')
+        separator = '\n'
+        for code, char, count, category in iter_char_rows(stats):
+            row = {'codepoint': code, 'char': char, 'count': count, 'category': category}
+            file.write(f"{separator}{dumps(row)}")
+            separator = ',\n'
+        file.write('\n],\n"files": [')
+        separator = '\n'
+        for file_path, summary in stats.file_summaries.items():
+            row = {'path': file_path, **dict(zip(FILE_SUMMARY_FIELDS, summary))}
+            file.write(f"{separator}{dumps(row)}")
+            separator = ',\n'
+        file.write('\n]\n}\n')
+
+def get_files_csv_path(output_file_path):
+    """返回 CSV 报告的逐文件统计表路径 (与报告放在一起)。"""
+    return os.path.splitext(output_file_path)[0] + ".files.csv"
+
+def write_csv_report(stats, output_file_path, top_n=DEFAULT_TOP_N):
+    """
+    CSV 报告：每个字符一行 (码位、字符、出现次数、类别)，逐文件统计另存为 *.files.csv。
+    使用带 BOM 的 UTF-8，便于直接用 Excel 打开。top_n 对 CSV 不起作用，按出现次数排序即可得到。
+    """
+    with open(output_file_path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['codepoint', 'char', 'count', 'category'])
+        for code, char, count, category in iter_char_rows(stats):
+            writer.writerow([f"U+{code:04X}", char, count, category])
+    with open(get_files_csv_path(output_file_path), 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['path', *FILE_SUMMARY_FIELDS])
+        for file_path, summary in stats.file_summaries.items():
+            writer.writerow([file_path, *summary])
+
+def write_binary_report(stats, output_file_path, top_n=DEFAULT_TOP_N):
+    """
+    紧凑的二进制频率表 (小端序)，可以用 load_binary_report 读回：
+    文件头 "WCFT"、版本 (uint16)、字符数 (uint32)、总体统计 (6 个 uint64)，
+    之后是所有码位 (uint32 数组) 和对应的出现次数 (uint64 数组)，
+    最后是文件数 (uint32) 和每个文件的 路径长度 (uint32)、UTF-8 路径、汇总 (6 个 uint64)。
+    """
+    codes = stats.codepoints().codes
+    counts = array('Q', (stats.char_counts[chr(code)] for code in codes))
+    if sys.byteorder != 'little':
+        codes = array('I', codes)
+        codes.byteswap()
+        counts.byteswap()
+    with open(output_file_path, 'wb') as file:
+        file.write(BINARY_REPORT_MAGIC)
+        file.write(struct.pack('<HI6Q', BINARY_REPORT_VERSION, len(codes), *stats.summary()))
+        file.write(codes.tobytes())
+        file.write(counts.tobytes())
+        file.write(struct.pack('<I', len(stats.file_summaries)))
+        for file_path, summary in stats.file_summaries.items():
+            path_bytes = file_path.encode('utf-8', 'surrogateescape')
+            file.write(struct.pack('<I', len(path_bytes)))
+            file.write(path_bytes)
+            file.write(struct.pack('<6Q', *summary))
+
+def load_binary_report(path):
+    """读取 write_binary_report 生成的文件，返回 CharStats (包括逐文件汇总)。"""
+    stats = CharStats()
+    with open(path, 'rb') as file:
+        if file.read(4) != BINARY_REPORT_MAGIC:
+            raise ValueError("不是二进制频率表文件")
+        header = file.read(struct.calcsize('<HI6Q'))
+        version, size, *totals = struct.unpack('<HI6Q', header)
+        if version != BINARY_REPORT_VERSION:
+            raise ValueError(f"不支持的二进制频率表版本: {version}")
+        codes = array('I')
+        codes.frombytes(file.read(size * codes.itemsize))
+        counts = array('Q')
+        counts.frombytes(file.read(size * counts.itemsize))
+        if sys.byteorder != 'little':
+            codes.byteswap()
+            counts.byteswap()
+        stats.char_counts = Counter(dict(zip(map(chr, codes), counts)))
+        stats.chinese_count, stats.english_count, stats.space_count, stats.punctuation_count = totals[2:]
+        (file_count,) = struct.unpack('<I', file.read(4))
+        for _ in range(file_count):
+            (length,) = struct.unpack('<I', file.read(4))
+            file_path = file.read(length).decode('utf-8', 'surrogateescape')
+            stats.file_summaries[file_path] = list(struct.unpack('<6Q', file.read(48)))
+    return stats
+
+# 报告格式 -> (写入函数, 默认扩展名)；可以在这里注册新的格式
+REPORT_WRITERS = {
+    'text': (write_text_report, '.txt'),
+    'json': (write_json_report, '.json'),
+    'csv': (write_csv_report, '.csv'),
+    'bin': (write_binary_report, '.wcft'),
+}
+
+def get_report_format(output_file_path):
+    """根据报告文件的扩展名判断格式，无法判断时使用文本格式。"""
+    ext = os.path.splitext(output_file_path)[1].lower()
+    for name, (writer, format_ext) in REPORT_WRITERS.items():
+        if ext == format_ext:
+            return name
+    return 'text'
+
+def generate_report(stats, output_file_path, log_func, notify_func=None, report_format=None, top_n=DEFAULT_TOP_N):
+    """
+    根据收集到的统计数据 (CharStats) 生成报告文件，成功时返回 True。
+    notify_func(级别, 标题, 内容) 用于弹出提示，级别为 'info'、'warning' 或 'error'。
+    report_format 为 REPORT_WRITERS 中的格式名，为 None 时根据扩展名判断 (默认文本格式)；
+    top_n 为报告中列出的高频中文字数。
+    """
+    log_func(f"\n正在生成报告文件: {output_file_path}")
+    try:
+        # 在写入前确保目录存在
+        output_dir = os.path.dirname(output_file_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        writer, ext = REPORT_WRITERS[report_format or get_report_format(output_file_path)]
+        writer(stats, output_file_path, top_n)
+            
+        log_func(f"\n分析完成！统计信息已成功保存到文件：\n{output_file_path}")
+        if notify_func:
+            notify_func('info', "成功", f"分析完成！\n报告已保存到:\n{output_file_path}")
+        return True
+
+    except Exception as e:
+        log_func(f"写入统计文件时发生严重错误: {e}")
+        if notify_func:
+            notify_func('error', "错误", f"写入报告文件时发生错误:\n{e}")
+        return False
+
+# 并行扫描时每个任务处理的文件数
+SCAN_BATCH_SIZE = 64
+
+# 流式读取文件时每块的字节数，单个文件的内存占用不会超过该值的数倍
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 流水线模式下默认的预读文件数 (队列深度) 和读取线程数
+PIPELINE_DEPTH = 16
+PIPELINE_IO_THREADS = 4
+# 不超过该大小的文件由读取线程整个预读；更大的文件在统计时再逐块读取 (同时预读下一块)，以限制预读占用的内存
+PIPELINE_PREFETCH_LIMIT = 4 * READ_CHUNK_SIZE
+
+class BinaryFileError(Exception):
+    """文件内容被判断为二进制数据，不进行统计。"""
+
+def iter_file_blocks(file_path, chunk_size=READ_CHUNK_SIZE):
+    """按固定大小分块读取文件的原始字节。"""
+    with open(file_path, 'rb') as file:
+        while True:
+            block = file.read(chunk_size)
+            if not block:
+                break
+            yield block
+
+def iter_file_chunks(file_path, chunk_size=READ_CHUNK_SIZE, encoding='utf-8', fallback_encodings=(),
+                     skip_binary=False, blocks=None):
+    """
+    按固定大小分块读取文件，并用增量解码器逐块解码为文本。
+    跨块的多字节序列和 CRLF 换行都会被正确处理，使用默认参数时结果与
+    open(file_path, 'r', encoding='utf-8', errors='replace').read() 完全一致。
+    encoding 为 'auto' 时根据第一块内容检测编码，参见 detect_encoding。
+    skip_binary 为 True 时，第一块内容看起来是二进制数据则抛出 BinaryFileError，不再读取后续内容。
+    blocks 为已经读取好的原始字节块 (流水线模式下由读取线程预读)，提供时不再打开文件。
+    """
+    if blocks is None:
+        blocks = iter_file_blocks(file_path, chunk_size)
+    blocks = iter(blocks)
+    block = next(blocks, b'')
+    if skip_binary and is_binary_block(block, encoding):
+        raise BinaryFileError("文件内容为二进制数据")
+    if encoding == 'auto':
+        encoding = detect_encoding(block, fallback_encodings)
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(encoding)(errors='replace'), translate=True)
+    while block:
+        text = decoder.decode(block)
+        if text:
+            yield text
+        block = next(blocks, b'')
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def read_and_count_file(file_path, stats, timings=None, rules=None, encoding=None, blocks=None):
+    """
+    流式读取单个文件，并将其内容逐块累加到统计数据中。
+    提供 timings (Counter) 时，读取解码和字符统计的耗时分别累加到 timings['read'] 和 timings['count']。
+    rules (ScanRules) 提供备选编码和是否跳过二进制文件；encoding 为 None 时使用 rules 的默认编码。
+    blocks 为预读好的原始字节块，参见 iter_file_chunks。
+    rules.extract 为 True 且文件是源代码时，只统计其中用户可见的文本，提取耗时累加到 timings['extract']。
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+    chunks = iter_file_chunks(file_path, encoding=encoding or rules.encoding,
+                              fallback_encodings=rules.fallback_encodings, skip_binary=rules.skip_binary,
+                              blocks=blocks)
+    kind = rules.get_extractor(os.path.basename(file_path))
+    extractor = make_extractor(kind) if kind else None
+    if timings is None:
+        for content in chunks:
+            stats.update(extractor.feed(content) if extractor else content)
+        if extractor:
+            stats.update(extractor.feed('', final=True))
+        return
+
+    while True:
+        start = time.perf_counter()
+        content = next(chunks, None)
+        read_end = time.perf_counter()
+        timings['read'] += read_end - start
+        if extractor:
+            # 文件读完后还要处理提取器中剩余的文本
+            final = content is None
+            content = extractor.feed(content or '', final)
+            extract_end = time.perf_counter()
+            timings['extract'] += extract_end - read_end
+            read_end = extract_end
+            if final:
+                stats.update(content)
+                timings['count'] += time.perf_counter() - read_end
+                break
+        if content is None:
+            break
+        stats.update(content)
+        timings['count'] += time.perf_counter() - read_end
+
+# ==============================================================================
+# 源代码文本提取
+# ==============================================================================
+
+# 扩展名 -> 提取器名称。ScanRules.extract 为 True 时，这些文件只统计用户可见的文本 (字符串、对白)，
+# 不统计代码、标识符和注释；其他文件 (如 .txt) 仍然统计全部内容
+SOURCE_EXTRACTORS = {
+    '.rpy': 'renpy',
+    '.rpym': 'renpy',
+    '.py': 'python',
+    '.js': 'javascript',
+    '.css': 'css',
+}
+
+# 各语言的注释和字符串。字符串或注释到文本末尾仍未结束时以 \Z 结束，由 TokenExtractor 等待下一块文本。
+# Python 的原始字符串 (r"...") 不还原转义序列，f-string 和 JavaScript 模板字符串去掉其中的表达式。
+# JavaScript 的正则表达式字面量只在前面是运算符、括号或 return 等关键字 (即此处应是操作数) 时识别，
+# 连同前面的这个符号一起匹配，避免把 /["']/ 中的引号当作字符串的开头
+_SINGLE_LINE_STRINGS = r"""
+    '(?:[^'\\\n]|\\[\s\S])*(?:'|(?=\n)|\\?\Z)
+  | "(?:[^"\\\n]|\\[\s\S])*(?:"|(?=\n)|\\?\Z)
+"""
+PYTHON_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>\#[^\n]*)
+  | (?P<string>(?P<prefix>\b(?:[rR][bBfF]?|[bBfF][rR]|[fF]))?(?:'''[\s\S]*?(?:'''|\Z) | \"\"\"[\s\S]*?(?:\"\"\"|\Z) | """ + _SINGLE_LINE_STRINGS + r"""))
+""", re.VERBOSE)
+JAVASCRIPT_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))
+  | (?P<string>`(?:[^`\\]|\\[\s\S])*(?:`|\\?\Z) | """ + _SINGLE_LINE_STRINGS + r""")
+  | (?P<regex>(?:[(,=:\[!&|?{};+\-*%<>~^]|\b(?:return|typeof|case|do|else|in|of|new|delete|void|throw|yield|await))
+        \s*/(?![*/])(?:[^/\\\n\[]|\\.|\[(?:[^\]\\\n]|\\.)*(?:\]|\Z))*(?:/[a-zA-Z]*|\\?\Z))
+""", re.VERBOSE)
+CSS_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>/\*[\s\S]*?(?:\*/|\Z))
+  | (?P<string>""" + _SINGLE_LINE_STRINGS + r""")
+""", re.VERBOSE)
+# TokenExtractor 在文本块末尾没有 token 时，除行尾空白外至少保留的字符数，
+# 覆盖 r"、// 的开头以及正则表达式字面量前的 return 等关键字
+TOKEN_CONTEXT_SIZE = 8
+
+# Python/JavaScript 字符串中的转义序列
+SCRIPT_ESCAPE_PATTERN = re.compile(
+    r'\\(?:u\{([0-9a-fA-F]{1,6})\}|u([0-9a-fA-F]{4})|U([0-9a-fA-F]{8})|x([0-9a-fA-F]{2})|N\{[^}\n]*\}|([\s\S]))')
+# CSS 字符串中的转义序列，如 "\201C"
+CSS_ESCAPE_PATTERN = re.compile(r'\\(?:([0-9a-fA-F]{1,6})[ \t\n]?|([\s\S]))')
+SIMPLE_ESCAPES = {'n': '\n', 't': '\t', 'r': '', '\n': '', '0': ''}
+# f-string 中的表达式 {name}、{value:>{width}}，以及表示花括号本身的 {{ }}
+FSTRING_FIELD_PATTERN = re.compile(r'\{\{|\}\}|\{(?:[^{}]|\{[^{}]*\})*\}')
+# JavaScript 模板字符串中的表达式 ${name}，转义的 \${ 不是表达式
+TEMPLATE_FIELD_PATTERN = re.compile(r'\\[\s\S]|\$\{(?:[^{}]|\{[^{}]*\})*\}')
+
+# Ren'Py：这些函数的字符串参数会显示给玩家 (翻译函数和角色名)
+RENPY_VISIBLE_CALL = re.compile(r'(?:\b_{1,2}p?|\bCharacter)\(\s*$')
+# Ren'Py：行首只有标识符 (角色名、图像属性或屏幕语言的关键字) 或作为说话人的字符串 (如 "Eileen" "你好") 时，
+# 其后的字符串为对白、菜单选项或界面文字
+RENPY_SAY_PREFIX = re.compile(r"""^\s*(?:(?:([A-Za-z_][\w.]*)|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+                                (?:\s+[A-Za-z_][\w.]*)*\s+)?$""", re.VERBOSE)
+# Ren'Py：这些语句后的字符串是文件名、图像、样式等，不会作为文字显示
+RENPY_HIDDEN_STATEMENTS = frozenset((
+    'add', 'at', 'background', 'call', 'camera', 'default', 'define', 'expression', 'font', 'foreground',
+    'hide', 'hover', 'idle', 'image', 'init', 'insensitive', 'jump', 'key', 'layer', 'music', 'old', 'play',
+    'python', 'queue', 'scene', 'selected_hover', 'selected_idle', 'show', 'sound', 'stop', 'style',
+    'style_prefix', 'transform', 'use', 'voice', 'with',
+))
+# Ren'Py 文本标签 {b}、插值 [name] 和转义的 {{ [[
+RENPY_MARKUP_PATTERN = re.compile(r'\{\{|\[\[|\{[^{}]*\}|\[[^\[\]]*\]')
+
+def strip_quotes(token):
+    """去掉字符串字面量两端的引号 (包括三引号)，未闭合的字符串只去掉开头的引号。"""
+    quote = token[:3] if token[:3] in ("'''", '"""') else token[0]
+    body = token[len(quote):]
+    if body.endswith(quote) and len(body) >= len(quote):
+        body = body[:-len(quote)]
+    return body
+
+def _code_to_char(code):
+    return chr(code) if code <= 0x10FFFF and not 0xD800 <= code <= 0xDFFF else ''
+
+def unescape_script_string(text):
+    """还原 Python/JavaScript 字符串中的常见转义序列。"""
+    if '\\' not in text:
+        return text
+
+    def replace(m):
+        hex_code = m.group(1) or m.group(2) or m.group(3) or m.group(4)
+        if hex_code:
+            return _code_to_char(int(hex_code, 16))
+        char = m.group(5)
+        if char is None:
+            return ''  # \N{...}
+        return SIMPLE_ESCAPES.get(char, char)
+    return SCRIPT_ESCAPE_PATTERN.sub(replace, text)
+
+def unescape_css_string(text):
+    """还原 CSS 字符串中的转义序列。"""
+    if '\\' not in text:
+        return text
+
+    def replace(m):
+        if m.group(1):
+            return _code_to_char(int(m.group(1), 16))
+        # 其他字符转义后就是字符本身，反斜杠加换行表示续行
+        return '' if m.group(2) == '\n' else m.group(2)
+    return CSS_ESCAPE_PATTERN.sub(replace, text)
+
+def get_string_text(match):
+    """返回字符串字面量的内容，原始字符串保留反斜杠，f-string 和模板字符串去掉其中的表达式。"""
+    token = match.group('string')
+    prefix = (match.groupdict().get('prefix') or '').lower()
+    text = strip_quotes(token[len(prefix):])
+    if 'f' in prefix:
+        text = FSTRING_FIELD_PATTERN.sub(lambda m: m.group()[0] if m.group() in ('{{', '}}') else '', text)
+    elif token.startswith('`'):
+        text = TEMPLATE_FIELD_PATTERN.sub(lambda m: m.group() if m.group().startswith('\\') else '', text)
+    if 'r' in prefix:
+        return text
+    return unescape_script_string(text)
+
+def extract_script_string(match, line_prefix):
+    """Python/JavaScript：统计所有字符串字面量。"""
+    if match.lastgroup != 'string':
+        return None
+    return get_string_text(match)
+
+def extract_css_string(match, line_prefix):
+    """CSS：统计属性值中的字符串 (如 content、quotes)。"""
+    if match.lastgroup != 'string':
+        return None
+    return unescape_css_string(strip_quotes(match.group()))
+
+def extract_renpy_string(match, line_prefix):
+    """Ren'Py：只统计对白、菜单选项、界面文字、角色名和 _() 中的字符串，去掉文本标签和插值。"""
+    if match.lastgroup != 'string':
+        return None
+    if not RENPY_VISIBLE_CALL.search(line_prefix):
+        say = RENPY_SAY_PREFIX.match(line_prefix)
+        if say is None or (say.group(1) or '') in RENPY_HIDDEN_STATEMENTS:
+            return None
+    text = get_string_text(match)
+    return RENPY_MARKUP_PATTERN.sub(lambda m: m.group()[0] if m.group() in ('{{', '[[') else '', text)
+
+class TokenExtractor:
+    """
+    逐块提取源代码中需要统计的文本，不做完整的语法分析。
+    token_pattern 匹配注释和字符串，handler(匹配对象, 同一行中该 token 之前的内容) 返回要统计的文本，
+    不统计时返回 None。跨越文本块的 token 会保留到下一块一起处理 (需要行前缀时从该行开头保留)，
+    因此分块处理的结果与一次处理整个文件相同。
+    """
+
+    def __init__(self, token_pattern, handler, needs_prefix=False):
+        self.token_pattern = token_pattern
+        self.handler = handler
+        self.needs_prefix = needs_prefix
+        # 上一块中未处理完的文本，以及其中继续查找 token 的位置
+        self.carry = ''
+        self.resume = 0
+
+    def feed(self, text, final=False):
+        """处理一块文本，返回其中提取出的文本；final 为 True 时处理剩余的所有内容。"""
+        buffer = self.carry + text if self.carry else text
+        pos = self.resume
+        pieces = []
+        while True:
+            match = self.token_pattern.search(buffer, pos)
+            if match is None:
+                # 最后几个字符可能是跨块的注释开头 (如 "//" 的第一个 "/")、字符串前缀 (如 r"...")
+                # 或正则表达式字面量之前的符号，这些符号与下一块之间可能还有空白
+                keep_from = max(pos, min(len(buffer) - 3, len(buffer.rstrip()) - TOKEN_CONTEXT_SIZE))
+                break
+            if match.end() == len(buffer) and not final:
+                keep_from = match.start()
+                break
+            line_prefix = ''
+            if self.needs_prefix:
+                line_prefix = buffer[buffer.rfind('\n', 0, match.start()) + 1:match.start()]
+            piece = self.handler(match, line_prefix)
+            if piece:
+                pieces.append(piece)
+            pos = match.end()
+
+        if final:
+            self.carry = ''
+            self.resume = 0
+        else:
+            # 多保留一个字符，使下一块中 \b 等判断与一次处理整个文件时相同
+            start = buffer.rfind('\n', 0, keep_from) + 1 if self.needs_prefix else max(keep_from - 1, 0)
+            self.carry = buffer[start:]
+            self.resume = keep_from - start
+        return "".join(pieces)
+
+def make_extractor(kind):
+    """根据 SOURCE_EXTRACTORS 中的提取器名称创建 TokenExtractor。"""
+    if kind == 'renpy':
+        return TokenExtractor(PYTHON_TOKEN_PATTERN, extract_renpy_string, needs_prefix=True)
+    if kind == 'python':
+        return TokenExtractor(PYTHON_TOKEN_PATTERN, extract_script_string)
+    if kind == 'javascript':
+        return TokenExtractor(JAVASCRIPT_TOKEN_PATTERN, extract_script_string)
+    if kind == 'css':
+        return TokenExtractor(CSS_TOKEN_PATTERN, extract_css_string)
+    raise ValueError(f"未知的提取器: {kind}")
+
+# ==============================================================================
+# 扫描规则
+# ==============================================================================
+
+# 默认统计的文件类型
+DEFAULT_TARGET_EXTENSIONS = ('.css', '.py', '.rpy', '.txt', '.rpym', '.sh', '.js')
+# 这是排除列表，也就是黑名单。
+DEFAULT_EXCLUDED_FILES = ('emoji_trie.py',)
+# 默认跳过的目录 (glob 规则)，这些目录中不会有需要统计的文件
+DEFAULT_EXCLUDED_DIRS = ('.git', '.svn', '.hg', 'node_modules', '__pycache__')
+# encoding 为 'auto' 且内容不是有效的 UTF-8 时，尝试的编码 (选择解码结果最像正常文本的一个)
+DEFAULT_FALLBACK_ENCODINGS = ('gb18030', 'shift_jis', 'big5')
+# 自动检测编码时，用于给各候选编码的解码结果打分的样本大小 (字节)
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# 用于生成常用汉字表的双字节编码区：(编码, 首字节范围, 次字节列表)，
+# 分别为 GB2312 一级汉字、JIS X 0208 第一水准汉字和 Big5 常用字
+COMMON_HANZI_BLOCKS = (
+    ('gb2312', range(0xB0, 0xD8), list(range(0xA1, 0xFF))),
+    ('shift_jis', range(0x88, 0x99), list(range(0x40, 0x7F)) + list(range(0x80, 0xFD))),
+    ('big5', range(0xA4, 0xC7), list(range(0x40, 0x7F)) + list(range(0xA1, 0xFF))),
+)
+
+# 在扫描目录或程序所在目录中自动查找的规则文件
+RULES_FILE_NAMES = ('wc_rules.toml', 'wc_rules.json')
+
+# 带 BOM 的 Unicode 编码，UTF-32 的 BOM 以 UTF-16 LE 的 BOM 开头，因此需要先判断
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 只有一个扩展名的文件规则，如 "*.txt"，可以直接按后缀匹配；"*.en.txt" 等多段扩展名仍使用 glob 匹配
+SUFFIX_PATTERN = re.compile(r'^\*(\.[^.*?\[\]/]+)$')
+
+def is_binary_block(block, encoding='utf-8'):
+    """根据文件开头的内容判断是否为二进制文件：含有 NUL 字节且不是 UTF-16/32 文本。"""
+    if b'\0' not in block:
+        return False
+    if encoding.lower().replace('_', '-').startswith(('utf-16', 'utf-32')):
+        return False
+    return not any(block.startswith(bom) for bom, name in BOM_ENCODINGS if name != 'utf-8-sig')
+
+def can_decode(block, encoding):
+    """判断 block 能否按 encoding 无错误地解码。末尾被分块截断的多字节字符不算错误。"""
+    for cut in range(4):
+        if cut >= len(block) and cut > 0:
+            break
+        try:
+            block[:len(block) - cut].decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        return True
+    return False
+
+@functools.lru_cache(maxsize=None)
+def get_common_chars():
+    """
+    返回正常文本中常见的字符：ASCII、Latin-1 字母、CJK 标点、假名、全角字符、谚文音节，
+    以及 COMMON_HANZI_BLOCKS 中的常用汉字。
+    """
+    chars = set(map(chr, (0x09, 0x0A, 0x0D, *range(0x20, 0x7F), *range(0xA0, 0x100),
+                          *range(0x3000, 0x3100), *range(0xFF01, 0xFF5F), *range(0xAC00, 0xD7A4))))
+    for encoding, lead_bytes, trail_bytes in COMMON_HANZI_BLOCKS:
+        for lead in lead_bytes:
+            for trail in trail_bytes:
+                try:
+                    chars.add(bytes((lead, trail)).decode(encoding))
+                except UnicodeDecodeError:
+                    continue
+    return frozenset(chars)
+
+def score_decoded_text(text):
+    """返回 text 中常见字符 (见 get_common_chars) 所占的比例，用于判断解码结果是否像正常文本。"""
+    if not text:
+        return 0.0
+    return sum(map(get_common_chars().__contains__, text)) / len(text)
+
+def detect_encoding(block, fallback_encodings=DEFAULT_FALLBACK_ENCODINGS):
+    """
+    根据文件开头的内容检测编码：优先识别 BOM，其次是 UTF-8。
+    不是有效的 UTF-8 时，在 fallback_encodings 中能无错误解码的编码里选择解码结果中常见字符比例最高的一个
+    (相同时取靠前的)。GB18030 几乎能解码任何字节序列，只取第一个能解码的编码会把 Shift-JIS、
+    Big5 文件误认为 GB18030。都无法解码时按 UTF-8 处理 (无效字节替换为替换字符)。
+    这只是启发式的判断，很短的文件仍可能判断错误，此时请在规则文件的 encodings 中为它们指定编码。
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if block.startswith(bom):
+            return encoding
+    if can_decode(block, 'utf-8'):
+        return 'utf-8'
+    sample = block[:ENCODING_SAMPLE_SIZE]
+    best_encoding, best_score = 'utf-8', -1.0
+    for encoding in fallback_encodings:
+        if not can_decode(block, encoding):
+            continue
+        score = score_decoded_text(sample.decode(encoding, 'ignore'))
+        if score > best_score:
+            best_encoding, best_score = encoding, score
+    return best_encoding
+
+def compile_patterns(patterns):
+    """将 glob 规则编译为一个不区分大小写的正则表达式，没有规则时返回 None。"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern.lower()) for pattern in patterns))
+
+def match_rule(pattern, name, rel_path):
+    """不含 '/' 的规则匹配名称，含 '/' 的规则匹配相对路径。name 和 rel_path 均为小写。"""
+    return pattern is not None and bool(pattern.match(name) or pattern.match(rel_path))
+
+class ScanRules:
+    """
+    扫描规则：要统计的文件、要排除的文件和目录、文件编码以及是否跳过二进制文件。
+    所有 glob 规则都不区分大小写，既可以匹配文件名 (目录名)，也可以匹配相对于扫描目录、
+    以 '/' 分隔的路径。encodings 为 {glob: 编码} 形式的逐文件编码，按顺序取第一个匹配的规则，
+    都不匹配时使用 encoding；encoding 为 'auto' 时根据文件开头的内容检测编码。
+    extract 为 True 时，源代码文件 (见 SOURCE_EXTRACTORS) 只统计字符串、对白等用户可见的文本。
+    """
+
+    def __init__(self, include=None, exclude=None, exclude_dirs=None, encoding='utf-8', encodings=None,
+                 fallback_encodings=None, skip_binary=False, extract=False):
+        self.include = list(include if include is not None else ['*' + ext for ext in DEFAULT_TARGET_EXTENSIONS])
+        self.exclude = list(exclude if exclude is not None else DEFAULT_EXCLUDED_FILES)
+        self.exclude_dirs = list(exclude_dirs if exclude_dirs is not None else DEFAULT_EXCLUDED_DIRS)
+        self.encoding = encoding
+        self.encodings = dict(encodings or {})
+        self.fallback_encodings = tuple(fallback_encodings if fallback_encodings is not None
+                                        else DEFAULT_FALLBACK_ENCODINGS)
+        self.skip_binary = skip_binary
+        self.extract = extract
+        for name in (encoding, *self.encodings.values(), *self.fallback_encodings):
+            if name != 'auto':
+                try:
+                    codecs.lookup(name)
+                except LookupError:
+                    raise ValueError(f"未知的编码: {name}")
+        self._compile()
+
+    def _compile(self):
+        # 只有扩展名的规则按后缀集合匹配，其他规则合并为一个正则表达式
+        suffixes = [SUFFIX_PATTERN.match(pattern) for pattern in self.include]
+        self._include_suffixes = frozenset(m.group(1).lower() for m in suffixes if m)
+        self._include_pattern = compile_patterns([p for p, m in zip(self.include, suffixes) if not m])
+        # 不含通配符的排除规则按文件名集合匹配
+        plain = [p for p in self.exclude if not any(c in p for c in '*?[/')]
+        self._exclude_names = frozenset(p.lower() for p in plain)
+        self._exclude_pattern = compile_patterns([p for p in self.exclude if p not in plain])
+        self._dir_pattern = compile_patterns(self.exclude_dirs)
+        self._encoding_patterns = [(compile_patterns([pattern]), encoding)
+                                   for pattern, encoding in self.encodings.items()]
+
+    @classmethod
+    def from_dict(cls, data):
+        """从规则文件的内容创建规则，缺少的项使用默认值。"""
+        keys = ('include', 'exclude', 'exclude_dirs', 'encoding', 'encodings', 'fallback_encodings',
+                'skip_binary', 'extract')
+        unknown = set(data) - set(keys)
+        if unknown:
+            raise ValueError(f"未知的规则项: {', '.join(sorted(unknown))}")
+        for key in ('include', 'exclude', 'exclude_dirs', 'fallback_encodings'):
+            if key in data and not isinstance(data[key], list):
+                raise ValueError(f"规则项 {key} 必须是列表")
+        if 'encodings' in data and not isinstance(data['encodings'], dict):
+            raise ValueError("规则项 encodings 必须是 {glob: 编码} 形式的表")
+        return cls(**data)
+
+    @classmethod
+    def load(cls, path):
+        """读取 JSON 或 TOML (需要 Python 3.11 及以上版本) 格式的规则文件。"""
+        if path.lower().endswith('.toml'):
+            if not TOMLLIB_AVAILABLE:
+                raise ValueError("读取 TOML 规则文件需要 Python 3.11 或更高版本，请改用 JSON 格式。")
+            with open(path, 'rb') as file:
+                data = tomllib.load(file)
+        else:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        return cls.from_dict(data)
+
+    def to_dict(self):
+        return {
+            'include': self.include,
+            'exclude': self.exclude,
+            'exclude_dirs': self.exclude_dirs,
+            'encoding': self.encoding,
+            'encodings': self.encodings,
+            'fallback_encodings': list(self.fallback_encodings),
+            'skip_binary': self.skip_binary,
+            'extract': self.extract,
+        }
+
+    def match_file(self, name, rel_path):
+        """判断文件是否需要统计：返回 True (统计)、False (按规则排除) 或 None (类型不匹配)。"""
+        name = name.lower()
+        rel_path = rel_path.lower()
+        if name in self._exclude_names or match_rule(self._exclude_pattern, name, rel_path):
+            return False
+        if name[name.rfind('.'):] in self._include_suffixes or match_rule(self._include_pattern, name, rel_path):
+            return True
+        return None
+
+    def match_dir(self, name, rel_path):
+        """判断目录是否按规则跳过。"""
+        return match_rule(self._dir_pattern, name.lower(), rel_path.lower())
+
+    def get_encoding(self, name, rel_path):
+        """返回文件使用的编码。"""
+        if self._encoding_patterns:
+            name = name.lower()
+            rel_path = rel_path.lower()
+            for pattern, encoding in self._encoding_patterns:
+                if match_rule(pattern, name, rel_path):
+                    return encoding
+        return self.encoding
+
+    def get_extractor(self, name):
+        """返回文件使用的文本提取器名称 (见 SOURCE_EXTRACTORS)，统计全部内容时返回 None。"""
+        if not self.extract:
+            return None
+        return SOURCE_EXTRACTORS.get(os.path.splitext(name)[1].lower())
+
+    def log_rules(self, log_func):
+        """输出本次使用的规则。"""
+        if all(SUFFIX_PATTERN.match(pattern) for pattern in self.include):
+            log_func(f"将查找以下类型的文件: {', '.join(pattern[1:] for pattern in self.include)}")
+        else:
+            log_func(f"将查找以下文件: {', '.join(self.include)}")
+        log_func(f"将排除以下文件: {', '.join(self.exclude)}")
+        log_func(f"将跳过以下目录: {', '.join(self.exclude_dirs) or '无'}")
+        if self.encoding != 'utf-8' or self.encodings:
+            encoding = self.encoding
+            if encoding == 'auto':
+                encoding = f"自动检测 (备选: {', '.join(self.fallback_encodings)})"
+            log_func(f"文件编码: {encoding}")
+            for pattern, name in self.encodings.items():
+                log_func(f"  {pattern}: {name}")
+        if self.skip_binary:
+            log_func("将跳过二进制文件。")
+        if self.extract:
+            log_func(f"源代码文件只统计字符串和对白: {', '.join(SOURCE_EXTRACTORS)}")
+
+DEFAULT_RULES = ScanRules()
+
+def find_rules_file(target_path):
+    """在扫描目录和程序所在目录中查找规则文件，找不到时返回 None。"""
+    search_dirs = []
+    if os.path.isdir(target_path):
+        search_dirs.append(target_path)
+    search_dirs.append(os.path.dirname(os.path.abspath(sys.argv[0])))
+    for directory in search_dirs:
+        for filename in RULES_FILE_NAMES:
+            path = os.path.join(directory, filename)
+            if os.path.isfile(path):
+                return path
+    return None
+
+# ==============================================================================
+# 运行指标与进度
+# ==============================================================================
+
+# 进度回调的最小间隔 (秒)，避免过于频繁地刷新界面
+PROGRESS_INTERVAL = 0.1
+
+# 各阶段在日志中显示的名称
+PHASE_NAMES = {
+    'walk': "遍历目录",
+    'cache': "缓存读写",
+    'read': "读取文件",
+    'extract': "提取文本",
+    'count': "字符统计",
+    'report': "生成报告",
+    'subset': "字体瘦身",
+}
+
+def format_duration(seconds):
+    """将秒数格式化为便于阅读的时长。"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分"
+
+class RunMetrics:
+    """
+    记录一次分析或瘦身的各阶段耗时和处理量。
+    开始处理前通过 set_total 设置预扫描得到的总量，之后每完成一项调用 advance，
+    即可得到进度百分比和预计剩余时间。
+    progress_func(已完成比例, 预计剩余秒数) 在进度变化时调用，最多每 PROGRESS_INTERVAL 秒一次；
+    剩余时间无法估计时为 None。
+    """
+
+    def __init__(self, progress_func=None):
+        self.progress_func = progress_func
+        self.start_time = time.perf_counter()
+        # 阶段名 -> 累计耗时 (秒)。并行处理时 read 和 count 为所有子进程的耗时之和
+        self.phases = {}
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done_files = 0
+        self.done_bytes = 0
+        # 命中缓存、跳过、出错等计数
+        self.counters = Counter()
+        # 每个字体的瘦身记录
+        self.fonts = []
+        self._progress_start = self.start_time
+        self._last_progress = 0.0
+
+    @contextmanager
+    def phase(self, name):
+        """将 with 语句块的耗时计入 name 阶段。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def timed_iter(self, name, iterable):
+        """逐项迭代 iterable，并将每次取出下一项的耗时计入 name 阶段。"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def set_total(self, files, total_bytes=0):
+        """设置本次需要处理的总量，并从此刻开始计算速度和剩余时间。"""
+        self.total_files = files
+        self.total_bytes = total_bytes
+        self.done_files = 0
+        self.done_bytes = 0
+        self._progress_start = time.perf_counter()
+        self._report_progress(force=True)
+
+    def advance(self, files=1, nbytes=0):
+        """记录完成了 files 个文件 (共 nbytes 字节)。"""
+        self.done_files += files
+        self.done_bytes += nbytes
+        self._report_progress(force=self.done_files >= self.total_files)
+
+    def fraction(self):
+        """返回已完成的比例。总字节数已知时按字节计算，否则按文件数计算。"""
+        if self.total_bytes > 0:
+            return min(1.0, self.done_bytes / self.total_bytes)
+        if self.total_files > 0:
+            return min(1.0, self.done_files / self.total_files)
+        return 0.0
+
+    def eta(self):
+        """根据目前的平均速度估算剩余秒数，尚无法估计时返回 None。"""
+        fraction = self.fraction()
+        if fraction <= 0:
+            return None
+        elapsed = time.perf_counter() - self._progress_start
+        return elapsed / fraction * (1 - fraction)
+
+    def _report_progress(self, force=False):
+        if not self.progress_func:
+            return
+        now = time.perf_counter()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self.progress_func(self.fraction(), self.eta())
+
+    def record_font(self, font_path, output_path, success, seconds):
+        """记录单个字体的瘦身结果和耗时。"""
+        original_size = os.path.getsize(font_path) if os.path.isfile(font_path) else None
+        output_size = subset_size = transfer_size = None
+        if success and os.path.isfile(output_path):
+            output_size = os.path.getsize(output_path)
+            subset_size, transfer_size, _ = get_subset_sizes(output_path)
+        self.fonts.append({
+            'font': font_path,
+            'output': output_path,
+            'success': success,
+            'seconds': round(seconds, 4),
+            'original_size': original_size,
+            'output_size': output_size,
+            # 未压缩的字体大小和实际传输的大小 (WOFF/WOFF2 文件本身，或按 gzip 压缩估算)
+            'subset_size': subset_size,
+            'transfer_size': transfer_size,
+        })
+
+    def to_dict(self):
+        """返回可序列化为 JSON 的指标数据。"""
+        elapsed = time.perf_counter() - self.start_time
+        processing = time.perf_counter() - self._progress_start
+        return {
+            'elapsed': round(elapsed, 4),
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'files': self.done_files,
+            'bytes': self.done_bytes,
+            'files_per_sec': round(self.done_files / processing, 2) if processing > 0 else None,
+            'mb_per_sec': round(self.done_bytes / processing / 1024 / 1024, 3) if processing > 0 else None,
+            'counters': dict(self.counters),
+            'fonts': self.fonts,
+        }
+
+    def log_summary(self, log_func):
+        """输出各阶段耗时和平均处理速度。"""
+        data = self.to_dict()
+        parts = [f"总计 {data['elapsed']:.3f} 秒"]
+        for name, seconds in data['phases'].items():
+            parts.append(f"{PHASE_NAMES.get(name, name)} {seconds:.3f} 秒")
+        log_func("\n耗时统计: " + " | ".join(parts))
+        if data['files'] and data['files_per_sec'] is not None:
+            log_func(f"共处理 {data['files']} 个文件 ({data['bytes'] / 1024 / 1024:.2f} MB)，"
+                     f"平均 {data['files_per_sec']:.1f} 个文件/秒，{data['mb_per_sec']:.2f} MB/秒。")
+
+# ==============================================================================
+# 字符来源索引
+# ==============================================================================
+
+# 字符来源索引文件的文件头和版本
+CHAR_INDEX_MAGIC = b'WCIX'
+CHAR_INDEX_VERSION = 1
+# 查询行号时每个文件最多列出的行数
+CHAR_LINES_LIMIT = 20
+
+def get_index_path(output_file_path):
+    """返回与报告文件放在一起的字符来源索引路径。"""
+    return os.path.splitext(output_file_path)[0] + ".index.wcix"
+
+class CharIndex:
+    """
+    字符来源的倒排索引：码位 -> 包含该字符的文件。
+    每个文件路径只保存一次并以编号引用，每个码位的文件编号按扫描顺序保存在 array('I') 中，
+    每个 (字符, 文件) 对只占 4 字节，内存占用与文本总量无关。
+    行号不保存在索引中，查询时再读取对应的文件 (见 find_char_lines)。
+    """
+
+    def __init__(self):
+        # 文件编号 -> 文件路径
+        self.paths = []
+        # 码位 -> 文件编号数组
+        self.postings = {}
+
+    def add_file(self, file_path, characters):
+        """记录一个文件中出现的字符，characters 为字符组成的可迭代对象 (如 CharStats.char_counts)。"""
+        file_id = len(self.paths)
+        self.paths.append(file_path)
+        postings = self.postings
+        for char in characters:
+            code = ord(char)
+            file_ids = postings.get(code)
+            if file_ids is None:
+                file_ids = postings[code] = array('I')
+            file_ids.append(file_id)
+
+    def files(self, char):
+        """返回包含该字符的文件路径列表 (按扫描顺序)。"""
+        return [self.paths[file_id] for file_id in self.postings.get(ord(char), ())]
+
+    def rare_chars(self, max_files=1):
+        """返回最多出现在 max_files 个文件中的字符，按文件数和码位排序：[(字符, 文件路径列表)]。"""
+        rare = sorted((len(file_ids), code) for code, file_ids in self.postings.items() if len(file_ids) <= max_files)
+        return [(chr(code), self.files(chr(code))) for count, code in rare]
+
+    def __len__(self):
+        return len(self.postings)
+
+    def save(self, path):
+        """
+        保存为二进制文件 (小端序)：文件头 "WCIX"、版本 (uint16)、文件数 (uint32)、字符数 (uint32)，
+        之后是每个文件的 路径长度 (uint32) 和 UTF-8 路径、所有码位 (uint32 数组)、
+        每个码位的文件数 (uint32 数组)，最后是按码位顺序连接的文件编号 (uint32 数组)。
+        """
+        codes = array('I', sorted(self.postings))
+        lengths = array('I', (len(self.postings[code]) for code in codes))
+        file_ids = array('I')
+        for code in codes:
+            file_ids.extend(self.postings[code])
+        if sys.byteorder != 'little':
+            for values in (codes, lengths, file_ids):
+                values.byteswap()
+        with open(path, 'wb') as file:
+            file.write(CHAR_INDEX_MAGIC)
+            file.write(struct.pack('<HII', CHAR_INDEX_VERSION, len(self.paths), len(codes)))
+            for file_path in self.paths:
+                path_bytes = file_path.encode('utf-8', 'surrogateescape')
+                file.write(struct.pack('<I', len(path_bytes)))
+                file.write(path_bytes)
+            file.write(codes.tobytes())
+            file.write(lengths.tobytes())
+            file.write(file_ids.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """读取 save 保存的文件。"""
+        index = cls()
+        with open(path, 'rb') as file:
+            if file.read(4) != CHAR_INDEX_MAGIC:
+                raise ValueError("不是字符来源索引文件")
+            version, path_count, code_count = struct.unpack('<HII', file.read(struct.calcsize('<HII')))
+            if version != CHAR_INDEX_VERSION:
+                raise ValueError(f"不支持的字符来源索引版本: {version}")
+            for _ in range(path_count):
+                (length,) = struct.unpack('<I', file.read(4))
+                index.paths.append(file.read(length).decode('utf-8', 'surrogateescape'))
+            codes = array('I')
+            codes.frombytes(file.read(code_count * codes.itemsize))
+            lengths = array('I')
+            lengths.frombytes(file.read(code_count * lengths.itemsize))
+            file_ids = array('I')
+            file_ids.frombytes(file.read())
+        if sys.byteorder != 'little':
+            for values in (codes, lengths, file_ids):
+                values.byteswap()
+        if len(codes) != code_count or len(lengths) != code_count or len(file_ids) != sum(lengths):
+            raise ValueError("字符来源索引文件不完整")
+        offset = 0
+        for code, length in zip(codes, lengths):
+            index.postings[code] = file_ids[offset:offset + length]
+            offset += length
+        return index
+
+def save_char_index(index, index_path, log_func):
+    """保存字符来源索引，失败时只输出警告。"""
+    try:
+        index.save(index_path)
+    except OSError as e:
+        log_func(f"  -> 警告: 无法保存字符来源索引 '{index_path}': {e}")
+        return
+    log_func(f"字符来源索引已保存到: {index_path} ({len(index)} 个字符，{len(index.paths)} 个文件)")
+
+def find_char_lines(file_path, characters, encoding='auto', limit=CHAR_LINES_LIMIT):
+    """
+    在文件中查找包含 characters 中任一字符的行，返回 [(行号, 行内容)]，最多 limit 行。
+    encoding 为 'auto' 时自动检测编码，参见 detect_encoding。
+    """
+    lines = []
+    line_no = 1
+    pending = ''
+    for chunk in iter_file_chunks(file_path, encoding=encoding, fallback_encodings=DEFAULT_FALLBACK_ENCODINGS):
+        *complete, pending = (pending + chunk).split('\n')
+        for line in complete:
+            if any(char in line for char in characters):
+                lines.append((line_no, line))
+                if len(lines) >= limit:
+                    return lines
+            line_no += 1
+    if pending and any(char in pending for char in characters):
+        lines.append((line_no, pending))
+    return lines
+
+# ==============================================================================
+# 增量分析缓存
+# ==============================================================================
+
+# 缓存格式版本，修改统计规则或序列化格式时需要递增
+ANALYSIS_CACHE_VERSION = 2
+
+def get_cache_path(output_file_path):
+    """返回与报告文件放在一起的分析缓存路径。"""
+    return os.path.splitext(output_file_path)[0] + ".cache.db"
+
+class AnalysisCache:
+    """
+    基于 SQLite 的增量分析缓存。
+    以文件路径、大小和修改时间为键保存每个文件的统计数据，再次分析时只需重新读取有变化的文件。
+    扫描规则 (文件类型、排除列表) 发生变化时，旧的缓存会被整体清空。
+    """
+
+    def __init__(self, cache_path, rules):
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        # 本次扫描中查询过的文件，用于清理已删除文件的缓存
+        self.seen_paths = set()
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                          "mtime_ns INTEGER, data BLOB)")
+
+        rules_data = json.dumps([ANALYSIS_CACHE_VERSION, rules], sort_keys=True, ensure_ascii=False)
+        fingerprint = hashlib.sha1(rules_data.encode('utf-8')).hexdigest()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'rules'").fetchone()
+        self.invalidated = row is not None and row[0] != fingerprint
+        if row is None or self.invalidated:
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rules', ?)", (fingerprint,))
+
+    def lookup(self, file_path, size, mtime_ns):
+        """查找文件的缓存统计数据，文件未变化时返回 CharStats，否则返回 None。"""
+        self.seen_paths.add(file_path)
+        row = self.conn.execute("SELECT data FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                (file_path, size, mtime_ns)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CharStats.from_bytes(row[0])
+
+    def store(self, file_path, size, mtime_ns, stats):
+        """保存单个文件的统计数据。"""
+        self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, data) VALUES (?, ?, ?, ?)",
+                          (file_path, size, mtime_ns, stats.to_bytes()))
+
+    def prune(self):
+        """删除本次扫描中没有出现的文件的缓存，返回删除的条目数。"""
+        stale = [(path,) for (path,) in self.conn.execute("SELECT path FROM files")
+                 if path not in self.seen_paths]
+        self.conn.executemany("DELETE FROM files WHERE path = ?", stale)
+        return len(stale)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+def stat_key(file_path):
+    """返回用于缓存比对的 (大小, 修改时间)，文件无法访问时返回 None。"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def analyze_files(files, rules=None):
+    """
+    逐个统计一批文件，files 为 (文件路径, 编码) 列表。
+    返回 ({文件路径: CharStats}, {文件路径: 错误信息}, {阶段名: 耗时})；被判断为二进制的文件，错误信息为 BinaryFileError。
+    该函数可能在子进程中运行，因此只通过返回值报告结果，不直接输出日志。
+    """
+    results = {}
+    errors = {}
+    timings = Counter()
+    for file_path, encoding in files:
+        stats = CharStats()
+        try:
+            read_and_count_file(file_path, stats, timings, rules, encoding)
+        except Exception as e:
+            errors[file_path] = e
+        else:
+            results[file_path] = stats
+    return results, errors, timings
+
+def prefetch_file(file_path):
+    """在读取线程中预读整个文件，返回原始字节块列表。"""
+    return list(iter_file_blocks(file_path))
+
+def iter_blocks_read_ahead(file_path, reader):
+    """逐块读取文件，返回当前块的同时由 reader (线程池) 读取下一块。"""
+    blocks = iter_file_blocks(file_path)
+    future = reader.submit(next, blocks, None)
+    try:
+        while True:
+            block = future.result()
+            if block is None:
+                break
+            future = reader.submit(next, blocks, None)
+            yield block
+    finally:
+        # 提前结束时 (如二进制文件) 先等待正在进行的读取，再关闭文件
+        if not future.cancel():
+            try:
+                future.result()
+            except Exception:
+                pass
+        blocks.close()
+
+def analyze_prefetched(jobs, reader, rules=None):
+    """
+    与 analyze_files 相同，但 jobs 为 (文件路径, 编码, 预读任务) 列表。
+    预读任务为 None 的文件 (大文件) 在统计时由 reader 逐块预读；等待预读结果的时间计入 read 阶段。
+    """
+    results = {}
+    errors = {}
+    timings = Counter()
+    for file_path, encoding, future in jobs:
+        stats = CharStats()
+        try:
+            if future is not None:
+                start = time.perf_counter()
+                blocks = future.result()
+                timings['read'] += time.perf_counter() - start
+            else:
+                blocks = iter_blocks_read_ahead(file_path, reader)
+            read_and_count_file(file_path, stats, timings, rules, encoding, blocks)
+        except Exception as e:
+            errors[file_path] = e
+        else:
+            results[file_path] = stats
+    return results, errors, timings
+
+def iter_scan_entries(target_path, rules=None):
+    """
+    使用 os.scandir 遍历目录，按与 os.walk 相同的顺序逐个返回 (路径, 是否匹配, stat_key, 编码)。
+    需要统计的文件返回 True 并附带 stat_key 和编码；按规则 (ScanRules) 排除的文件和目录返回 False，
+    其中目录路径以路径分隔符结尾。类型不匹配的文件不返回。
+    被排除的目录整个都不会被遍历。这是一个生成器，调用方可以在遍历完成前就开始读取文件。
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+
+    # 用栈代替递归，子目录逆序入栈，保证先序遍历的顺序与 os.walk 一致
+    stack = [(target_path, '')]
+    while stack:
+        dir_path, rel_dir = stack.pop()
+        try:
+            with os.scandir(dir_path) as iterator:
+                dir_entries = list(iterator)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in dir_entries:
+            # 规则中的相对路径统一使用 '/' 分隔
+            rel_path = rel_dir + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if rules.match_dir(entry.name, rel_path):
+                    yield os.path.join(entry.path, ''), False, None, None
+                # 与 os.walk 一样，不进入指向目录的符号链接
+                elif not entry.is_symlink():
+                    subdirs.append((entry.path, rel_path + '/'))
+                continue
+
+            matched = rules.match_file(entry.name, rel_path)
+            if matched is False:
+                yield entry.path, False, None, None
+            elif matched:
+                # DirEntry 会缓存 stat 结果，Windows 下遍历目录时已经得到，不需要额外的系统调用
+                try:
+                    st = entry.stat()
+                    key = st.st_size, st.st_mtime_ns
+                except OSError:
+                    key = None
+                yield entry.path, True, key, rules.get_encoding(entry.name, rel_path)
+        stack.extend(reversed(subdirs))
+
+def scan_directory(target_path, rules, stats, log_func, workers=1, cache=None, metrics=None, pipeline_depth=0,
+                   io_threads=PIPELINE_IO_THREADS, index=None):
+    """
+    递归扫描目录，并将所有匹配文件的统计结果合并到 stats 中。
+    workers 大于 1 时使用多进程并行统计；结果总是按遍历顺序合并，与进程数无关。
+    提供 cache 时，未变化的文件直接使用缓存中的统计数据。
+    提供 metrics (RunMetrics) 时记录各阶段耗时和处理量；如果它带有进度回调，
+    会先完成遍历并统计文件总量，否则边遍历边读取文件。
+    rules (ScanRules) 决定统计哪些文件以及使用的编码。
+    单进程时如果 pipeline_depth 大于 0，则使用流水线模式：io_threads 个读取线程提前读取后面的文件，
+    最多预读 pipeline_depth 个，主线程同时解码和统计前面的文件，使磁盘 (或网络) 读取与字符统计重叠进行。
+    提供 index (CharIndex) 时同时记录每个文件中出现的字符。
+    """
+    log_func(f"开始递归扫描目录: {target_path}")
+    batch_size = SCAN_BATCH_SIZE if workers > 1 else 1
+    if metrics is None:
+        metrics = RunMetrics()
+
+    # 匹配的文件附带 stat_key，用于缓存比对和统计处理的字节数
+    entries = metrics.timed_iter('walk', iter_scan_entries(target_path, rules))
+    if metrics.progress_func:
+        entries = list(entries)
+        matched_keys = [key for file_path, matched, key, encoding in entries if matched]
+        metrics.set_total(len(matched_keys), sum(key[0] for key in matched_keys if key))
+        log_func(f"预扫描完成，共找到 {len(matched_keys)} 个待处理的文件。")
+
+    def iter_batches():
+        # events 按遍历顺序记录每个文件的处理方式 (文件路径, 动作, stat_key, 数据)，用于合并时按原顺序输出日志
+        # 动作为 'skip' (按规则排除)、'cached' (数据为缓存的 CharStats) 或 'read' (需要读取文件)
+        events, files = [], []
+        for file_path, matched, key, encoding in entries:
+            if not matched:
+                events.append((file_path, 'skip', None, None))
+            else:
+                cached_stats = None
+                if cache and key:
+                    with metrics.phase('cache'):
+                        cached_stats = cache.lookup(file_path, *key)
+                if cached_stats is not None:
+                    events.append((file_path, 'cached', key, cached_stats))
+                else:
+                    events.append((file_path, 'read', key, None))
+                    files.append((file_path, encoding))
+            if len(events) >= batch_size:
+                yield events, files
+                events, files = [], []
+        if events:
+            yield events, files
+
+    def merge_batch(events, result):
+        results, errors, timings = result
+        for name, seconds in timings.items():
+            metrics.add_time(name, seconds)
+        for file_path, action, key, data in events:
+            if action == 'skip':
+                log_func(f"  -> 已跳过 (按规则排除): {file_path}")
+                metrics.counters['skipped'] += 1
+                continue
+            if action == 'cached':
+                log_func(f"  正在处理 (使用缓存): {file_path}")
+                stats.add_file(file_path, data)
+                if index is not None:
+                    index.add_file(file_path, data.char_counts)
+                metrics.counters['cached_files'] += 1
+            else:
+                log_func(f"  正在处理: {file_path}")
+                if isinstance(errors.get(file_path), BinaryFileError):
+                    log_func(f"    -> 已跳过 (二进制文件): {file_path}")
+                    metrics.counters['binary_files'] += 1
+                elif file_path in errors:
+                    log_func(f"    -> 警告: 读取文件 '{file_path}' 时发生未知错误: {errors[file_path]}，已跳过。")
+                    metrics.counters['error_files'] += 1
+                else:
+                    stats.add_file(file_path, results[file_path])
+                    if index is not None:
+                        index.add_file(file_path, results[file_path].char_counts)
+                    if cache and key:
+                        with metrics.phase('cache'):
+                            cache.store(file_path, *key, results[file_path])
+            metrics.advance(1, key[0] if key else 0)
+
+    if workers <= 1 and pipeline_depth > 0:
+        log_func(f"使用流水线读取: {io_threads} 个读取线程，最多预读 {pipeline_depth} 个文件。")
+        with ThreadPoolExecutor(max_workers=io_threads) as reader:
+            # 单进程时每个批次只有一个文件，pending 的长度就是预读队列的长度
+            pending = deque()
+            for events, files in iter_batches():
+                keys = [key for file_path, action, key, data in events if action == 'read']
+                jobs = []
+                for (file_path, encoding), key in zip(files, keys):
+                    # 大小未知或过大的文件不预读，避免占用过多内存
+                    future = None
+                    if key and key[0] <= PIPELINE_PREFETCH_LIMIT:
+                        future = reader.submit(prefetch_file, file_path)
+                    jobs.append((file_path, encoding, future))
+                pending.append((events, jobs))
+                # 预读队列已满时先处理最早的文件，队列有空位后才会继续提交预读任务
+                while len(pending) > pipeline_depth:
+                    events, jobs = pending.popleft()
+                    merge_batch(events, analyze_prefetched(jobs, reader, rules))
+            while pending:
+                events, jobs = pending.popleft()
+                merge_batch(events, analyze_prefetched(jobs, reader, rules))
+        return
+
+    if workers <= 1:
+        for events, files in iter_batches():
+            merge_batch(events, analyze_files(files, rules))
+        return
+
+    log_func(f"使用 {workers} 个进程并行扫描。")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for events, files in iter_batches():
+            # 全部命中缓存的批次不需要提交给子进程
+            future = executor.submit(analyze_files, files, rules) if files else None
+            pending.append((events, future))
+            # 限制排队中的任务数量，避免遍历过快时积压过多结果
+            while len(pending) > workers * 2:
+                events, future = pending.popleft()
+                merge_batch(events, future.result() if future else ({}, {}, {}))
+        while pending:
+            events, future = pending.popleft()
+            merge_batch(events, future.result() if future else ({}, {}, {}))
+
+def collect_stats(target_path, log_func, workers=1, cache_path=None, metrics=None, rules=None, pipeline_depth=0,
+                  index=None):
+    """
+    扫描文件或目录并返回统计数据 (CharStats)，不生成报告。
+    workers 为并行扫描的进程数；提供 cache_path 且目标为目录时，使用该位置的增量分析缓存。
+    metrics (RunMetrics) 用于记录各阶段耗时、处理量和进度。
+    rules (ScanRules) 为扫描规则，为 None 时使用默认规则。
+    pipeline_depth 大于 0 时，单进程扫描使用流水线模式，参见 scan_directory。
+    index (CharIndex) 不为 None 时同时记录每个文件中出现的字符。
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+    
+    stats = CharStats()
+    if metrics is None:
+        metrics = RunMetrics()
+    
+    log_func(f"开始分析: {target_path}")
+    rules.log_rules(log_func)
+    log_func("")
+
+    cache = None
+    if cache_path and os.path.isdir(target_path):
+        try:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            cache = AnalysisCache(cache_path, rules.to_dict())
+            log_func(f"使用分析缓存: {cache_path}")
+            if cache.invalidated:
+                log_func("  -> 扫描规则已变化，旧缓存已清空。")
+        except Exception as e:
+            log_func(f"  -> 警告: 无法打开分析缓存 '{cache_path}': {e}，将进行完整扫描。")
+
+    if os.path.isfile(target_path):
+        filename = os.path.basename(target_path)
+        matched = rules.match_file(filename, filename)
+        if matched is False:
+            log_func(f"  -> 已跳过 (按规则排除): {target_path}")
+        elif matched:
+            log_func(f"  正在处理文件: {target_path}")
+            key = stat_key(target_path)
+            metrics.set_total(1, key[0] if key else 0)
+            timings = Counter()
+            file_stats = CharStats()
+            try:
+                read_and_count_file(target_path, file_stats, timings, rules, rules.get_encoding(filename, filename))
+                stats.add_file(target_path, file_stats)
+                if index is not None:
+                    index.add_file(target_path, file_stats.char_counts)
+            except BinaryFileError:
+                log_func(f"    -> 已跳过 (二进制文件): {target_path}")
+                metrics.counters['binary_files'] += 1
+            except Exception as e:
+                log_func(f"    -> 警告: 读取文件 '{target_path}' 时发生错误: {e}，已跳过。")
+                metrics.counters['error_files'] += 1
+            for name, seconds in timings.items():
+                metrics.add_time(name, seconds)
+            metrics.advance(1, key[0] if key else 0)
+        else:
+            log_func(f"  -> 已跳过 (文件类型不匹配): {target_path}")
+
+    elif os.path.isdir(target_path):
+        try:
+            scan_directory(target_path, rules, stats, log_func, workers, cache, metrics, pipeline_depth,
+                           index=index)
+            if cache:
+                with metrics.phase('cache'):
+                    cache.prune()
+                log_func(f"\n缓存命中: {cache.hits} 个文件，未命中: {cache.misses} 个文件。")
+        finally:
+            if cache:
+                cache.close()
+
+    return stats
+
+def analyze_path(target_path, output_file_path, log_func, workers=1, use_cache=False, notify_func=None,
+                 metrics=None, rules=None, pipeline_depth=0, charset_path=None, append_only=False,
+                 report_format=None, top_n=DEFAULT_TOP_N, index_path=None):
+    """
+    分析主函数，log_func用于将信息输出到GUI界面，workers为并行扫描的进程数。
+    返回统计到的唯一字符集 (CodepointSet)，未找到内容时返回 None。参数参见 analyze_path_stats。
+    """
+    characters, stats = analyze_path_stats(target_path, output_file_path, log_func, workers, use_cache,
+                                           notify_func, metrics, rules, pipeline_depth, charset_path, append_only,
+                                           report_format, top_n, index_path)
+    return characters
+
+def analyze_path_stats(target_path, output_file_path, log_func, workers=1, use_cache=False, notify_func=None,
+                       metrics=None, rules=None, pipeline_depth=0, charset_path=None, append_only=False,
+                       report_format=None, top_n=DEFAULT_TOP_N, index_path=None):
+    """
+    与 analyze_path 相同，但同时返回统计数据，便于按出现次数使用字符 (参见 split_by_frequency)。
+    返回 (字符集, CharStats)，未找到内容时返回 (None, None)。
+    use_cache 为 True 且目标为目录时，在报告旁维护增量分析缓存，只重新读取有变化的文件。
+    notify_func 用于弹出提示，参见 generate_report；为 None 时只输出日志。
+    metrics (RunMetrics) 用于记录各阶段耗时、处理量和进度；rules (ScanRules) 为扫描规则；
+    pipeline_depth 参见 scan_directory。
+    提供 charset_path 时保存本次的字符集并与上次比较，append_only 参见 track_charset。
+    report_format 和 top_n 参见 generate_report。
+    提供 index_path 时在扫描的同时建立字符来源索引 (CharIndex) 并保存到该位置。
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    cache_path = get_cache_path(output_file_path) if use_cache else None
+    index = CharIndex() if index_path else None
+    stats = collect_stats(target_path, log_func, workers, cache_path, metrics, rules, pipeline_depth, index)
+    
+    if not stats:
+        log_func("\n分析完成，但未找到任何可供分析的内容。")
+        if notify_func:
+            notify_func('warning', "提醒", "分析完成，但未找到任何可供分析的内容。")
+        return None, None
+
+    with metrics.phase('report'):
+        generate_report(stats, output_file_path, log_func, notify_func, report_format, top_n)
+        if index is not None:
+            save_char_index(index, index_path, log_func)
+    # 返回统计到的唯一字符集 (CodepointSet)；只增不减时还包括以前保留的字符
+    characters = stats.codepoints()
+    if charset_path:
+        characters = track_charset(charset_path, characters, log_func, metrics, append_only)
+    return characters, stats
+
+# ==============================================================================
+# 码位集合
+# ==============================================================================
+
+# 按范围保存的码位集合文件的首行，用于和普通的字符文件区分
+CODEPOINT_FILE_HEADER = "# wc-codepoints 1"
+
+class CodepointSet:
+    """
+    紧凑的字符集合，以排好序的 array('I') 保存码位，每个字符只占 4 字节。
+    可以像字符组成的 set 一样使用 (len、in、按码位顺序迭代得到字符)，支持并集 (|)、差集 (-) 和交集 (&)，
+    这些运算都是对两个有序数组的线性归并，不会把码位展开成 set；codes 可以直接作为 Subsetter.populate(unicodes=...) 的参数，不需要再拼接字符串。
+    """
+
+    def __init__(self, codepoints=()):
+        self.codes = array('I', sorted(set(codepoints)))
+
+    @classmethod
+    def _from_sorted(cls, codes):
+        result = cls.__new__(cls)
+        result.codes = codes
+        return result
+
+    @classmethod
+    def from_chars(cls, characters):
+        """从字符组成的可迭代对象 (字符串、set 等) 创建集合；已经是 CodepointSet 时直接返回。"""
+        if isinstance(characters, CodepointSet):
+            return characters
+        return cls(map(ord, characters))
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """从 (起始码位, 结束码位) 闭区间列表创建集合，区间可以无序或相互重叠。"""
+        codes = array('I')
+        for start, end in sorted(ranges):
+            # 跳过与上一个区间重叠的部分，使结果保持有序且不重复
+            if codes and start <= codes[-1]:
+                start = codes[-1] + 1
+            if start <= end:
+                codes.extend(range(start, end + 1))
+        return cls._from_sorted(codes)
+
+    def to_ranges(self):
+        """返回连续码位合并后的 (起始码位, 结束码位) 闭区间列表。"""
+        ranges = []
+        for code in self.codes:
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+        return [tuple(item) for item in ranges]
+
+    def chars(self):
+        """按码位顺序返回所有字符组成的字符串。"""
+        return "".join(map(chr, self.codes))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __bool__(self):
+        return bool(self.codes)
+
+    def __iter__(self):
+        return map(chr, self.codes)
+
+    def __contains__(self, item):
+        code = ord(item) if isinstance(item, str) else item
+        index = bisect_left(self.codes, code)
+        return index < len(self.codes) and self.codes[index] == code
+
+    def __eq__(self, other):
+        if not isinstance(other, CodepointSet):
+            return NotImplemented
+        return self.codes == other.codes
+
+    def __or__(self, other):
+        other = CodepointSet.from_chars(other)
+        if not other.codes:
+            return self
+        if not self.codes:
+            return other
+        return self._from_sorted(array('I', (code for code, _ in groupby(heapq.merge(self.codes, other.codes)))))
+
+    def _filter(self, other, keep_common):
+        """同时遍历两个有序数组，保留 self 中 (keep_common 为真时) 也在或 (为假时) 不在 other 中的码位。"""
+        other_codes = other.codes
+        other_size = len(other_codes)
+        result = array('I')
+        index = 0
+        for code in self.codes:
+            while index < other_size and other_codes[index] < code:
+                index += 1
+            if (index < other_size and other_codes[index] == code) == keep_common:
+                result.append(code)
+        return self._from_sorted(result)
+
+    def __sub__(self, other):
+        other = CodepointSet.from_chars(other)
+        if not self.codes or not other.codes:
+            return self
+        return self._filter(other, False)
+
+    def __and__(self, other):
+        other = CodepointSet.from_chars(other)
+        if not self.codes or not other.codes:
+            return self._from_sorted(array('I'))
+        return self._filter(other, True)
+
+    def save(self, path):
+        """按码位范围保存为文本文件，每行一个十六进制码位或范围，如 4E00-9FA5。"""
+        with open(path, 'w', encoding='utf-8', newline='\n') as file:
+            file.write(CODEPOINT_FILE_HEADER + "\n")
+            for start, end in self.to_ranges():
+                file.write(f"{start:04X}\n" if start == end else f"{start:04X}-{end:04X}\n")
+
+    @classmethod
+    def load(cls, path):
+        """读取 save 保存的文件；不是该格式时，把文件中出现的每个字符都作为集合的元素。"""
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            text = file.read()
+        if not text.startswith(CODEPOINT_FILE_HEADER):
+            return cls.from_chars(text)
+        ranges = []
+        for line_no, line in enumerate(text.splitlines()[1:], 2):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                start, _, end = line.partition('-')
+                ranges.append((int(start, 16), int(end or start, 16)))
+            except ValueError:
+                raise ValueError(f"码位集合文件第 {line_no} 行格式错误: {line}")
+        return cls.from_ranges(ranges)
+
+# ==============================================================================
+# 字符集变化检测
+# ==============================================================================
+
+# 日志中最多列出的新增/移除字符数
+CHARSET_PREVIEW_LIMIT = 200
+
+def get_charset_path(output_file_path):
+    """返回与报告文件放在一起的字符集文件路径，用于和下一次分析的结果比较。"""
+    return os.path.splitext(output_file_path)[0] + ".charset.txt"
+
+def format_chars_preview(characters, limit=CHARSET_PREVIEW_LIMIT):
+    """返回用于日志显示的字符列表，空白和控制字符显示为 U+XXXX，超过 limit 个时截断。"""
+    parts = []
+    for code in characters.codes[:limit]:
+        char = chr(code)
+        parts.append(char if char.isprintable() and not char.isspace() else f"[U+{code:04X}]")
+    if len(characters) > limit:
+        parts.append(f" ... (共 {len(characters)} 个)")
+    return "".join(parts)
+
+def track_charset(charset_path, characters, log_func, metrics=None, append_only=False):
+    """
+    与 charset_path 中上次保存的字符集比较，输出新增和移除的字符，并保存本次应保留的字符集。
+    append_only 为 True 时保留的字符集只增不减：上次的字符即使本次没有出现也继续保留，
+    这样已经发布的瘦身字体仍然可用。返回本次应保留的字符集 (CodepointSet)。
+    新增、移除和保留的字符数记录在 metrics.counters 中。
+    """
+    characters = CodepointSet.from_chars(characters)
+    previous = None
+    if os.path.isfile(charset_path):
+        try:
+            previous = CodepointSet.load(charset_path)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            log_func(f"  -> 警告: 无法读取上次的字符集 '{charset_path}': {e}")
+
+    retained = characters | previous if append_only and previous else characters
+    if previous is None:
+        log_func(f"\n未找到上次的字符集，本次共 {len(retained)} 个字符。")
+        added = retained
+        removed = CodepointSet()
+    else:
+        added = characters - previous
+        removed = previous - characters
+        if not added and not removed:
+            log_func(f"\n字符集与上次相同 ({len(previous)} 个字符)。")
+        else:
+            log_func(f"\n字符集变化: 新增 {len(added)} 个，移除 {len(removed)} 个。")
+            if added:
+                log_func(f"  -> 新增: {format_chars_preview(added)}")
+            if removed:
+                label = "本次未出现 (只增不减，仍然保留)" if append_only else "移除"
+                log_func(f"  -> {label}: {format_chars_preview(removed)}")
+
+    if metrics is not None:
+        metrics.counters['chars_added'] += len(added)
+        metrics.counters['chars_removed'] += 0 if append_only else len(removed)
+        metrics.counters['chars_retained'] += len(retained)
+
+    if previous is None or retained != previous:
+        retained.save(charset_path)
+        log_func(f"字符集已保存到: {charset_path}")
+    return retained
+
+# ==============================================================================
+# 新增的字体瘦身核心逻辑
+# ==============================================================================
+
+# 瘦身配置：keep 保持原格式和全部信息；web 面向网页，输出 WOFF2/WOFF 并去掉网页用不到的信息
+SUBSET_PROFILES = ('keep', 'web')
+# 网页字体的格式，woff2 需要 brotli 库
+WEB_FLAVORS = ('woff2', 'woff')
+
+def get_subset_options(profile='keep', flavor=None, layout_features=None):
+    """
+    返回子集化选项。
+    profile 为 'keep' 时保持原格式，保留所有 OpenType 特性、字形名称、旧版 cmap 和所有表；
+    为 'web' 时以文件体积优先：输出 flavor 格式 (默认有 brotli 时为 woff2，否则为 woff)，
+    去掉 hinting、字形名称、旧版 cmap 和网页用不到的表。
+    layout_features 为保留的 OpenType 特性列表，为 None 时 keep 保留全部特性，web 使用 fontTools 的默认列表。
+    """
+    if profile not in SUBSET_PROFILES:
+        raise ValueError(f"未知的瘦身配置: {profile}")
+    options = Options()
+    if profile == 'web':
+        options.flavor = flavor or ('woff2' if BROTLI_AVAILABLE else 'woff')
+        if options.flavor not in WEB_FLAVORS:
+            raise ValueError(f"不支持的网页字体格式: {options.flavor}")
+        if options.flavor == 'woff2' and not BROTLI_AVAILABLE:
+            raise ValueError("输出 WOFF2 需要 brotli 库，请通过 'pip install brotli' 命令安装，或改用 woff。")
+        if layout_features is not None:
+            options.layout_features = list(layout_features)
+        options.hinting = False
+        options.glyph_names = False
+        options.symbol_cmap = False
+        options.legacy_cmap = False
+        options.name_legacy = False
+        options.notdef_outline = True
+        # 展开 CFF 子程序后 WOFF2 的 brotli 压缩效果更好
+        options.desubroutinize = True
+        options.recalc_bounds = True
+        options.recalc_timestamp = True
+        options.canonical_order = True
+        return options
+
+    # 不设置flavor，保持原格式
+    options.layout_features = list(layout_features) if layout_features is not None else ['*']
+    options.glyph_names = True
+    options.symbol_cmap = True
+    options.legacy_cmap = True
+    options.notdef_outline = True
+    options.recommended_glyphs = True
+    options.name_legacy = True
+    options.drop_tables = []
+    options.recalc_bounds = True
+    options.recalc_timestamp = True
+    options.canonical_order = True
+    return options
+
+def get_subset_output_path(font_path, output_dir, reserved_paths=(), flavor=None, name_suffix=''):
+    """
+    生成瘦身字体的输出路径，确保不与已有文件重名。
+    reserved_paths 为本批次中已分配给其他字体的路径，并行处理时用于避免重名。
+    flavor 为 'woff' 或 'woff2' 时使用对应的扩展名；name_suffix 添加在 "_subset" 之后，如分片的 "_part1"。
+    """
+    name, ext = os.path.splitext(os.path.basename(font_path))
+    if flavor:
+        ext = f".{flavor}"
+    output_path = os.path.join(output_dir, f"{name}_subset{name_suffix}{ext}")
+    counter = 1
+    while os.path.exists(output_path) or output_path in reserved_paths:
+        output_path = os.path.join(output_dir, f"{name}_subset{name_suffix}_{counter}{ext}")
+        counter += 1
+    return output_path
+
+def get_subset_sizes(output_path):
+    """
+    返回瘦身结果的 (未压缩的字体大小, 传输大小, 传输压缩方式)。
+    WOFF/WOFF2 的未压缩大小从文件头的 totalSfntSize 读取，传输大小就是文件本身的大小；
+    其他格式按服务器常用的 gzip 压缩估算传输大小。
+    """
+    with open(output_path, 'rb') as file:
+        data = file.read()
+    if len(data) >= 20 and data[:4] in (b'wOFF', b'wOF2'):
+        return int.from_bytes(data[16:20], 'big'), len(data), 'woff2' if data[:4] == b'wOF2' else 'woff'
+    return len(data), len(gzip.compress(data, compresslevel=6)), 'gzip'
+
+def log_subset_size(font_path, output_path, log_func):
+    """输出原字体、瘦身后 (未压缩) 和实际传输的大小。"""
+    original_size = os.path.getsize(font_path) / 1024
+    subset_size, transfer_size, method = get_subset_sizes(output_path)
+    subset_size /= 1024
+    transfer_size /= 1024
+    log_func(f"  -> 瘦身完成: {original_size:.2f} KB -> {subset_size:.2f} KB (节省 {(1 - subset_size/original_size) * 100:.2f}%)，"
+             f"传输大小 ({method}): {transfer_size:.2f} KB (节省 {(1 - transfer_size/original_size) * 100:.2f}%)")
+
+def get_collection_size(font_path):
+    """读取文件头，返回字体集合 (TTC/OTC) 包含的字重数；不是字体集合时返回 0。"""
+    try:
+        with open(font_path, 'rb') as file:
+            header = file.read(12)
+    except OSError:
+        return 0
+    if len(header) < 12 or header[:4] != b'ttcf':
+        return 0
+    return int.from_bytes(header[8:12], 'big')
+
+def get_codepoints(characters):
+    """将字符集合 (或 CodepointSet) 转换为排好序的码位数组，可直接传给 Subsetter.populate(unicodes=...)。"""
+    return CodepointSet.from_chars(characters).codes
+
+# ==============================================================================
+# 瘦身结果缓存
+# ==============================================================================
+
+# 瘦身缓存目录的默认大小上限
+DEFAULT_SUBSET_CACHE_SIZE = 1024 * 1024 * 1024
+
+def get_default_subset_cache_dir():
+    """返回瘦身缓存的默认目录 (Windows 下位于 %LOCALAPPDATA%，其他系统位于 ~/.cache)。"""
+    base_dir = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'wc_font_subset')
+
+def hash_file(path, memo=None):
+    """
+    返回文件内容的 SHA-256。提供 memo (字典) 时以 (路径, 大小, 修改时间) 记住结果，
+    避免同一次运行中重复读取同一个文件。
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = memo.get(memo_key) if memo is not None else None
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(READ_CHUNK_SIZE), b''):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        if memo is not None:
+            memo[memo_key] = digest
+    return digest
+
+def get_options_fingerprint(options):
+    """根据子集化选项和 fontTools 版本生成指纹，任一项变化都会使缓存失效。"""
+    items = {}
+    for name, value in sorted(vars(options).items()):
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        items[name] = repr(value)
+    data = json.dumps([FONTTOOLS_VERSION, items], sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+class SubsetCache:
+    """
+    按内容寻址的瘦身结果缓存。
+    以字体文件哈希、字符集哈希和选项指纹作为键，把瘦身后的字体保存在本地目录中；
+    命中时复制上次的结果。缓存条目与输出文件互不共享，修改输出文件不会影响缓存，
+    更新条目的使用时间也不会改变输出文件。目录总大小超过上限时，按最近使用时间淘汰旧条目。
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_SUBSET_CACHE_SIZE):
+        self.cache_dir = cache_dir or get_default_subset_cache_dir()
+        self.max_size = max_size
+        # (路径, 大小, 修改时间) -> 文件哈希，避免同一次运行中重复计算
+        self._font_hashes = {}
+
+    def font_hash(self, font_path):
+        return hash_file(font_path, self._font_hashes)
+
+    def make_key(self, font_path, unicodes, options):
+        """计算缓存键。unicodes 为排好序的码位列表或数组。"""
+        chars_hash = hashlib.sha256(array('I', unicodes).tobytes()).hexdigest()
+        ext = os.path.splitext(font_path)[1].lower()
+        data = f"{self.font_hash(font_path)}|{chars_hash}|{get_options_fingerprint(options)}|{ext}"
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, output_path, metrics=None):
+        """缓存命中时把结果复制到 output_path 并返回 True，同时记入 metrics 的 subset_cache_hits。"""
+        entry_path = self._entry_path(key)
+        if not os.path.isfile(entry_path):
+            return False
+        try:
+            copy_file_atomic(entry_path, output_path)
+            # 更新修改时间，作为 LRU 淘汰的依据
+            os.utime(entry_path)
+        except OSError:
+            return False
+        if metrics is not None:
+            metrics.counters['subset_cache_hits'] += 1
+        return True
+
+    def store(self, key, output_path):
+        """保存瘦身结果，并在超过大小上限时淘汰旧条目。"""
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        copy_file_atomic(output_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        """按最近使用时间删除最旧的条目，直到缓存总大小不超过上限。"""
+        entries = []
+        total_size = 0
+        for root, dirs, files in os.walk(self.cache_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, path))
+                total_size += st.st_size
+        entries.sort()
+        for mtime_ns, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+def store_subset_cache(cache, cache_key, output_path, log_func):
+    """把瘦身结果写入缓存，失败时只输出警告。"""
+    try:
+        cache.store(cache_key, output_path)
+    except OSError as e:
+        log_func(f"  -> 警告: 写入瘦身缓存失败: {e}")
+
+def copy_file_atomic(src, dst):
+    """先复制到临时文件再替换 dst，dst 原来是硬链接时也不会修改链接的另一端。"""
+    temp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(src, temp_path)
+        os.replace(temp_path, dst)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# 记录输出目录中瘦身结果来源的清单文件
+SUBSET_MANIFEST_NAME = "wc_subset_manifest.json"
+SUBSET_MANIFEST_VERSION = 1
+
+def get_subset_signature(unicodes, options):
+    """返回字符集和子集化选项的指纹，任一项变化都需要重新瘦身。"""
+    chars_hash = hashlib.sha256(array('I', unicodes).tobytes()).hexdigest()
+    return f"{chars_hash}|{get_options_fingerprint(options)}"
+
+class SubsetManifest:
+    """
+    保存在字体输出目录中的瘦身清单。
+    记录每个字体上次的输出文件，以及当时字体文件、字符集和选项的状态；
+    再次瘦身时，这些输入都没有变化且输出文件未被修改的字体会被直接跳过，
+    有变化的字体则覆盖上次由本工具生成的输出文件，而不是另外生成新的文件名。
+    """
+
+    def __init__(self, output_dir, name_suffix=''):
+        self.output_dir = output_dir
+        # 同一字体的不同分片 (见 split_subset_fonts) 以后缀区分
+        self.name_suffix = name_suffix
+        self.path = os.path.join(output_dir, SUBSET_MANIFEST_NAME)
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == SUBSET_MANIFEST_VERSION:
+                self.entries = data.get('fonts', {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def _entry(self, font_path):
+        return self.entries.get(os.path.abspath(font_path) + self.name_suffix)
+
+    def previous_output(self, font_path):
+        """返回上次为该字体生成且之后未被修改的输出文件路径，没有时返回 None。"""
+        entry = self._entry(font_path)
+        if not entry:
+            return None
+        output_path = os.path.join(self.output_dir, entry['output'])
+        if list(stat_key(output_path) or ()) != entry['output_stat']:
+            return None
+        return output_path
+
+    def is_unchanged(self, font_path, output_path, signature):
+        """字体文件、字符集和选项都与上次相同，且输出文件仍是上次的结果时返回 True。"""
+        entry = self._entry(font_path)
+        return (entry is not None
+                and self.previous_output(font_path) == output_path
+                and entry['signature'] == signature
+                and list(stat_key(font_path) or ()) == entry['font_stat'])
+
+    def record(self, font_path, output_path, signature):
+        """记录一次成功的瘦身。"""
+        self.entries[os.path.abspath(font_path) + self.name_suffix] = {
+            'font_stat': list(stat_key(font_path) or ()),
+            'signature': signature,
+            'output': os.path.basename(output_path),
+            'output_stat': list(stat_key(output_path) or ()),
+        }
+
+    def save(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': SUBSET_MANIFEST_VERSION, 'fonts': self.entries}, file,
+                      ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+def subset_font(font_path, characters, output_dir, log_func, output_path=None, cache=None, options=None,
+                metrics=None):
+    """
+    使用 fontTools 对字体文件或字体集合进行子集化。
+    output_path 为 None 时在 output_dir 中自动生成不重名的输出文件名。
+    提供 cache (SubsetCache) 时，字体、字符集和选项都未变化的情况下直接复用上次的结果，
+    命中次数记录在 metrics (RunMetrics) 中。
+    options 为 get_subset_options 返回的子集化选项，为 None 时使用 keep 配置。
+    """
+    if not FONTTOOLS_AVAILABLE:
+        log_func("错误: 未找到 fontTools 库，无法执行字体瘦身。")
+        log_func("请通过 'pip install fonttools' 命令安装。")
+        return False, "fontTools 库未安装"
+
+    try:
+        font_name = os.path.basename(font_path)
+        if options is None:
+            options = get_subset_options()
+        if output_path is None:
+            output_path = get_subset_output_path(font_path, output_dir, flavor=options.flavor)
+
+        log_func(f"\n正在处理字体文件: {font_name}")
+        log_func(f"  -> 输出至: {output_path}")
+
+        # 字符集只转换一次，选项和 Subsetter 也只创建一次，供所有字重共用
+        unicodes = get_codepoints(characters)
+        cache_key = cache.make_key(font_path, unicodes, options) if cache else None
+        if cache_key and cache.fetch(cache_key, output_path, metrics):
+            log_func("  -> 命中瘦身缓存，已复用上次的结果。")
+            log_subset_size(font_path, output_path, log_func)
+            return True, None
+
+        subsetter = Subsetter(options=options)
+        subsetter.populate(unicodes=unicodes)
+
+        # 通过文件头判断是字体集合还是单个字体，避免重复解析字体文件
+        face_count = get_collection_size(font_path)
+        if face_count > 0 and options.flavor:
+            raise ValueError(f"{options.flavor.upper()} 不支持字体集合，请使用 keep 配置")
+        if face_count > 0:
+            ttc = TTCollection(font_path)
+            log_func(f"  -> 检测到字体集合，包含 {len(ttc.fonts)} 个字重。将对所有字重进行瘦身。")
+            
+            for i, font in enumerate(ttc.fonts):
+                log_func(f"    -> 正在处理第 {i+1}/{len(ttc.fonts)} 个字重...")
+                subsetter.subset(font)
+            
+            ttc.save(output_path)
+        else:
+            log_func(f"  -> 作为单个字体文件处理。")
+            font = TTFont(font_path)
+            subsetter.subset(font)
+            # keep 配置不指定格式，保持输入的 WOFF/WOFF2 格式
+            if options.flavor is not None:
+                font.flavor = options.flavor
+            font.save(output_path)
+
+        if cache_key:
+            store_subset_cache(cache, cache_key, output_path, log_func)
+        log_subset_size(font_path, output_path, log_func)
+        
+        return True, None
+    except Exception as e:
+        log_func(f"  -> 错误: 处理字体 '{font_path}' 时发生错误: {e}")
+        return False, str(e)
+
+def subset_font_data(data, unicodes, options=None):
+    """对内存中的字体数据 (TTF/OTF/TTC/OTC) 进行子集化，返回瘦身后的字体字节串。unicodes 参见 get_codepoints。"""
+    if options is None:
+        options = get_subset_options()
+    subsetter = Subsetter(options=options)
+    subsetter.populate(unicodes=unicodes)
+    buffer = io.BytesIO()
+    if data[:4] == b'ttcf':
+        if options.flavor:
+            raise ValueError(f"{options.flavor.upper()} 不支持字体集合，请使用 keep 配置")
+        ttc = TTCollection(io.BytesIO(data))
+        for font in ttc.fonts:
+            subsetter.subset(font)
+        ttc.save(buffer)
+    else:
+        font = TTFont(io.BytesIO(data))
+        subsetter.subset(font)
+        if options.flavor is not None:
+            font.flavor = options.flavor
+        font.save(buffer)
+    return buffer.getvalue()
+
+def subset_font_task(font_path, characters, output_dir, output_path, options=None):
+    """在子进程中执行 subset_font，返回 (是否成功, 错误信息, 日志列表, 耗时)。"""
+    logs = []
+    start = time.perf_counter()
+    success, error_msg = subset_font(font_path, characters, output_dir, logs.append, output_path, options=options)
+    return success, error_msg, logs, time.perf_counter() - start
+
+def subset_collection_face(font_path, index, unicodes, options=None):
+    """在子进程中瘦身字体集合中的单个字重，返回 (该字重保存为单独字体后的字节串, 耗时)。"""
+    start = time.perf_counter()
+    font = TTFont(font_path, fontNumber=index)
+    subsetter = Subsetter(options=options or get_subset_options())
+    subsetter.populate(unicodes=unicodes)
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    font.save(buffer)
+    font.close()
+    return buffer.getvalue(), time.perf_counter() - start
+
+def assemble_collection(font_path, output_path, face_futures, log_func):
+    """
+    等待所有字重的瘦身结果，并重新组装为字体集合。
+    返回 (是否成功, 错误信息, 耗时)，耗时为各字重在子进程中的耗时与组装耗时之和。
+    """
+    start = time.perf_counter()
+    face_seconds = 0.0
+    wait_seconds = 0.0
+    try:
+        log_func(f"\n正在处理字体文件: {os.path.basename(font_path)}")
+        log_func(f"  -> 输出至: {output_path}")
+        log_func(f"  -> 检测到字体集合，包含 {len(face_futures)} 个字重。将并行对所有字重进行瘦身。")
+        ttc = TTCollection()
+        for i, future in enumerate(face_futures):
+            # 等待子进程的时间不计入组装耗时
+            wait_start = time.perf_counter()
+            data, seconds = future.result()
+            wait_seconds += time.perf_counter() - wait_start
+            face_seconds += seconds
+            ttc.fonts.append(TTFont(io.BytesIO(data)))
+            log_func(f"    -> 第 {i+1}/{len(face_futures)} 个字重处理完成。")
+        # 保存时相同的表只写入一次，与原字体集合一样共享表数据
+        ttc.save(output_path)
+        log_subset_size(font_path, output_path, log_func)
+        return True, None, face_seconds + time.perf_counter() - start - wait_seconds
+    except Exception as e:
+        log_func(f"  -> 错误: 处理字体 '{font_path}' 时发生错误: {e}")
+        return False, str(e), face_seconds + time.perf_counter() - start - wait_seconds
+
+def subset_fonts(font_paths, characters, output_dir, log_func, workers=1, cache=None, metrics=None,
+                 skip_unchanged=False, options=None, name_suffix=''):
+    """
+    对多个字体依次或并行进行瘦身，返回与 font_paths 一一对应的 (是否成功, 错误信息, 输出路径) 列表。
+    characters 为要保留的字符集合或 CodepointSet。
+    workers 大于 1 时，不同字体以及字体集合中的不同字重会在多个进程中同时处理；
+    日志仍按字体顺序输出，输出文件名与依次处理时相同。
+    cache (SubsetCache) 只在主进程中读写，命中缓存的字体不会提交给子进程。
+    metrics (RunMetrics) 用于记录每个字体的耗时和整体进度，进度按字体文件大小计算。
+    skip_unchanged 为 True 时使用输出目录中的瘦身清单 (SubsetManifest)：
+    字体、字符集和选项都没有变化的字体直接跳过，有变化的字体覆盖上次的输出文件。
+    options 为 get_subset_options 返回的子集化选项，为 None 时使用 keep 配置。
+    name_suffix 参见 get_subset_output_path。
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    if options is None and FONTTOOLS_AVAILABLE:
+        options = get_subset_options()
+    flavor = options.flavor if options else None
+    # 转换为 CodepointSet，提交给子进程时只需要传递紧凑的码位数组
+    characters = CodepointSet.from_chars(characters)
+    manifest = SubsetManifest(output_dir, name_suffix) if skip_unchanged and FONTTOOLS_AVAILABLE else None
+    signature = get_subset_signature(characters.codes, options) if manifest else None
+    # 先为所有字体分配输出路径，避免并行处理时出现重名；有清单时沿用上次的输出文件
+    output_paths = []
+    for font_path in font_paths:
+        output_path = manifest.previous_output(font_path) if manifest else None
+        if output_path is None or output_path in output_paths:
+            output_path = get_subset_output_path(font_path, output_dir, output_paths, flavor, name_suffix)
+        output_paths.append(output_path)
+    unchanged = [bool(manifest) and manifest.is_unchanged(font_path, output_path, signature)
+                 for font_path, output_path in zip(font_paths, output_paths)]
+    font_sizes = [key[0] if key else 0 for key in map(stat_key, font_paths)]
+    metrics.set_total(len(font_paths), sum(font_sizes))
+    results = []
+
+    def finish(index, success, error_msg, seconds):
+        metrics.record_font(font_paths[index], output_paths[index], success, seconds)
+        metrics.counters['succeeded_fonts' if success else 'failed_fonts'] += 1
+        metrics.advance(1, font_sizes[index])
+        results.append((success, error_msg, output_paths[index]))
+        if manifest and success and not unchanged[index]:
+            manifest.record(font_paths[index], output_paths[index], signature)
+
+    def skip(index):
+        log_func(f"\n正在处理字体文件: {os.path.basename(font_paths[index])}")
+        log_func(f"  -> 字体和字符集都没有变化，已跳过 (沿用 {os.path.basename(output_paths[index])})。")
+        metrics.counters['unchanged_fonts'] += 1
+        finish(index, True, None, 0.0)
+
+    def save_manifest():
+        try:
+            manifest.save()
+        except OSError as e:
+            log_func(f"  -> 警告: 保存瘦身清单失败: {e}")
+
+    if manifest:
+        # 需要重新瘦身的字体沿用上次的输出文件时，先删除旧文件，
+        # 避免旧版本生成的、与瘦身缓存条目是硬链接的输出文件在写入新结果时同时修改缓存
+        for index, output_path in enumerate(output_paths):
+            if not unchanged[index] and os.path.exists(output_path):
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+
+    if workers <= 1 or not FONTTOOLS_AVAILABLE:
+        with metrics.phase('subset'):
+            for index, (font_path, output_path) in enumerate(zip(font_paths, output_paths)):
+                if unchanged[index]:
+                    skip(index)
+                    continue
+                start = time.perf_counter()
+                success, error_msg = subset_font(font_path, characters, output_dir, log_func, output_path, cache,
+                                                 options, metrics)
+                finish(index, success, error_msg, time.perf_counter() - start)
+        if manifest:
+            save_manifest()
+        return results
+
+    log_func(f"使用 {workers} 个进程并行瘦身。")
+    unicodes = get_codepoints(characters)
+    with metrics.phase('subset'), ProcessPoolExecutor(max_workers=workers) as executor:
+        # jobs 中的每一项为 (字体路径, 输出路径, 缓存键, 任务)；
+        # 任务为 None 表示无需瘦身 (未变化或命中缓存)，为列表表示字体集合各字重的任务
+        jobs = []
+        for index, (font_path, output_path) in enumerate(zip(font_paths, output_paths)):
+            cache_key = None
+            if unchanged[index]:
+                jobs.append((font_path, output_path, None, None))
+                continue
+            if cache:
+                try:
+                    cache_key = cache.make_key(font_path, unicodes, options)
+                except OSError:
+                    cache_key = None
+                if cache_key and cache.fetch(cache_key, output_path, metrics):
+                    jobs.append((font_path, output_path, cache_key, None))
+                    continue
+
+            face_count = get_collection_size(font_path)
+            # WOFF/WOFF2 不支持字体集合，交给 subset_font 报告错误
+            if face_count > 1 and not flavor:
+                job = [executor.submit(subset_collection_face, font_path, i, unicodes, options)
+                       for i in range(face_count)]
+            else:
+                job = executor.submit(subset_font_task, font_path, characters, output_dir, output_path, options)
+            jobs.append((font_path, output_path, cache_key, job))
+
+        for index, (font_path, output_path, cache_key, job) in enumerate(jobs):
+            if unchanged[index]:
+                skip(index)
+                continue
+            if job is None:
+                log_func(f"\n正在处理字体文件: {os.path.basename(font_path)}")
+                log_func(f"  -> 输出至: {output_path}")
+                log_func("  -> 命中瘦身缓存，已复用上次的结果。")
+                log_subset_size(font_path, output_path, log_func)
+                finish(index, True, None, 0.0)
+                continue
+
+            if isinstance(job, list):
+                success, error_msg, seconds = assemble_collection(font_path, output_path, job, log_func)
+            else:
+                try:
+                    success, error_msg, logs, seconds = job.result()
+                except Exception as e:
+                    log_func(f"\n  -> 错误: 处理字体 '{font_path}' 时发生错误: {e}")
+                    finish(index, False, str(e), 0.0)
+                    continue
+                for message in logs:
+                    log_func(message)
+            if success and cache_key:
+                store_subset_cache(cache, cache_key, output_path, log_func)
+            finish(index, success, error_msg, seconds)
+    if manifest:
+        save_manifest()
+    return results
+
+# ==============================================================================
+# 按字符频率分片瘦身
+# ==============================================================================
+
+# 默认的分片大小：出现次数最多的 500 个字符、之后的 2000 个字符，其余字符为最后一片
+DEFAULT_SPLIT_TIERS = (500, 2000)
+# 分片瘦身时默认生成的样式表文件名 (位于字体保存目录)
+DEFAULT_CSS_NAME = "fonts.css"
+# 输出文件扩展名 -> CSS 中 src 的 format()
+CSS_FONT_FORMATS = {'.woff2': 'woff2', '.woff': 'woff', '.ttf': 'truetype', '.otf': 'opentype'}
+
+def split_by_frequency(characters, char_counts, tiers=DEFAULT_SPLIT_TIERS):
+    """
+    按出现次数从高到低把 characters 分成若干片，返回 CodepointSet 列表。
+    tiers 为前几片的字符数，其余字符都放在最后一片；char_counts (字符 -> 出现次数) 中没有的字符
+    (如手动添加的额外字符) 排在最后。空的分片会被省略。
+    """
+    characters = CodepointSet.from_chars(characters)
+    ranked = sorted(characters.codes, key=lambda code: (-char_counts.get(chr(code), 0), code))
+    slices = []
+    start = 0
+    for size in tiers:
+        slices.append(ranked[start:start + size])
+        start += size
+    slices.append(ranked[start:])
+    return [CodepointSet(codes) for codes in slices if codes]
+
+def format_unicode_range(characters):
+    """把字符集转换为 CSS unicode-range 的值，如 "U+20-7E, U+4E00"。"""
+    return ", ".join(f"U+{start:X}" if start == end else f"U+{start:X}-{end:X}"
+                     for start, end in characters.to_ranges())
+
+def get_font_family(font_path):
+    """读取字体的家族名，用作 CSS 的 font-family；无法读取时使用文件名。"""
+    family = None
+    try:
+        font = TTFont(font_path, lazy=True)
+        family = font['name'].getBestFamilyName()
+        font.close()
+    except Exception:
+        pass
+    return family or os.path.splitext(os.path.basename(font_path))[0]
+
+def write_unicode_range_css(css_path, faces):
+    """
+    生成按 unicode-range 分片加载的 @font-face 样式表。
+    faces 为 (字体家族名, 输出文件路径, 字符集) 列表，src 使用相对于样式表的路径。
+    """
+    css_dir = os.path.dirname(os.path.abspath(css_path))
+    with open(css_path, 'w', encoding='utf-8', newline='\n') as file:
+        for family, output_path, characters in faces:
+            url = os.path.relpath(os.path.abspath(output_path), css_dir).replace(os.sep, '/')
+            css_format = CSS_FONT_FORMATS.get(os.path.splitext(output_path)[1].lower())
+            src = f'url("{url}")' + (f' format("{css_format}")' if css_format else "")
+            file.write("@font-face {\n")
+            file.write(f'  font-family: "{family}";\n')
+            file.write(f"  src: {src};\n")
+            file.write("  font-display: swap;\n")
+            file.write(f"  unicode-range: {format_unicode_range(characters)};\n")
+            file.write("}\n\n")
+
+def split_subset_fonts(font_paths, characters, char_counts, output_dir, log_func, tiers=DEFAULT_SPLIT_TIERS,
+                       css_path=None, workers=1, cache=None, metrics=None, skip_unchanged=False, options=None):
+    """
+    按字符出现频率把字符集分片 (参见 split_by_frequency)，为每个字体的每一片生成单独的瘦身字体
+    (如 name_subset_part1.woff2)，并生成带 unicode-range 的 @font-face 样式表，
+    浏览器只会下载页面中实际用到的分片。css_path 为 None 时保存为字体保存目录中的 fonts.css。
+    返回与 font_paths 一一对应的 (是否成功, 错误信息, 各分片的输出路径列表) 列表，任一片失败即视为失败。
+    字体集合 (TTC/OTC) 无法在网页中使用，不会被分片。其余参数参见 subset_fonts。
+    """
+    slices = split_by_frequency(characters, char_counts, tiers)
+    log_func(f"字符集按出现频率分为 {len(slices)} 片，分别包含 "
+             + "、".join(str(len(slice_chars)) for slice_chars in slices) + " 个字符。")
+
+    results = [None] * len(font_paths)
+    split_indexes = []
+    for index, font_path in enumerate(font_paths):
+        if get_collection_size(font_path) > 0:
+            log_func(f"  -> 错误: 字体集合无法分片: {font_path}")
+            results[index] = (False, "字体集合无法分片", [])
+        else:
+            split_indexes.append(index)
+    split_paths = [font_paths[index] for index in split_indexes]
+    outputs = {index: [] for index in split_indexes}
+    errors = {}
+
+    for number, slice_chars in enumerate(slices, 1):
+        if not split_paths:
+            break
+        log_func(f"\n--- 第 {number}/{len(slices)} 片 ({len(slice_chars)} 个字符) ---")
+        tier_results = subset_fonts(split_paths, slice_chars, output_dir, log_func, workers, cache, metrics,
+                                    skip_unchanged, options, f"_part{number}")
+        for index, (success, error_msg, output_path) in zip(split_indexes, tier_results):
+            if success:
+                outputs[index].append((output_path, slice_chars))
+            else:
+                errors.setdefault(index, error_msg)
+
+    faces = []
+    for index in split_indexes:
+        family = get_font_family(font_paths[index])
+        faces.extend((family, output_path, slice_chars) for output_path, slice_chars in outputs[index])
+        results[index] = (index not in errors, errors.get(index),
+                          [output_path for output_path, slice_chars in outputs[index]])
+    if faces:
+        css_path = css_path or os.path.join(output_dir, DEFAULT_CSS_NAME)
+        write_unicode_range_css(css_path, faces)
+        log_func(f"\n样式表已保存到: {css_path}")
+    return results
+
+# ==============================================================================
+# 字体覆盖率
+# ==============================================================================
+
+# 覆盖范围索引的格式版本，修改 cmap 的解析方式时需要递增
+COVERAGE_INDEX_VERSION = 1
+# cmap 中表示 Unicode 的 (平台, 编码) 子表，各子表的码位取并集
+UNICODE_CMAP_ENCODINGS = {(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 6), (3, 1), (3, 10)}
+
+def get_default_coverage_cache_dir():
+    """返回覆盖范围索引的默认目录，与瘦身缓存放在同一个位置。"""
+    return os.path.join(os.path.dirname(get_default_subset_cache_dir()), 'wc_font_coverage')
+
+def _read_cmap_ranges(data, offset):
+    """解析 cmap 中的一个子表，返回映射到有效字形的码位闭区间列表；不支持的格式返回空列表。"""
+    fmt = struct.unpack_from('>H', data, offset)[0]
+    ranges = []
+    if fmt == 0:
+        glyphs = data[offset + 6:offset + 6 + 256]
+        ranges = [(code, code) for code, glyph in enumerate(glyphs) if glyph]
+    elif fmt == 4:
+        seg_count = struct.unpack_from('>H', data, offset + 6)[0] // 2
+        ends_at = offset + 14
+        starts_at = ends_at + seg_count * 2 + 2
+        deltas_at = starts_at + seg_count * 2
+        range_offsets_at = deltas_at + seg_count * 2
+        ends = struct.unpack_from(f'>{seg_count}H', data, ends_at)
+        starts = struct.unpack_from(f'>{seg_count}H', data, starts_at)
+        deltas = struct.unpack_from(f'>{seg_count}H', data, deltas_at)
+        range_offsets = struct.unpack_from(f'>{seg_count}H', data, range_offsets_at)
+        for index, (start, end, delta, range_offset) in enumerate(zip(starts, ends, deltas, range_offsets)):
+            if start > end or start == 0xFFFF:
+                continue
+            if range_offset == 0:
+                # 字形编号为 (码位 + delta) mod 65536，只有一个码位可能映射到 0 号字形 (.notdef)
+                notdef = -delta & 0xFFFF
+                if start <= notdef <= end:
+                    ranges.extend(item for item in ((start, notdef - 1), (notdef + 1, end)) if item[0] <= item[1])
+                else:
+                    ranges.append((start, end))
+                continue
+            glyphs_at = range_offsets_at + index * 2 + range_offset
+            count = min(end - start + 1, max(0, (len(data) - glyphs_at) // 2))
+            glyphs = struct.unpack_from(f'>{count}H', data, glyphs_at) if count else ()
+            ranges.extend((start + i, start + i) for i, glyph in enumerate(glyphs)
+                          if glyph and (glyph + delta) & 0xFFFF)
+    elif fmt == 6:
+        first_code, count = struct.unpack_from('>HH', data, offset + 6)
+        glyphs = struct.unpack_from(f'>{count}H', data, offset + 10)
+        ranges = [(first_code + i, first_code + i) for i, glyph in enumerate(glyphs) if glyph]
+    elif fmt in (12, 13):
+        group_count = struct.unpack_from('>L', data, offset + 12)[0]
+        for start, end, glyph in struct.iter_unpack('>LLL', data[offset + 16:offset + 16 + group_count * 12]):
+            # 格式 12 中字形编号从 glyph 开始递增，格式 13 中整组映射到同一个字形
+            if glyph == 0:
+                start += 1 if fmt == 12 else end - start + 1
+            end = min(end, 0x10FFFF)
+            if start <= end:
+                ranges.append((start, end))
+    return ranges
+
+def read_font_cmaps(font_path):
+    """
+    读取字体中每个字体 (TTC/OTC 中的每个 face) 的 cmap，返回 CodepointSet 列表。
+    只读取文件头、表目录和 cmap 表，不解析字形，大型中文字体也能很快完成。
+    """
+    with open(font_path, 'rb') as file:
+        header = file.read(12)
+        if header[:4] == b'ttcf':
+            face_count = int.from_bytes(header[8:12], 'big')
+            face_offsets = struct.unpack(f'>{face_count}L', file.read(4 * face_count))
+        elif header[:4] in (b'\x00\x01\x00\x00', b'OTTO', b'true'):
+            face_offsets = (0,)
+        else:
+            raise ValueError("不支持的字体格式 (只支持 TTF/OTF/TTC/OTC)")
+
+        faces = []
+        # 集合中的多个 face 通常共用同一个 cmap 表
+        parsed = {}
+        for face_offset in face_offsets:
+            file.seek(face_offset + 4)
+            table_count = struct.unpack('>H', file.read(2))[0]
+            file.seek(face_offset + 12)
+            directory = file.read(16 * table_count)
+            cmap_location = None
+            for tag, checksum, offset, length in struct.iter_unpack('>4sLLL', directory):
+                if tag == b'cmap':
+                    cmap_location = (offset, length)
+                    break
+            if cmap_location is None:
+                faces.append(CodepointSet())
+                continue
+            if cmap_location not in parsed:
+                file.seek(cmap_location[0])
+                data = file.read(cmap_location[1])
+                subtable_count = struct.unpack_from('>H', data, 2)[0]
+                ranges = []
+                seen_offsets = set()
+                for platform_id, encoding_id, offset in struct.iter_unpack('>HHL', data[4:4 + 8 * subtable_count]):
+                    if (platform_id, encoding_id) in UNICODE_CMAP_ENCODINGS and offset not in seen_offsets:
+                        seen_offsets.add(offset)
+                        ranges.extend(_read_cmap_ranges(data, offset))
+                parsed[cmap_location] = CodepointSet.from_ranges(ranges)
+            faces.append(parsed[cmap_location])
+    return faces
+
+class FontCoverageIndex:
+    """
+    字体覆盖范围 (cmap 中的码位) 的索引。
+    以字体文件的哈希为键，把每个 face 的码位范围保存在本地目录中，同一个字体只需要解析一次 cmap。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_default_coverage_cache_dir()
+        self._font_hashes = {}
+        # 文件哈希 -> CodepointSet 列表，同一次运行中不再重复读取缓存文件
+        self._faces = {}
+
+    def _entry_path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json")
+
+    def faces(self, font_path):
+        """返回字体中每个 face 的覆盖范围 (CodepointSet 列表)。"""
+        digest = hash_file(font_path, self._font_hashes)
+        faces = self._faces.get(digest)
+        if faces is not None:
+            return faces
+        entry_path = self._entry_path(digest)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == COVERAGE_INDEX_VERSION:
+                faces = [CodepointSet.from_ranges(ranges) for ranges in data['faces']]
+        except (OSError, ValueError, KeyError, TypeError):
+            faces = None
+        if faces is None:
+            faces = read_font_cmaps(font_path)
+            try:
+                os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+                temp_path = f"{entry_path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    json.dump({'version': COVERAGE_INDEX_VERSION,
+                               'faces': [face.to_ranges() for face in faces]}, file, separators=(',', ':'))
+                os.replace(temp_path, entry_path)
+            except OSError:
+                pass
+        self._faces[digest] = faces
+        return faces
+
+def check_font_coverage(font_paths, characters, log_func, index=None):
+    """
+    检查每个字体 (及 TTC/OTC 中的每个 face) 能显示 characters 中的哪些字符，并输出覆盖率和缺少的字符。
+    控制字符和换行符 (如 \\n、U+2028) 不需要字形，不参与检查。
+    第一个字体作为主字体，再依次挑选能补充最多剩余字符的 face 作为备用字体。
+    返回 (覆盖情况列表, 备用字体列表, 所有字体都缺少的字符)：覆盖情况为 (名称, 字体路径, face 编号, 覆盖率 (%), 缺少的字符)，
+    备用字体为 (名称, 补充的字符)；无法读取的字体不出现在覆盖情况中。
+    """
+    characters = CodepointSet(code for code in CodepointSet.from_chars(characters).codes
+                              if unicodedata.category(chr(code)) not in ('Cc', 'Zl', 'Zp'))
+    if index is None:
+        index = FontCoverageIndex()
+    entries = []
+    for font_path in font_paths:
+        try:
+            faces = index.faces(font_path)
+        except (OSError, ValueError, struct.error) as e:
+            log_func(f"  -> 错误: 无法读取字体 '{font_path}' 的字符映射表: {e}")
+            continue
+        name = os.path.basename(font_path)
+        for face_index, face in enumerate(faces):
+            label = f"{name} #{face_index}" if len(faces) > 1 else name
+            missing = characters - face
+            coverage = (len(characters) - len(missing)) / len(characters) * 100 if characters else 100.0
+            entries.append((label, font_path, face_index, coverage, missing, face))
+            if missing:
+                log_func(f"  {label}: 覆盖率 {coverage:.1f}%，缺少 {len(missing)} 个字符: "
+                         f"{format_chars_preview(missing)}")
+            else:
+                log_func(f"  {label}: 覆盖率 100%")
+
+    fallbacks = []
+    leftovers = entries[0][4] if entries else characters
+    candidates = entries[1:]
+    while leftovers and candidates:
+        best = max(candidates, key=lambda entry: len(leftovers & entry[5]))
+        covered = leftovers & best[5]
+        if not covered:
+            break
+        fallbacks.append((best[0], covered))
+        log_func(f"  备用字体: {best[0]}，可补充 {len(covered)} 个字符")
+        leftovers -= covered
+        candidates = [entry for entry in candidates if entry is not best]
+    if leftovers:
+        log_func(f"  所有字体都缺少 {len(leftovers)} 个字符: {format_chars_preview(leftovers)}")
+    return [entry[:5] for entry in entries], fallbacks, leftovers
+
+# ==============================================================================
+# 监视模式
+# ==============================================================================
+
+# 监视模式下检查文件变化的间隔 (秒)
+DEFAULT_WATCH_INTERVAL = 2.0
+# 检测到变化后，等待该时间 (秒) 内没有新的变化再更新，连续保存多个文件时只更新一次
+DEFAULT_WATCH_DEBOUNCE = 1.0
+
+class WatchSession:
+    """
+    监视模式的扫描状态：每个匹配文件的 stat_key 和统计数据，以及所有文件的合计 (stats)。
+    update 只重新读取新增或修改过的文件，并从合计中减去修改前的内容和已删除文件的计数，
+    不需要重新扫描整个目录。合计中新出现的字符排在最后，因此文本报告中字符的顺序可能与完整扫描时不同。
+    ignore_paths 中的文件 (如报告本身) 不会被统计，避免写入报告后又触发更新。
+    """
+
+    def __init__(self, target_path, rules=None, workers=1, ignore_paths=()):
+        self.target_path = target_path
+        self.rules = rules or DEFAULT_RULES
+        self.workers = workers
+        self.ignore_paths = {os.path.normcase(os.path.abspath(path)) for path in ignore_paths if path}
+        self.stats = CharStats()
+        # 文件路径 -> stat_key；二进制或读取失败的文件也会记录，没有变化时不再重复读取
+        self.keys = {}
+        # 文件路径 -> 该文件的 CharStats
+        self.file_stats = {}
+
+    def snapshot(self):
+        """遍历目标路径，返回 {文件路径: (stat_key, 编码)}，只包含需要统计的文件。"""
+        if os.path.isfile(self.target_path):
+            filename = os.path.basename(self.target_path)
+            key = stat_key(self.target_path)
+            if not key or not self.rules.match_file(filename, filename):
+                return {}
+            entries = [(self.target_path, True, key, self.rules.get_encoding(filename, filename))]
+        else:
+            entries = iter_scan_entries(self.target_path, self.rules)
+        return {file_path: (key, encoding) for file_path, matched, key, encoding in entries
+                if matched and key and os.path.normcase(os.path.abspath(file_path)) not in self.ignore_paths}
+
+    def has_changes(self, snapshot):
+        """与上次更新时相比，快照中是否有新增、修改或删除的文件。"""
+        return (len(snapshot) != len(self.keys)
+                or any(self.keys.get(file_path) != key for file_path, (key, encoding) in snapshot.items()))
+
+    def read_files(self, files):
+        """读取并统计一批文件，返回值与 analyze_files 相同；workers 大于 1 且文件较多时使用多进程。"""
+        if self.workers <= 1 or len(files) <= SCAN_BATCH_SIZE:
+            return analyze_files(files, self.rules)
+        batches = [files[start:start + SCAN_BATCH_SIZE] for start in range(0, len(files), SCAN_BATCH_SIZE)]
+        results, errors, timings = {}, {}, Counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for batch in executor.map(analyze_files, batches, [self.rules] * len(batches)):
+                results.update(batch[0])
+                errors.update(batch[1])
+                timings.update(batch[2])
+        return results, errors, timings
+
+    def update(self, snapshot, log_func):
+        """按快照更新统计数据，返回 (重新读取的文件数, 移除的文件数)。"""
+        removed = [file_path for file_path in self.keys if file_path not in snapshot]
+        for file_path in removed:
+            log_func(f"  已删除: {file_path}")
+            del self.keys[file_path]
+            old_stats = self.file_stats.pop(file_path, None)
+            if old_stats is not None:
+                self.stats.remove_file(file_path, old_stats)
+
+        changed = [(file_path, encoding) for file_path, (key, encoding) in snapshot.items()
+                   if self.keys.get(file_path) != key]
+        results, errors, timings = self.read_files(changed)
+        for file_path, encoding in changed:
+            log_func(f"  正在处理: {file_path}")
+            self.keys[file_path] = snapshot[file_path][0]
+            old_stats = self.file_stats.pop(file_path, None)
+            if old_stats is not None:
+                self.stats.subtract(old_stats)
+            if file_path in results:
+                # 修改过的文件在逐文件汇总中保持原来的位置
+                self.file_stats[file_path] = results[file_path]
+                self.stats.add_file(file_path, results[file_path])
+                continue
+            self.stats.file_summaries.pop(file_path, None)
+            if isinstance(errors.get(file_path), BinaryFileError):
+                log_func(f"    -> 已跳过 (二进制文件): {file_path}")
+            else:
+                log_func(f"    -> 警告: 读取文件 '{file_path}' 时发生未知错误: {errors[file_path]}，已跳过。")
+        return len(changed), len(removed)
+
+def start_change_observer(target_path, wake_event):
+    """
+    使用 watchdog 监视目标路径，有文件变化时设置 wake_event。
+    未安装 watchdog 或无法监视 (如部分网络共享盘) 时返回 None，此时只能定时检查。
+    """
+    if not WATCHDOG_AVAILABLE:
+        return None
+
+    class WakeHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake_event.set()
+
+    is_dir = os.path.isdir(target_path)
+    watch_dir = target_path if is_dir else os.path.dirname(os.path.abspath(target_path))
+    observer = Observer()
+    try:
+        observer.schedule(WakeHandler(), watch_dir, recursive=is_dir)
+        observer.start()
+    except Exception:
+        return None
+    return observer
+
+def watch_path(target_path, output_file_path, log_func, rules=None, workers=1, on_change=None, stop_event=None,
+               interval=DEFAULT_WATCH_INTERVAL, debounce=DEFAULT_WATCH_DEBOUNCE, charset_path=None,
+               append_only=False, report_format=None, top_n=DEFAULT_TOP_N):
+    """
+    监视模式：先完整分析一次，之后持续监视目标路径，有文件新增、修改或删除时只重新读取这些文件并更新报告。
+    安装了 watchdog 时由文件系统通知触发检查，否则每 interval 秒遍历一次目录，比较文件大小和修改时间。
+    检测到变化后等待 debounce 秒内没有新的变化再更新。
+    保留的字符集与上次不同时调用 on_change(字符集, CharStats)，如重新瘦身字体；字符集没有变化时不会调用。
+    设置 stop_event (threading.Event) 后返回。charset_path、append_only、report_format 和 top_n
+    参见 analyze_path_stats。
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+    if stop_event is None:
+        stop_event = threading.Event()
+    session = WatchSession(target_path, rules, workers,
+                           (output_file_path, get_files_csv_path(output_file_path), charset_path))
+    last_characters = None
+
+    def publish():
+        nonlocal last_characters
+        if not session.stats:
+            log_func("未找到任何可供分析的内容，等待文件变化。")
+            return
+        generate_report(session.stats, output_file_path, log_func, None, report_format, top_n)
+        characters = session.stats.codepoints()
+        if charset_path:
+            characters = track_charset(charset_path, characters, log_func, append_only=append_only)
+        if characters == last_characters:
+            log_func("保留的字符集没有变化。")
+            return
+        last_characters = characters
+        log_func(f"保留的字符集共 {len(characters)} 个字符。")
+        if on_change:
+            on_change(characters, session.stats)
+
+    log_func(f"开始监视: {target_path}")
+    rules.log_rules(log_func)
+    log_func("")
+    start = time.perf_counter()
+    session.update(session.snapshot(), log_func)
+    log_func(f"\n初次分析完成，共 {len(session.keys)} 个文件，耗时 {time.perf_counter() - start:.2f} 秒。")
+    publish()
+
+    wake_event = threading.Event()
+    observer = start_change_observer(target_path, wake_event)
+    if observer:
+        log_func("\n使用文件系统通知监视文件变化。")
+    else:
+        log_func(f"\n每 {interval:g} 秒检查一次文件变化。")
+    try:
+        while not stop_event.is_set():
+            wake_event.wait(interval)
+            wake_event.clear()
+            if stop_event.is_set():
+                break
+            snapshot = session.snapshot()
+            if not session.has_changes(snapshot):
+                continue
+            # 等待连续的修改结束：debounce 秒后快照不再变化才开始更新
+            while not stop_event.wait(debounce):
+                wake_event.clear()
+                latest = session.snapshot()
+                if latest == snapshot:
+                    break
+                snapshot = latest
+            if stop_event.is_set():
+                break
+            log_func(f"\n检测到文件变化 ({time.strftime('%H:%M:%S')})")
+            start = time.perf_counter()
+            read_count, removed_count = session.update(snapshot, log_func)
+            log_func(f"重新读取 {read_count} 个文件，移除 {removed_count} 个文件，"
+                     f"耗时 {time.perf_counter() - start:.2f} 秒。")
+            publish()
+    finally:
+        if observer:
+            observer.stop()
+            observer.join()
+    log_func("已停止监视。")
+
+# ==============================================================================
+# 常驻瘦身服务
+# ==============================================================================
+
+# 常驻瘦身服务默认监听的端口，以及字体数据和瘦身结果共用的内存上限
+DEFAULT_SERVER_PORT = 8765
+DEFAULT_SERVER_MEMORY = 512 * 1024 * 1024
+# 请求内容的大小上限 (字符集以 JSON 发送，全部 Unicode 字符也不会超过该值)
+MAX_SERVER_REQUEST_SIZE = 16 * 1024 * 1024
+
+def get_font_content_type(data, flavor=None):
+    """返回瘦身结果的 Content-Type。"""
+    if flavor:
+        return f"font/{flavor}"
+    if data[:4] == b'ttcf':
+        return "font/collection"
+    return "font/otf" if data[:4] == b'OTTO' else "font/ttf"
+
+class SubsetService:
+    """
+    常驻内存的瘦身服务，由 make_subset_server 提供 HTTP 接口。
+    字体文件只从磁盘读取一次并保存在内存中 (文件变化时重新读取)，每次请求从内存中的数据按需解析，
+    只解析瘦身需要的表；相同的字体、字符集和选项直接返回内存中缓存的结果。
+    子集化会修改字体对象，因此不缓存解析后的字体：复制完整解析的字体比从内存重新按需解析更慢。
+    字体数据和瘦身结果共用 max_memory 字节的上限，超出时先淘汰最久未使用的结果，再淘汰其他字体的数据。
+    只能请求启动时指定的字体，以文件名区分。
+    """
+
+    def __init__(self, font_paths, max_memory=DEFAULT_SERVER_MEMORY):
+        self.fonts = {}
+        for font_path in font_paths:
+            name = os.path.basename(font_path)
+            if name in self.fonts:
+                raise ValueError(f"字体文件名重复: {name}")
+            self.fonts[name] = font_path
+        self.max_memory = max_memory
+        self.memory = 0
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        # 字体名 -> (stat_key, 文件哈希, 字体数据)，按最近使用的顺序排列
+        self._sources = OrderedDict()
+        # 缓存键 -> 瘦身结果，按最近使用的顺序排列
+        self._results = OrderedDict()
+
+    def preload(self, log_func):
+        """预先读取所有字体，无法读取的字体只输出警告，请求时再重试。"""
+        for name, font_path in self.fonts.items():
+            try:
+                key, digest, data = self._source(name)
+            except OSError as e:
+                log_func(f"  -> 警告: 无法读取字体 '{font_path}': {e}")
+                continue
+            log_func(f"  已载入: {name} ({len(data) / (1024 * 1024):.2f} MB)")
+
+    def _source(self, name):
+        font_path = self.fonts[name]
+        key = stat_key(font_path)
+        if key is None:
+            raise OSError(f"字体文件不存在: {font_path}")
+        with self.lock:
+            entry = self._sources.get(name)
+            if entry and entry[0] == key:
+                self._sources.move_to_end(name)
+                return entry
+        with open(font_path, 'rb') as file:
+            data = file.read()
+        entry = (key, hashlib.sha256(data).hexdigest(), data)
+        with self.lock:
+            old_entry = self._sources.pop(name, None)
+            if old_entry:
+                self.memory -= len(old_entry[2])
+            self._sources[name] = entry
+            self.memory += len(data)
+            self.counters['font_loads'] += 1
+            self._evict()
+        return entry
+
+    def _evict(self):
+        """淘汰最久未使用的结果和字体数据，直到不超过内存上限 (调用时需持有 lock)。"""
+        while self.memory > self.max_memory and self._results:
+            cache_key, result = self._results.popitem(last=False)
+            self.memory -= len(result)
+            self.counters['evictions'] += 1
+        # 最近使用的字体即使超过上限也保留，避免每次请求都重新读取
+        while self.memory > self.max_memory and len(self._sources) > 1:
+            name, (key, digest, data) = self._sources.popitem(last=False)
+            self.memory -= len(data)
+            self.counters['evictions'] += 1
+
+    def subset(self, name, characters, options=None):
+        """瘦身指定的字体，返回 (瘦身后的字节串, 是否命中缓存)。未知的字体名抛出 KeyError。"""
+        if options is None:
+            options = get_subset_options()
+        key, digest, data = self._source(name)
+        unicodes = get_codepoints(characters)
+        chars_hash = hashlib.sha256(array('I', unicodes).tobytes()).hexdigest()
+        cache_key = f"{digest}|{chars_hash}|{get_options_fingerprint(options)}"
+        with self.lock:
+            self.counters['requests'] += 1
+            result = self._results.get(cache_key)
+            if result is not None:
+                self._results.move_to_end(cache_key)
+                self.counters['hits'] += 1
+                return result, True
+        result = subset_font_data(data, unicodes, options)
+        with self.lock:
+            if cache_key not in self._results:
+                self._results[cache_key] = result
+                self.memory += len(result)
+                self._evict()
+        return result, False
+
+    def status(self):
+        """返回服务状态：字体列表、内存占用和请求计数。"""
+        with self.lock:
+            loaded = set(self._sources)
+            return {
+                'fonts': [{'name': name, 'path': font_path, 'loaded': name in loaded}
+                          for name, font_path in self.fonts.items()],
+                'memory': self.memory,
+                'max_memory': self.max_memory,
+                'cached_results': len(self._results),
+                'counters': dict(self.counters),
+            }
+
+def parse_subset_request(request):
+    """检查 POST /subset 的请求内容 (已解析的 JSON)，返回 (字体文件名, 字符, 子集化选项)，格式错误时抛出 ValueError。"""
+    if not isinstance(request, dict):
+        raise ValueError("请求内容必须是 JSON 对象")
+    for key in ('font', 'chars'):
+        if not isinstance(request.get(key), str):
+            raise ValueError(f"请求中缺少 {key} 或它不是字符串")
+    for key in ('profile', 'flavor'):
+        if request.get(key) is not None and not isinstance(request[key], str):
+            raise ValueError(f"{key} 必须是字符串")
+    layout_features = request.get('layout_features')
+    if layout_features is not None and not (isinstance(layout_features, list)
+                                            and all(isinstance(name, str) for name in layout_features)):
+        raise ValueError("layout_features 必须是字符串列表")
+    options = get_subset_options(request.get('profile') or 'keep', request.get('flavor'), layout_features)
+    return request['font'], request['chars'], options
+
+def make_subset_server(service, host='127.0.0.1', port=DEFAULT_SERVER_PORT, log_func=None):
+    """
+    创建常驻瘦身服务的 HTTP 服务器 (调用 serve_forever 开始处理请求)，接口：
+    GET /status 返回服务状态 (JSON)；
+    POST /subset 的内容为 JSON {"font": 字体文件名, "chars": 字符, "profile": "keep"/"web",
+    "flavor": 网页字体格式, "layout_features": [特性]}，成功时返回瘦身后的字体，
+    响应头 X-Subset-Cache 为 hit 或 miss；失败时返回 JSON {"error": 错误信息}，
+    请求格式错误时状态码为 400，字体或路径不存在时为 404。
+    默认只监听本机地址。
+    """
+
+    class SubsetRequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            if log_func:
+                log_func(f"  {self.address_string()} {format % args}")
+
+        def send_body(self, status, body, content_type, headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_body(status, body, 'application/json; charset=utf-8')
+
+        def do_GET(self):
+            if self.path != '/status':
+                self.send_json(404, {'error': f"未知的路径: {self.path}"})
+                return
+            self.send_json(200, service.status())
+
+        def do_POST(self):
+            if self.path != '/subset':
+                self.send_json(404, {'error': f"未知的路径: {self.path}"})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                if not 0 < length <= MAX_SERVER_REQUEST_SIZE:
+                    raise ValueError("请求内容为空或过大")
+                name, characters, options = parse_subset_request(
+                    json.loads(self.rfile.read(length).decode('utf-8')))
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            if name not in service.fonts:
+                self.send_json(404, {'error': f"未知的字体: {name}"})
+                return
+            start = time.perf_counter()
+            try:
+                result, hit = service.subset(name, characters, options)
+            except Exception as e:
+                self.send_json(500, {'error': str(e)})
+                return
+            headers = [('X-Subset-Cache', 'hit' if hit else 'miss'),
+                       ('X-Subset-Time', f"{time.perf_counter() - start:.3f}")]
+            self.send_body(200, result, get_font_content_type(result, options.flavor), headers)
+
+    return ThreadingHTTPServer((host, port), SubsetRequestHandler)
+
+def fetch_subset(server_url, font_name, characters, profile='keep', flavor=None, layout_features=None,
+                 timeout=300):
+    """
+    向常驻瘦身服务请求瘦身结果，返回 (字体字节串, 是否命中服务端缓存)。
+    服务返回错误或无法连接时抛出 RuntimeError。
+    """
+    request_data = {'font': font_name, 'chars': CodepointSet.from_chars(characters).chars(), 'profile': profile}
+    if flavor:
+        request_data['flavor'] = flavor
+    if layout_features is not None:
+        request_data['layout_features'] = list(layout_features)
+    request = urllib.request.Request(server_url.rstrip('/') + '/subset',
+                                     data=json.dumps(request_data).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    # 服务在本机运行，不经过系统设置的代理
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            return response.read(), response.headers.get('X-Subset-Cache') == 'hit'
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read().decode('utf-8')).get('error')
+        except ValueError:
+            message = None
+        raise RuntimeError(message or str(e))
+    except OSError as e:
+        raise RuntimeError(f"无法连接瘦身服务 {server_url}: {e}")
+
+# ==============================================================================
+# 新增的辅助函数
+# ==============================================================================
+def get_default_output_path():
+    """
+    智能获取默认输出路径。
+    优先使用H盘根目录，如果H盘不存在，则使用程序所在目录。
+    """
+    primary_drive = "H:\\"
+    if os.path.exists(primary_drive):
+        return os.path.join(primary_drive, "统计信息.txt")
+    else:
+        # sys.argv[0] 是启动程序的路径 (无论是 .py 还是 .exe)
+        # os.path.abspath 确保我们得到一个绝对路径
+        # os.path.dirname 获取该路径所在的目录
+        exe_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+        return os.path.join(exe_dir, "统计信息.txt")